@@ -7,6 +7,8 @@ import webbrowser
 
 from cli.echo import Echo
 from cli.info import CustomDialog
+from clipboard.file_spool import FileSpool
+from clipboard.file_stream import FileOffer
 from core.config import Config
 from core.constants import *
 from itertools import count
@@ -337,12 +339,10 @@ class TaskbarPanel:
             CustomDialog(
                 f"Saving files to: {target_directory}", msg_type="info"
             ).mainloop()
+            if isinstance(files, FileOffer):
+                files = files.fetch()  # Announced only: pull the bytes from the sender now
             # Save each file to the chosen directory
-            for filename, file_obj in files.items():
-                file_path = os.path.join(target_directory, filename)
-                with open(file_path, "wb") as f:
-                    f.write(file_obj.getvalue())
-                logging.debug(f"Saved: {file_path}")
+            FileSpool.save_files(files, target_directory)
             CustomDialog("Done.", msg_type="success").mainloop()
 
         except Exception as e:
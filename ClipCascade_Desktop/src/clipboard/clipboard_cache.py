@@ -0,0 +1,97 @@
+import xxhash
+
+from collections import OrderedDict
+from threading import Lock
+from core.constants import *
+
+
+class CachedClipboard:
+    def __init__(self, payload: str, payload_type: str):
+        self.payload = payload
+        self.payload_type = payload_type
+        self.size = len(payload)
+        self.peers: set[str] = set()  # Peers known to hold this item
+
+
+class ClipboardCache:
+    """
+    Bounded LRU cache of recent clipboard payloads keyed by their xxh3-128 digest. It records
+    which peers already hold each item, so re-copying a recent item can be sent as a small
+    reference instead of the full payload.
+    """
+
+    def __init__(
+        self, max_items: int = CLIPBOARD_CACHE_ITEMS, max_bytes: int = CLIPBOARD_CACHE_BYTES
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, CachedClipboard] = OrderedDict()
+        self._size = 0
+        self._lock = Lock()  # Used from the clipboard monitor and network threads
+
+    @staticmethod
+    def digest(payload: str) -> str:
+        return xxhash.xxh3_128_hexdigest(payload)
+
+    def get(self, digest: str) -> CachedClipboard:
+        with self._lock:
+            item = self._items.get(digest)
+            if item is not None:
+                self._items.move_to_end(digest)
+            return item
+
+    def put(self, payload: str, payload_type: str, peers=(), digest: str = None) -> str:
+        """
+        Adds (or refreshes) an item and marks `peers` as holding it.
+
+        Returns:
+            str: The digest of the payload.
+        """
+        if digest is None:
+            digest = ClipboardCache.digest(payload)
+        with self._lock:
+            item = self._items.get(digest)
+            if item is None:
+                if len(payload) > self.max_bytes:
+                    return digest  # Too large to keep
+                item = CachedClipboard(payload, payload_type)
+                self._items[digest] = item
+                self._size += item.size
+            self._items.move_to_end(digest)
+            item.peers.update(peers)
+            while len(self._items) > self.max_items or self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= evicted.size
+        return digest
+
+    def holders(self, digest: str) -> set[str]:
+        with self._lock:
+            item = self._items.get(digest)
+            return set(item.peers) if item is not None else set()
+
+    def latest(
+        self, payload_type: str, peer_id: str = None, exclude: str = None
+    ) -> tuple[str, CachedClipboard]:
+        """
+        Returns (digest, item) of the most recently used item of `payload_type`, optionally
+        only among items `peer_id` holds, or (None, None).
+        """
+        with self._lock:
+            for digest in reversed(self._items):
+                item = self._items[digest]
+                if digest == exclude or item.payload_type != payload_type:
+                    continue
+                if peer_id is None or peer_id in item.peers:
+                    return digest, item
+        return None, None
+
+    def forget_peer(self, peer_id: str):
+        """Drops `peer_id` from every item (e.g. the peer reconnected and may have restarted)."""
+        with self._lock:
+            for item in self._items.values():
+                item.peers.discard(peer_id)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
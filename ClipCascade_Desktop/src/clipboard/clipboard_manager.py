@@ -3,12 +3,21 @@ import io
 import json
 import logging
 import os
+import threading
 import xxhash
 
 
+from stat import S_ISREG
 from PIL import Image
 from core.constants import *
 from core.config import Config
+from clipboard.file_ingest import FileIngest
+from clipboard.file_spool import FileSpool
+from clipboard.file_stream import FileOffer, FileStream, FileStreamReceiver
+from clipboard.clipboard_cache import ClipboardCache
+from clipboard.image_transcoder import ImageTranscoder
+from clipboard.update_debouncer import UpdateDebouncer
+from utils.worker_pool import StaleJobError, WorkerPool
 
 if PLATFORM.startswith(LINUX) and LINUX_USE_CLI_UI:
     from cli.tray import TaskbarPanel
@@ -34,8 +43,15 @@ class ClipboardManager:
     def __init__(self, config: Config):
         self.config = config
         self.previous_clipboard_hash = 0
+        self.clipboard_cache = ClipboardCache()  # Recent payloads, shared by send and receive
+        self.worker_pool = WorkerPool()  # CPU-heavy conversion and sending
         self.sys_tray: TaskbarPanel = None
         self.is_files_download_enabled = False
+        self.stream_callback = None  # Receives a FileStream for copied files, if set
+        self.debouncer: UpdateDebouncer = None  # Between the clipboard monitor and conversion
+        self.received_files_directory: str = None  # Spool directory of the last received files
+        self._files_download_timer: threading.Timer = None  # Expires the download option
+        FileSpool.remove_expired()
 
         if PLATFORM.startswith(LINUX) and XMODE:
             self.is_x_clipboard_owner = clipboard_monitor.is_x_clipboard_owner()
@@ -50,15 +66,33 @@ class ClipboardManager:
         """
         Resets the files download flag and disables the download functionality in the system tray if enabled.
         """
+        if self._files_download_timer is not None:
+            self._files_download_timer.cancel()
+            self._files_download_timer = None
         if self.is_files_download_enabled:
             self.is_files_download_enabled = False
             if self.sys_tray:
                 self.sys_tray.disable_files_download()
+        if self.received_files_directory is not None:
+            FileStreamReceiver.remove_directory(self.received_files_directory)
+            self.received_files_directory = None
 
     @staticmethod
     def hash_clipboard(clipboard: str) -> int:
         return xxhash.xxh64(clipboard).intdigest()
 
+    def get_size_limit(self) -> int:
+        """The smallest of the server and local size limits in bytes, or None if unlimited."""
+        limits = [
+            limit
+            for limit in (
+                self.config.data["maxsize"],
+                self.config.data["max_clipboard_size_local_limit_bytes"],
+            )
+            if limit is not None and limit >= 0
+        ]
+        return min(limits) if limits else None
+
     def is_clipboard_size_within_limit(
         self, clipboard_content: any, type_: str = "text"
     ) -> bool:
@@ -121,17 +155,33 @@ class ClipboardManager:
             return True
         return False
 
-    def on_copy(self, copy_callback):
+    def on_copy(self, copy_callback, stream_callback=None):
+        """
+        Starts clipboard monitoring.
+
+        Parameters:
+        - copy_callback: Called with (payload, type) for every clipboard change.
+        - stream_callback: Optional; called with a FileStream instead of `copy_callback` for files,
+          so they can be sent chunk by chunk.
+        """
+        self.stream_callback = stream_callback
+        # The config is loaded after construction
+        self.worker_pool.processes = self.config.data["worker_processes"]
+        if self.debouncer is not None:
+            self.debouncer.cancel()
+        self.debouncer = UpdateDebouncer(
+            lambda type_, content: self.clipboard_to_base64(copy_callback, content, type_),
+            window=self.config.data["clipboard_debounce_ms"] / 1000,
+        )
         clipboard_monitor.on_update(
-            callback=lambda type_, content: self.clipboard_to_base64(
-                copy_callback, content, type_
-            ),
+            callback=self.debouncer.update,
             enable_image_monitoring=self.config.data["enable_image_sharing"],
             enable_file_monitoring=self.config.data["enable_file_sharing"],
         )
 
     def clipboard_to_base64(self, callback, content: any, type_: str = "text"):
         try:
+            self.worker_pool.cancel_stale()  # A newer clipboard replaces any queued work
             self.reset_files_download()
 
             type_ = type_.lower()
@@ -140,16 +190,8 @@ class ClipboardManager:
                     callback(content, type_)
 
             elif type_ == "image":
-                if isinstance(content, list):
-                    if content is None or len(content) == 0:
-                        raise ValueError(
-                            "Clipboard image content cannot be None or empty"
-                        )
-
-                    content = Image.open(content[0])
-                if self.is_clipboard_size_within_limit(content, type_):
-                    content_str = ClipboardManager.convert_image_to_base64(img=content)
-                    callback(content_str, type_)
+                # Encoding can take seconds for large screenshots; keep the monitor responsive
+                self._convert_in_background(callback, type_, self._image_to_base64, content)
 
             elif type_ == "files":
                 if PLATFORM.startswith(LINUX):
@@ -162,15 +204,62 @@ class ClipboardManager:
                                 temp.append(path)
                         content = temp
 
-                if self.is_clipboard_size_within_limit(content, type_):
-                    content_str = ClipboardManager.convert_files_to_base64(
-                        file_paths=content
+                if self.stream_callback is not None:
+                    # Walks copied directories once; the size check reuses the listing
+                    file_stream = FileStream(content)
+                    if not file_stream.is_empty() and self.is_clipboard_size_within_limit(
+                        file_stream, type_
+                    ):
+                        self.stream_callback(file_stream)
+                elif self.is_clipboard_size_within_limit(content, type_):
+                    self._convert_in_background(
+                        callback, type_, ClipboardManager.convert_files_to_base64, content
                     )
-                    if content_str != "{}":  # Check if the JSON string is empty
-                        callback(content_str, type_)
         except Exception as e:
             logging.error(f"Failed to convert clipboard data to base64: {e}")
 
+    def _image_to_base64(self, content: any) -> str:
+        if isinstance(content, list):
+            if content is None or len(content) == 0:
+                raise ValueError("Clipboard image content cannot be None or empty")
+
+            # An image file: send its bytes as they are (opening only parses the header)
+            with Image.open(content[0]):
+                pass
+            with open(content[0], "rb") as f:
+                content = f.read()
+        # Encode once, per the image policy; the size check runs on the encoded bytes
+        image_data, _ = ImageTranscoder.transcode(
+            content,
+            policy=self.config.data["image_policy"],
+            limit=self.get_size_limit(),
+            threshold=self.config.data["image_transcode_threshold_bytes"],
+            downscale=self.config.data["image_downscale"],
+        )
+        if self.is_clipboard_size_within_limit(image_data, "image"):
+            return base64.b64encode(image_data).decode("utf-8")
+        return None
+
+    def _convert_in_background(self, callback, type_: str, convert, content: any):
+        """
+        Runs `convert(content)` on the worker pool and passes the payload to `callback`,
+        unless a newer clipboard arrived in the meantime.
+        """
+
+        def _done(future):
+            try:
+                payload = future.result()
+            except StaleJobError:
+                logging.debug(f"Dropped the conversion of a replaced {type_} clipboard")
+                return
+            except Exception as e:
+                logging.error(f"Failed to convert clipboard data to base64: {e}")
+                return
+            if payload is not None and payload != "{}":  # "{}": no files could be read
+                callback(payload, type_)
+
+        self.worker_pool.submit(convert, content).add_done_callback(_done)
+
     def base64_to_clipboard(self, base64_string: str, type_: str = "text"):
         try:
             if type_ == "text":
@@ -178,18 +267,37 @@ class ClipboardManager:
                 if self.is_clipboard_size_within_limit(txt, type_):
                     self.paste(txt, type_)
             elif type_ == "image":
-                img = ClipboardManager.convert_base64_to_image(base64_img=base64_string)
-                if self.is_clipboard_size_within_limit(img, type_):
-                    self.paste(img, type_)
+                image_data = base64.b64decode(base64_string)
+                if self.is_clipboard_size_within_limit(image_data, type_):
+                    if PLATFORM.startswith(LINUX) and image_data.startswith(PNG_SIGNATURE):
+                        self.paste(image_data, type_)  # Already what wl-copy/xclip expect
+                    else:
+                        self.paste(ClipboardManager.decode_image(image_data), type_)
             elif type_ == "files":
-                file_objects = ClipboardManager.convert_base64_to_files(
-                    base64_json=base64_string
-                )
+                file_objects, directory = FileSpool.from_base64(base64_string)
                 if self.is_clipboard_size_within_limit(file_objects, type_):
                     self.paste(file_objects, type_)
+                    self.received_files_directory = directory
+                elif directory is not None:
+                    FileStreamReceiver.remove_directory(directory)
         except Exception as e:
             logging.error(f"Failed to convert base64 data to clipboard: {e}")
 
+    def file_stream_to_clipboard(self, receiver: FileStreamReceiver):
+        """
+        Offers the files of a completed incoming stream for download.
+        The files stay in the receiver's spool directory until the next clipboard change.
+        """
+        try:
+            if self.is_clipboard_size_within_limit(receiver.files, "files"):
+                self.paste(receiver.files, "files")
+                self.received_files_directory = receiver.directory
+            else:
+                receiver.discard()
+        except Exception as e:
+            receiver.discard()
+            logging.error(f"Failed to convert file stream to clipboard: {e}")
+
     @staticmethod
     def execute_command(*args, input_data):
         """
@@ -252,10 +360,13 @@ class ClipboardManager:
                     clipboard_monitor.enable_block_image_once()  # Block image copy to prevent deadlock
                     clipboard_monitor.write_to_pasteboard(tiff_data, pasteboard.TIFF)
                 elif PLATFORM.startswith(LINUX):
-                    # Save the image to a binary buffer in PNG format
-                    with io.BytesIO() as output:
-                        payload.convert("RGB").save(output, format="PNG")
-                        png_data = output.getvalue()
+                    if isinstance(payload, bytes):
+                        png_data = payload  # Received as PNG
+                    else:
+                        # Save the image to a binary buffer in PNG format
+                        with io.BytesIO() as output:
+                            payload.convert("RGB").save(output, format="PNG")
+                            png_data = output.getvalue()
 
                     clipboard_monitor.enable_block_image_once()  # Block image copy to prevent deadlock
                     if XMODE and self.is_x_clipboard_owner:
@@ -278,19 +389,42 @@ class ClipboardManager:
             elif payload_type == "files":
                 if (
                     payload is not None
-                    and isinstance(payload, dict)
+                    and isinstance(payload, (dict, FileOffer))  # FileOffer: pulled on download
                     and len(payload) > 0
                 ):
                     if self.sys_tray is not None:
                         self.is_files_download_enabled = True
                         self.sys_tray.enable_files_download(files=payload)
+                        self._files_download_timer = threading.Timer(
+                            FILE_SPOOL_TTL_SEC, self.reset_files_download
+                        )
+                        self._files_download_timer.daemon = True
+                        self._files_download_timer.start()
 
         except Exception as e:
             logging.error(f"Failed to copy data to clipboard: {e}")
             raise
 
+    def set_connected(self, connected: bool):
+        """Pauses clipboard polling (macOS, Linux fallback) while the connection is down."""
+        clipboard_monitor.set_paused("disconnected", not connected)
+
+    def get_monitor_stats(self) -> str:
+        """
+        The clipboard monitor's polling interval and wakeups per minute (if it polls) and
+        the number of updates dropped by debouncing.
+        """
+        stats = [clipboard_monitor.get_stats()]
+        if self.debouncer is not None:
+            stats.append(self.debouncer.get_stats())
+        stats = [s for s in stats if s is not None]
+        return " | ".join(stats) if stats else None
+
     def stop(self):
+        if self.debouncer is not None:
+            self.debouncer.cancel()
         self.reset_files_download()
+        self.worker_pool.shutdown()
         clipboard_monitor.stop()
 
     @staticmethod
@@ -300,7 +434,8 @@ class ClipboardManager:
 
         Args:
             files (tuple or list): A tuple of file paths.
-            files (dict): A dictionary of files with file names as keys and file object as values.
+            files (dict): A dictionary of files with file names as keys and file object (or path on disk) as values.
+            files (FileStream): Copied files (and directories) already listed for streaming.
 
         Returns:
             int: The cumulative size of the files in bytes.
@@ -308,12 +443,16 @@ class ClipboardManager:
         Raises:
             IOError: If a file cannot be read or processed.
         """
+        if isinstance(files, FileStream):
+            return files.total_size
+
         cumulative_size = 0
         if isinstance(files, tuple | list):
             for file_path in files:
                 try:
-                    if os.path.isfile(file_path):
-                        cumulative_size += os.path.getsize(file_path)
+                    stat = FileIngest.stat(file_path)  # One stat for the type and the size
+                    if stat is not None and S_ISREG(stat.st_mode):
+                        cumulative_size += stat.st_size
                 except Exception as e:
                     raise IOError(
                         f"Failed to calculate size for file '{file_path}' {e}."
@@ -322,7 +461,10 @@ class ClipboardManager:
         if isinstance(files, dict):
             for file_name, file_object in files.items():
                 try:
-                    cumulative_size += file_object.getbuffer().nbytes
+                    if isinstance(file_object, str):
+                        cumulative_size += os.path.getsize(file_object)
+                    else:
+                        cumulative_size += file_object.getbuffer().nbytes
                 except Exception as e:
                     raise IOError(
                         f"Failed to calculate size for file '{file_name}' {e}."
@@ -347,63 +489,72 @@ class ClipboardManager:
         base64_encoded_files = {}
         for file_path in file_paths:
             try:
-                if os.path.isfile(file_path):
+                stat = FileIngest.stat(file_path)
+                if stat is not None and S_ISREG(stat.st_mode):
                     file_name = os.path.basename(file_path)
-                    with open(file_path, "rb") as file:
-                        encoded_string = base64.b64encode(file.read()).decode("utf-8")
-                        base64_encoded_files[file_name] = encoded_string
+                    # Views are multiples of 3 bytes (but the last), so their base64 concatenates
+                    encoded = b"".join(
+                        base64.b64encode(view)
+                        for view in FileIngest.iter_views(file_path, stat.st_size)
+                    )
+                    base64_encoded_files[file_name] = encoded.decode("utf-8")
             except Exception as e:
                 raise IOError(f"Failed to process file '{file_path}'. {e}") from e
 
         return json.dumps(base64_encoded_files)
 
     @staticmethod
-    def convert_base64_to_files(base64_json: dict) -> dict:
+    def get_image_size(img: Image.Image | bytes) -> int:
         """
-        Converts a JSON string with base64-encoded file content to a dictionary of file-like objects.
+        Calculate the size of an image in bytes.
 
         Args:
-            base64_json (str): A JSON string where file names are keys and base64-encoded content is values.
+            img (Image.Image | bytes): The image to calculate the size for.
 
         Returns:
-            dict: A dictionary where keys are file names, and values are BytesIO objects containing the decoded file data.
+            int: The size of the image in bytes.
+
+        Raises:
+            IOError: If the image cannot be processed or saved.
         """
-        file_objects = {}
         try:
-            base64_data = json.loads(base64_json)
-            for file_name, encoded_content in base64_data.items():
-                decoded_content = base64.b64decode(encoded_content)
-                file_objects[file_name] = io.BytesIO(decoded_content)
+            return len(ClipboardManager.encode_image(img))
         except Exception as e:
-            raise IOError(f"Error processing base64 JSON. {e}") from e
-
-        return file_objects
+            raise IOError(f"Failed to calculate the image size. {e}") from e
 
     @staticmethod
-    def get_image_size(img: Image.Image | bytes) -> int:
+    def encode_image(img: Image.Image | bytes) -> bytes:
         """
-        Calculate the size of an image in bytes.
-
-        Args:
-            img (Image.Image | bytes): The image to calculate the size for.
-
-        Returns:
-            int: The size of the image in bytes.
+        Returns the encoded bytes of an image. Bytes (already encoded by the clipboard
+        monitor) pass through untouched; a PIL image is saved once in its own format.
 
         Raises:
             IOError: If the image cannot be processed or saved.
         """
+        if isinstance(img, (bytes, bytearray)):
+            return bytes(img)
         try:
-            if isinstance(img, bytes):
-                size_in_bytes = len(img)
-            if isinstance(img, Image.Image):
-                with io.BytesIO() as buffer:
-                    img.save(buffer, format=img.format or "PNG")
-                    size_in_bytes = buffer.tell()
-
-            return size_in_bytes
+            with io.BytesIO() as buffered:
+                img.save(buffered, format=img.format or "PNG")
+                return buffered.getvalue()
         except Exception as e:
-            raise IOError(f"Failed to calculate the image size. {e}") from e
+            raise IOError(f"Failed to encode the image. {e}") from e
+
+    @staticmethod
+    def decode_image(image_data: bytes) -> Image.Image:
+        """
+        Loads encoded image bytes into a PIL image.
+
+        Raises:
+            IOError: If the image cannot be processed.
+        """
+        try:
+            with io.BytesIO(image_data) as image_stream:
+                image = Image.open(image_stream)
+                image.load()
+            return image
+        except IOError as e:
+            raise IOError(f"Failed to process the image. {e}") from e
 
     @staticmethod
     def convert_image_to_base64(img: Image.Image | bytes) -> str:
@@ -420,16 +571,7 @@ class ClipboardManager:
             IOError: If the image cannot be processed or saved.
         """
         try:
-            if isinstance(img, bytes):
-                base64_string = base64.b64encode(img).decode("utf-8")
-            if isinstance(img, Image.Image):
-                with io.BytesIO() as buffered:
-                    img.save(buffered, format=img.format or "PNG")
-                    base64_string = base64.b64encode(buffered.getvalue()).decode(
-                        "utf-8"
-                    )
-
-            return base64_string
+            return base64.b64encode(ClipboardManager.encode_image(img)).decode("utf-8")
         except Exception as e:
             raise IOError(f"Failed to convert the image to base64. {e}") from e
 
@@ -454,11 +596,4 @@ class ClipboardManager:
         except base64.binascii.Error as e:
             raise ValueError("Invalid base64 string.") from e
 
-        try:
-            # Load the image from the decoded bytes
-            with io.BytesIO(image_data) as image_stream:
-                image = Image.open(image_stream)
-                image.load()
-            return image
-        except IOError as e:
-            raise IOError(f"Failed to process the image. {e}") from e
+        return ClipboardManager.decode_image(image_data)
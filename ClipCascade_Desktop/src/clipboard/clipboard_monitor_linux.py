@@ -1,10 +1,14 @@
 import logging
+import os
 import re
 import subprocess
 import threading
 import time
+import xxhash
 
 from core.constants import *
+from clipboard.poll_scheduler import PollScheduler
+from clipboard.x11_selection import X11Selection
 
 _callback_update = None
 _clipboard_thread = None
@@ -14,6 +18,37 @@ _block_image_once = False
 _is_gdk_running = False
 _run_poll = threading.Event()
 _wl_watch_proc = None
+_poll_scheduler = PollScheduler()
+_x_wake_fd = None  # Write end of the pipe that wakes the XFixes monitor on stop()
+
+# Runs (via `wl-paste --watch sh -c`) on every Wayland clipboard change and writes one frame
+# to stdout: "<mime list size> <payload size>\n", the `wl-paste -l` output, then the content
+# (the piped selection for text; uri-list / PNG read explicitly). Sensitive clipboards
+# (CLIPBOARD_STATE, e.g. from password managers) are not reported.
+_WL_WATCH_HELPER = r"""
+[ "$CLIPBOARD_STATE" = sensitive ] && exit 0
+f=$(mktemp) || exit 0
+trap 'rm -f "$f"' EXIT
+m=$(wl-paste -l 2>/dev/null)
+case "$m" in
+*text/uri-list*) wl-paste -n -t text/uri-list >"$f" 2>/dev/null ;;
+*image/*) wl-paste -t image/png >"$f" 2>/dev/null ;;
+*) cat >"$f" ;;
+esac
+printf '%d %d\n' "$(printf %s "$m" | wc -c)" "$(wc -c <"$f")"
+printf %s "$m"
+cat "$f"
+"""
+
+# Text targets in order of preference when reading the X11 selection in-process
+_X11_TEXT_TARGETS = [
+    "UTF8_STRING",
+    "text/plain;charset=utf-8",
+    "text/plain",
+    "STRING",
+    "TEXT",
+    "COMPOUND_TEXT",
+]
 
 
 def _on_clipboard_changed(
@@ -59,7 +94,8 @@ def _monitor_x_wl_clipboard(
 ):
     global _block_image_once
     last_error = None
-    previous_clipboard: str | bytes | None = None
+    previous_digest = None
+    previous_timestamp = None
     ignore_patterns = [
         r"target .+ not available",  # xclip pattern
         r"no suitable type of content copied",  # wl-clipboard pattern
@@ -72,9 +108,24 @@ def _monitor_x_wl_clipboard(
         timeout = 0.3  # xclip seconds
     else:
         timeout = 3  # wl-clipboard seconds
+    # Polls every `timeout` after a change, backing off while idle (see PollScheduler)
+    _poll_scheduler.start(timeout)
 
     while _run_poll.is_set():
         if x_mode:
+            # The owner's TIMESTAMP changes with every copy; skip the reads while it stays.
+            # Owners that do not support it (or always answer 0) are read every time.
+            success, timestamp = execute_command(
+                "xclip", "-selection", "clipboard", "-t", "TIMESTAMP", "-o"
+            )
+            if not success or not timestamp.strip(b"\0\n "):
+                previous_timestamp = None
+            elif timestamp == previous_timestamp:
+                _poll_scheduler.wait()
+                continue
+            else:
+                previous_timestamp = timestamp
+
             success, mime_list = execute_command(
                 "xclip", "-selection", "clipboard", "-t", "TARGETS", "-o"
             )
@@ -85,7 +136,7 @@ def _monitor_x_wl_clipboard(
             if error_msg != last_error:
                 logging.error(error_msg)
                 last_error = error_msg
-            time.sleep(timeout)
+            _poll_scheduler.wait()
             continue
 
         mime_list = mime_list.decode("utf-8")
@@ -103,8 +154,10 @@ def _monitor_x_wl_clipboard(
                 success, text = execute_command("wl-paste", "-n")
             if success:
                 text = text.decode("utf-8")
-                if len(text) > 0 and text != previous_clipboard:
-                    previous_clipboard = text
+                digest = _clipboard_digest(text)
+                if len(text) > 0 and digest != previous_digest:
+                    previous_digest = digest
+                    _poll_scheduler.activity()
                     if _callback_update:
                         _callback_update("text", text)
             else:
@@ -131,8 +184,10 @@ def _monitor_x_wl_clipboard(
             else:
                 success, image = execute_command("wl-paste", "-t", "image/png")
             if success:
-                if image != previous_clipboard:
-                    previous_clipboard = image
+                digest = _clipboard_digest(image)
+                if digest != previous_digest:
+                    previous_digest = digest
+                    _poll_scheduler.activity()
                     if _callback_update and not _block_image_once:
                         _callback_update("image", image)
                     else:
@@ -166,8 +221,10 @@ def _monitor_x_wl_clipboard(
                 files = files.decode("utf-8")
                 files = files.replace("\r\n", "\n").replace("\r", "\n").split("\n")
                 files = [f.strip() for f in files if len(f.strip()) > 0]
-                if files != previous_clipboard:
-                    previous_clipboard = files
+                digest = _clipboard_digest(files)
+                if digest != previous_digest:
+                    previous_digest = digest
+                    _poll_scheduler.activity()
                     if _callback_update:
                         _callback_update("files", files)
             else:
@@ -180,7 +237,8 @@ def _monitor_x_wl_clipboard(
                         logging.error(error_msg)
                     last_error = error_msg
 
-        time.sleep(timeout)
+        _poll_scheduler.wait()
+    _poll_scheduler.stop()
 
 
 def _monitor_wl_watch(enable_image_monitoring=False, enable_file_monitoring=False):
@@ -188,19 +246,16 @@ def _monitor_wl_watch(enable_image_monitoring=False, enable_file_monitoring=Fals
     Uses the wlr-data-control-v1 protocol which does not create visible
     surfaces or steal focus. Supported by wlroots-based compositors
     (Sway, Hyprland, etc.) and KDE Plasma on Wayland.
+    The watcher itself delivers the MIME types and content of every change
+    (see _WL_WATCH_HELPER), so nothing is forked from here per copy.
     Returns True if watch mode ran successfully, False to fall back to polling."""
     global _block_image_once, _wl_watch_proc
 
-    last_error = None
-    previous_clipboard = None
-    ignore_patterns = [
-        r"target .+ not available",
-        r"no suitable type of content copied",
-    ]
+    previous_digest = None  # Digest of the last reported clipboard
 
     try:
         _wl_watch_proc = subprocess.Popen(
-            ["wl-paste", "--watch", "echo"],
+            ["wl-paste", "--watch", "sh", "-c", _WL_WATCH_HELPER],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
@@ -219,94 +274,43 @@ def _monitor_wl_watch(enable_image_monitoring=False, enable_file_monitoring=Fals
         )
 
         while _run_poll.is_set():
-            line = _wl_watch_proc.stdout.readline()
-            if not line:
+            frame = _read_wl_watch_frame(_wl_watch_proc.stdout)
+            if frame is None:
                 break
             if not _run_poll.is_set():
                 break
-
-            success, mime_output = execute_command("wl-paste", "-l")
-            if not success:
-                error_msg = f"Failed to retrieve MIME types: {mime_output}"
-                if error_msg != last_error:
-                    logging.error(error_msg)
-                    last_error = error_msg
-                continue
-
-            mime_list = mime_output.decode("utf-8")
-            mime_list = mime_list.replace("\r\n", "\n").replace("\r", "\n").split("\n")
-            mime_list = [m.strip() for m in mime_list if len(m.strip()) > 0]
+            mime_list, payload = frame
             type_ = convert_mime_to_generic_type(mime_list)
 
             # Text
             if type_ == "text":
-                success, text = execute_command("wl-paste", "-n")
-                if success:
-                    text = text.decode("utf-8")
-                    if len(text) > 0 and text != previous_clipboard:
-                        previous_clipboard = text
-                        if _callback_update:
-                            _callback_update("text", text)
-                else:
-                    error_msg = (
-                        f"Failed to retrieve text content from clipboard. {text}"
-                    )
-                    if error_msg != last_error:
-                        if not any(
-                            re.search(pattern, error_msg.lower())
-                            for pattern in ignore_patterns
-                        ):
-                            logging.error(error_msg)
-                        last_error = error_msg
+                text = payload.decode("utf-8", errors="replace")
+                digest = _clipboard_digest(text)
+                if len(text) > 0 and digest != previous_digest:
+                    previous_digest = digest
+                    if _callback_update:
+                        _callback_update("text", text)
 
             # Image
             elif type_ == "image" and enable_image_monitoring:
-                success, image = execute_command("wl-paste", "-t", "image/png")
-                if success:
-                    if image != previous_clipboard:
-                        previous_clipboard = image
-                        if _callback_update and not _block_image_once:
-                            _callback_update("image", image)
-                        else:
-                            _block_image_once = False
-                else:
-                    error_msg = (
-                        f"Failed to retrieve image content from clipboard. {image}"
-                    )
-                    if error_msg != last_error:
-                        if not any(
-                            re.search(pattern, error_msg.lower())
-                            for pattern in ignore_patterns
-                        ):
-                            logging.error(error_msg)
-                        last_error = error_msg
+                digest = _clipboard_digest(payload)
+                if len(payload) > 0 and digest != previous_digest:
+                    previous_digest = digest
+                    if _callback_update and not _block_image_once:
+                        _callback_update("image", payload)
+                    else:
+                        _block_image_once = False
 
             # Files
             elif type_ == "files" and enable_file_monitoring:
-                success, files = execute_command(
-                    "wl-paste", "-t", "text/uri-list", "-n"
-                )
-                if success:
-                    files = files.decode("utf-8")
-                    files = (
-                        files.replace("\r\n", "\n").replace("\r", "\n").split("\n")
-                    )
-                    files = [f.strip() for f in files if len(f.strip()) > 0]
-                    if files != previous_clipboard:
-                        previous_clipboard = files
-                        if _callback_update:
-                            _callback_update("files", files)
-                else:
-                    error_msg = (
-                        f"Failed to retrieve files content from clipboard. {files}"
-                    )
-                    if error_msg != last_error:
-                        if not any(
-                            re.search(pattern, error_msg.lower())
-                            for pattern in ignore_patterns
-                        ):
-                            logging.error(error_msg)
-                        last_error = error_msg
+                files = payload.decode("utf-8", errors="replace")
+                files = files.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+                files = [f.strip() for f in files if len(f.strip()) > 0]
+                digest = _clipboard_digest(files)
+                if len(files) > 0 and digest != previous_digest:
+                    previous_digest = digest
+                    if _callback_update:
+                        _callback_update("files", files)
 
         return True
     except FileNotFoundError:
@@ -325,6 +329,115 @@ def _monitor_wl_watch(enable_image_monitoring=False, enable_file_monitoring=Fals
             _wl_watch_proc = None
 
 
+def _read_wl_watch_frame(stream) -> tuple | None:
+    """
+    Reads one frame written by _WL_WATCH_HELPER.
+
+    Returns:
+        tuple: (mime_list, payload), or None once the watcher has exited.
+    """
+    header = stream.readline()
+    if not header:
+        return None
+    mime_size, payload_size = (int(size) for size in header.split())
+    mime_list = stream.read(mime_size)
+    payload = stream.read(payload_size)
+    if len(mime_list) < mime_size or len(payload) < payload_size:
+        return None
+    mime_list = mime_list.decode("utf-8", errors="replace")
+    mime_list = mime_list.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    mime_list = [m.strip() for m in mime_list if len(m.strip()) > 0]
+    return mime_list, payload
+
+
+def _monitor_x_fixes(enable_image_monitoring=False, enable_file_monitoring=False):
+    """Event-driven X11 clipboard monitoring using XFixes selection-owner events.
+    Sleeps until the CLIPBOARD owner changes, then reads the targets and content
+    in-process (see X11Selection) instead of spawning xclip every poll.
+    Returns True if it ran, False to fall back to polling (no XFixes)."""
+    global _block_image_once, _x_wake_fd
+
+    selection = X11Selection.open()
+    if selection is None:
+        return False
+    logging.info("Using XFixes selection events for clipboard monitoring")
+
+    previous_digest = None  # Digest of the last reported clipboard
+    previous_timestamp = None
+    wake_fd, _x_wake_fd = os.pipe()
+    try:
+        while _run_poll.is_set():
+            if not selection.wait_for_change(wake_fd) or not _run_poll.is_set():
+                break
+            if selection.owner_timestamp and selection.owner_timestamp == previous_timestamp:
+                continue  # The same ownership reported again
+            previous_timestamp = selection.owner_timestamp
+
+            mime_list = selection.targets()
+            if mime_list is None:
+                continue  # No owner, or it did not answer
+            type_ = convert_mime_to_generic_type(mime_list)
+
+            # Text
+            if type_ == "text":
+                target = next(t for t in _X11_TEXT_TARGETS if t in mime_list)
+                text = selection.read(target)
+                if text is not None:
+                    encoding = "latin-1" if target == "STRING" else "utf-8"
+                    text = text.decode(encoding, errors="replace")
+                    digest = _clipboard_digest(text)
+                    if len(text) > 0 and digest != previous_digest:
+                        previous_digest = digest
+                        if _callback_update:
+                            _callback_update("text", text)
+
+            # Image
+            elif type_ == "image" and enable_image_monitoring:
+                image = selection.read("image/png")
+                if image is not None:
+                    digest = _clipboard_digest(image)
+                    if digest != previous_digest:
+                        previous_digest = digest
+                        if _callback_update and not _block_image_once:
+                            _callback_update("image", image)
+                        else:
+                            _block_image_once = False
+
+            # Files
+            elif type_ == "files" and enable_file_monitoring:
+                files = selection.read("text/uri-list")
+                if files is not None:
+                    files = files.decode("utf-8", errors="replace")
+                    files = files.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+                    files = [f.strip() for f in files if len(f.strip()) > 0]
+                    digest = _clipboard_digest(files)
+                    if digest != previous_digest:
+                        previous_digest = digest
+                        if _callback_update:
+                            _callback_update("files", files)
+        return True
+    except Exception as e:
+        logging.warning(f"XFixes clipboard monitoring failed: {e}")
+        return False
+    finally:
+        write_fd, _x_wake_fd = _x_wake_fd, None
+        os.close(write_fd)
+        os.close(wake_fd)
+        selection.close()
+
+
+def _clipboard_digest(content: str | bytes | list) -> str:
+    """
+    Digest of clipboard content (text, image bytes or a file list), compared against the
+    last reported one instead of keeping the previous content (e.g. a large image) around.
+    """
+    if isinstance(content, str):
+        return "text:" + xxhash.xxh3_128_hexdigest(content.encode("utf-8", "surrogatepass"))
+    if isinstance(content, list):
+        return "files:" + xxhash.xxh3_128_hexdigest("\n".join(content).encode("utf-8"))
+    return "image:" + xxhash.xxh3_128_hexdigest(content)
+
+
 def convert_mime_to_generic_type(mime_list):
     if "text/uri-list" in mime_list:
         return "files"
@@ -376,6 +489,13 @@ def is_x_clipboard_owner():
 
 
 def _start_clipboard_polling(enable_image_monitoring, enable_file_monitoring):
+    if XMODE and LINUX_CLIPBOARD_POLL_INTERVAL_SEC is None:
+        if _monitor_x_fixes(
+            enable_image_monitoring=enable_image_monitoring,
+            enable_file_monitoring=enable_file_monitoring,
+        ) or not _run_poll.is_set():
+            return
+        logging.info("XFixes is unavailable, falling back to xclip polling")
     if XMODE:
         x_clipboard_owner = is_x_clipboard_owner()
         if not x_clipboard_owner:
@@ -459,8 +579,14 @@ def stop():
             Gtk.main_quit()
             _is_gdk_running = False
         _run_poll.clear()
+        _poll_scheduler.stop()
         if _wl_watch_proc is not None:
             _wl_watch_proc.terminate()
+        if _x_wake_fd is not None:
+            try:
+                os.write(_x_wake_fd, b"\0")
+            except OSError:
+                pass  # The monitor is already closing
         _clipboard_thread.join()  # Wait for the thread to finish
         _clipboard_thread = None
         _callback_update = None
@@ -475,6 +601,15 @@ def wait():
         _clipboard_thread.join()
 
 
+def set_paused(reason: str, paused: bool):
+    """Pauses polling (if polling is used) while e.g. the connection is down."""
+    _poll_scheduler.set_paused(reason, paused)
+
+
+def get_stats() -> str:
+    return _poll_scheduler.get_stats()
+
+
 def enable_block_image_once():
     global _block_image_once
     _block_image_once = True
@@ -1,9 +1,10 @@
 from io import BytesIO
 import logging
 import threading
-import time
 import pasteboard
 
+from clipboard.poll_scheduler import PollScheduler
+
 _clipboard_thread = None
 _callback_update = None
 _run = False
@@ -11,6 +12,7 @@ _first_run = False
 _block_image_once = False
 _pasteboard_lock = threading.Lock()
 _pb_writer = None
+_poll_scheduler = PollScheduler()
 
 
 def write_to_pasteboard(data, pb_type):
@@ -32,6 +34,8 @@ def _runner(enable_image_monitoring=False, enable_file_monitoring=False):
             pb_files = pasteboard.Pasteboard()
         image_processed = False
         files_processed = False
+        # Polls fast after a change or user input, backing off while idle (see PollScheduler)
+        _poll_scheduler.start()
         while _run:
             # don't change the execution order (files,text,image or files,image,text)
 
@@ -97,13 +101,19 @@ def _runner(enable_image_monitoring=False, enable_file_monitoring=False):
                             if not files_processed:
                                 _callback_update("image", clipboard_image_tiff)
 
+            changed = files_processed or image_processed or clipboard_text is not None
+            if changed and not _first_run:
+                _poll_scheduler.activity()
             files_processed = False
             image_processed = False
             _first_run = False
-            time.sleep(0.3)  # seconds
+            if not _poll_scheduler.wait():
+                break
 
     except Exception as e:
         logging.error(f"Error processing clipboard update: {e}")
+    finally:
+        _poll_scheduler.stop()
 
 
 def _start(enable_image_monitoring=False, enable_file_monitoring=False):
@@ -123,6 +133,7 @@ def stop():
     global _clipboard_thread, _callback_update, _run, _first_run, _block_image_once, _pb_writer
     if _clipboard_thread:
         _run = False
+        _poll_scheduler.stop()
         _clipboard_thread.join()  # Wait for the thread to finish
         _first_run = False
         _clipboard_thread = None
@@ -138,6 +149,15 @@ def wait():
         _clipboard_thread.join()
 
 
+def set_paused(reason: str, paused: bool):
+    """Pauses polling while e.g. the connection is down."""
+    _poll_scheduler.set_paused(reason, paused)
+
+
+def get_stats() -> str:
+    return _poll_scheduler.get_stats()
+
+
 def enable_block_image_once():
     global _block_image_once
     _block_image_once = True
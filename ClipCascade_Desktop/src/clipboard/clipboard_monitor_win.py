@@ -7,12 +7,32 @@ import threading
 import ctypes
 import time
 from PIL import ImageGrab
+from core.constants import *
 
 
 _clipboard_thread = None
+_reader_thread = None  # Reads the clipboard so the message pump never blocks
 _hwnd = None  # Store the window handle
 _callback_update = None
 _block_image_once = False
+_update_pending = threading.Event()  # Set by WM_CLIPBOARDUPDATE
+_run = False
+
+
+def _retry(read):
+    """
+    Calls `read`, retrying with exponential backoff while another application holds
+    the clipboard open (OpenClipboard fails with "access denied" meanwhile).
+    """
+    delay = WIN_CLIPBOARD_RETRY_DELAY_SEC
+    for attempt in range(WIN_CLIPBOARD_RETRIES):
+        try:
+            return read()
+        except Exception:
+            if attempt == WIN_CLIPBOARD_RETRIES - 1:
+                raise
+            time.sleep(delay)
+            delay *= 2
 
 
 def _get_clipboard_content(enable_image_monitoring=False, enable_file_monitoring=False):
@@ -30,8 +50,6 @@ def _get_clipboard_content(enable_image_monitoring=False, enable_file_monitoring
     Files:
         CF_HDROP -> (file_path1, file_path2, ...)
     """
-    # sleep 0.5 to avoid clipboard not ready for read
-    time.sleep(0.5)
     clipboard_type = None
     clipboard_content = None
 
@@ -39,9 +57,9 @@ def _get_clipboard_content(enable_image_monitoring=False, enable_file_monitoring
         win32con.CF_BITMAP
     ):
         clipboard_type = "image"
-        clipboard_content = ImageGrab.grabclipboard()
+        clipboard_content = _retry(ImageGrab.grabclipboard)
     else:
-        win32clipboard.OpenClipboard()
+        _retry(win32clipboard.OpenClipboard)
         try:
             if win32clipboard.IsClipboardFormatAvailable(win32con.CF_UNICODETEXT):
                 text = win32clipboard.GetClipboardData(win32con.CF_UNICODETEXT)
@@ -72,12 +90,42 @@ def _process_message(
     enable_image_monitoring=False,
     enable_file_monitoring=False,
 ):
-    global _block_image_once
     WM_CLIPBOARDUPDATE = 0x031D
     if msg == WM_CLIPBOARDUPDATE:
-        clip = _get_clipboard_content(enable_image_monitoring, enable_file_monitoring)
+        _update_pending.set()  # Read by _reader; the window procedure returns at once
+    return 0
+
+
+def _reader(enable_image_monitoring=False, enable_file_monitoring=False):
+    """
+    Reads the clipboard after WM_CLIPBOARDUPDATE. A burst of updates (e.g. an application
+    setting several formats one by one) is read once, after WIN_CLIPBOARD_COALESCE_SEC
+    without a further update; notifications that did not change the clipboard sequence
+    number are skipped.
+    """
+    global _block_image_once
+    last_sequence = None
+    while True:
+        _update_pending.wait()
+        if not _run:
+            break
+        burst_end = time.monotonic() + WIN_CLIPBOARD_COALESCE_MAX_SEC
+        _update_pending.clear()
+        while _update_pending.wait(WIN_CLIPBOARD_COALESCE_SEC) and _run:
+            _update_pending.clear()
+            if time.monotonic() >= burst_end:
+                break
+        if not _run:
+            break
+
+        sequence = win32clipboard.GetClipboardSequenceNumber()
+        if sequence == last_sequence:
+            continue
 
         try:
+            clip = _get_clipboard_content(enable_image_monitoring, enable_file_monitoring)
+            last_sequence = sequence
+
             if clip[0] == "text" and _callback_update:
                 _callback_update(clip[0], clip[1])
 
@@ -91,7 +139,6 @@ def _process_message(
                 _callback_update(clip[0], clip[1])
         except Exception as e:
             logging.error(f"Error processing clipboard update: {e}")
-    return 0
 
 
 def _create_window(enable_image_monitoring=False, enable_file_monitoring=False):
@@ -122,8 +169,16 @@ def _runner(enable_image_monitoring=False, enable_file_monitoring=False):
 
 
 def _start(enable_image_monitoring=False, enable_file_monitoring=False):
-    global _clipboard_thread
+    global _clipboard_thread, _reader_thread, _run
     if not _clipboard_thread:
+        _run = True
+        _update_pending.clear()
+        _reader_thread = threading.Thread(
+            target=_reader,
+            args=(enable_image_monitoring, enable_file_monitoring),
+            daemon=True,
+        )
+        _reader_thread.start()
         _clipboard_thread = threading.Thread(
             target=_runner,
             args=(enable_image_monitoring, enable_file_monitoring),
@@ -133,13 +188,17 @@ def _start(enable_image_monitoring=False, enable_file_monitoring=False):
 
 
 def stop():
-    global _clipboard_thread, _hwnd, _callback_update, _block_image_once
+    global _clipboard_thread, _reader_thread, _hwnd, _callback_update, _block_image_once, _run
     if _clipboard_thread and _hwnd:
         win32gui.PostMessage(
             _hwnd, win32con.WM_QUIT, 0, 0
         )  # Send WM_QUIT to the window
         _clipboard_thread.join()  # Wait for the thread to finish
+        _run = False
+        _update_pending.set()  # Wake the reader
+        _reader_thread.join()
         _clipboard_thread = None
+        _reader_thread = None
         _hwnd = None
         _callback_update = None
         _block_image_once = False
@@ -152,6 +211,14 @@ def wait():
         _clipboard_thread.join()
 
 
+def set_paused(reason: str, paused: bool):
+    pass  # Event-driven (WM_CLIPBOARDUPDATE); there is no polling to pause
+
+
+def get_stats() -> str:
+    return None
+
+
 def enable_block_image_once():
     global _block_image_once
     _block_image_once = True
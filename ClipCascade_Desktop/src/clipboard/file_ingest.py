@@ -0,0 +1,85 @@
+import os
+import stat
+
+import xxhash
+
+from core.constants import *
+
+
+class FileIngest:
+    """
+    Reads copied files for hashing, encoding and encryption without per-chunk copies.
+
+    Files of FILE_WINDOW_THRESHOLD bytes or more are read one FILE_WINDOW_SIZE window at a
+    time (`readinto` a reused buffer), so resident memory stays bounded by the window size
+    whatever the file size. Smaller files are read in one call. Files are read rather than
+    memory-mapped: a mapped file truncated by another process while it is sent raises
+    SIGBUS and kills the client, where a short read is an ordinary error.
+    """
+
+    @staticmethod
+    def stat(path: str) -> os.stat_result:
+        """
+        Returns the stat of a regular file or directory (one `os.stat` call serves both the
+        type check and the size), or None for anything else.
+        """
+        try:
+            result = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if stat.S_ISREG(result.st_mode) or stat.S_ISDIR(result.st_mode):
+            return result
+        return None
+
+    @staticmethod
+    def iter_views(path: str, size: int, window: int = FILE_WINDOW_SIZE):
+        """
+        Yields memoryviews that together cover the first `size` bytes of a file. Each view is
+        only valid until the next one is requested.
+
+        Raises:
+            ValueError: If the file is now smaller than `size`.
+        """
+        with open(path, "rb", buffering=0) as file:
+            if size < FILE_WINDOW_THRESHOLD:
+                data = file.read(size)
+                if len(data) < size:
+                    raise ValueError(f"File is smaller than its listed size ({size} bytes)")
+                yield memoryview(data)
+                return
+
+            buffer = bytearray(min(window, size))
+            for offset in range(0, size, window):
+                length = min(window, size - offset)
+                if FileIngest._is_exported(buffer):
+                    # A consumer still holds a slice of the last window: leave it intact
+                    buffer = bytearray(len(buffer))
+                view = memoryview(buffer)[:length]
+                try:
+                    filled = 0
+                    while filled < length:
+                        read = file.readinto(view[filled:])
+                        if not read:
+                            raise ValueError(f"File is smaller than its listed size ({size} bytes)")
+                        filled += read
+                    yield view
+                finally:
+                    view.release()
+
+    @staticmethod
+    def _is_exported(buffer: bytearray) -> bool:
+        """Whether any memoryview of `buffer` is still alive (a bytearray cannot resize then)."""
+        try:
+            buffer.append(0)
+        except BufferError:
+            return True
+        del buffer[-1]
+        return False
+
+    @staticmethod
+    def digest(path: str, size: int) -> str:
+        """xxh3-128 hex digest of the first `size` bytes of a file."""
+        hasher = xxhash.xxh3_128()
+        for view in FileIngest.iter_views(path, size):
+            hasher.update(view)
+        return hasher.hexdigest()
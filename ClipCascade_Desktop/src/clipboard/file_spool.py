@@ -0,0 +1,192 @@
+import base64
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from core.constants import *
+
+
+class FileSpool:
+    """
+    Staging area for received files under the program directory. Incoming files are written
+    here instead of being held in memory until the user downloads them; downloading links
+    (or copies) them into place atomically. Spooled directories are removed with the download
+    option, and directories older than FILE_SPOOL_TTL_SEC (e.g. left by a crash) on startup.
+    """
+
+    @staticmethod
+    def root() -> str:
+        path = os.path.join(get_program_files_directory(), FILE_SPOOL_DIRECTORY_NAME)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def make_directory() -> str:
+        """Creates a new spool directory for one set of received files."""
+        try:
+            return tempfile.mkdtemp(prefix=f"{APP_NAME}_", dir=FileSpool.root())
+        except OSError as e:  # e.g. a read-only program directory
+            logging.debug(f"Spooling received files to the system temp directory: {e}")
+            return tempfile.mkdtemp(prefix=f"{APP_NAME}_")
+
+    @staticmethod
+    def safe_name(name: str, index: int) -> str:
+        """
+        Never trust remote paths: reduces a received file name to a relative path
+        ("folder/file.txt") that cannot leave the directory it is saved to.
+        """
+        parts = [
+            part.replace(":", "_")
+            for part in str(name).replace("\\", "/").split("/")
+            if part not in ("", ".")
+        ]
+        if not parts or ".." in parts:
+            return f"file_{index}"
+        return "/".join(parts)
+
+    @staticmethod
+    def unique_names(names: list) -> list[str]:
+        """
+        Applies `safe_name` to each name and numbers the ones that would land on the same path
+        ("file.txt", "file (2).txt"), as Explorer and Finder do. Names are compared ignoring
+        case, since Windows and macOS volumes usually do.
+        """
+        safe_names = [FileSpool.safe_name(name, index) for index, name in enumerate(names)]
+        # A file cannot take the path of a folder that other files are saved in
+        taken = {
+            "/".join(parts[:end]).casefold()
+            for parts in (name.split("/") for name in safe_names)
+            for end in range(1, len(parts))
+        }
+        unique = []
+        for name in safe_names:
+            folder, _, base = name.rpartition("/")
+            stem, extension = os.path.splitext(base)
+            candidate = name
+            number = 1
+            while candidate.casefold() in taken:
+                number += 1
+                candidate = f"{stem} ({number}){extension}"
+                if folder:
+                    candidate = f"{folder}/{candidate}"
+            taken.add(candidate.casefold())
+            unique.append(candidate)
+        return unique
+
+    @staticmethod
+    def local_path(directory: str, name: str) -> str:
+        """Returns the path of a `safe_name` below `directory`, creating its folders."""
+        path = os.path.join(directory, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def remove_expired(ttl: float = FILE_SPOOL_TTL_SEC):
+        """
+        Removes spool directories that were last modified more than `ttl` seconds ago. A
+        directory's time does not change while a file in it grows, so directories with a
+        `.part` file written to within `ttl` (a receive still in progress) are kept.
+        """
+        try:
+            root = FileSpool.root()
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if (
+                        entry.is_dir(follow_symlinks=False)
+                        and entry.name.startswith(f"{APP_NAME}_")
+                        and time.time() - entry.stat().st_mtime > ttl
+                        and not FileSpool._is_receiving(entry.path, ttl)
+                    ):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+        except Exception as e:
+            logging.debug(f"Failed to clean up the file spool: {e}")
+
+    @staticmethod
+    def _is_receiving(directory: str, ttl: float) -> bool:
+        for folder, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                if not file_name.endswith(".part"):
+                    continue
+                try:
+                    if time.time() - os.path.getmtime(os.path.join(folder, file_name)) <= ttl:
+                        return True
+                except OSError:
+                    pass  # Renamed or removed meanwhile
+        return False
+
+    @staticmethod
+    def from_base64(base64_json: str, memory_limit: int = FILE_SPOOL_MEMORY_LIMIT) -> tuple:
+        """
+        Decodes a legacy files payload one file at a time. Files stay in memory (BytesIO)
+        while they fit in `memory_limit` bytes in total; the rest are written to a spool
+        directory.
+
+        Returns:
+            tuple: (files, directory) where `files` maps file names to BytesIO objects or
+                   paths on disk, and `directory` is the spool directory (or None).
+        """
+        files = {}
+        directory = None
+        in_memory = 0
+        try:
+            payload = json.loads(base64_json)
+            names = FileSpool.unique_names(list(payload))
+            for name, (file_name, encoded_content) in zip(names, payload.items()):
+                data = base64.b64decode(encoded_content)
+                if in_memory + len(data) <= memory_limit:
+                    files[file_name] = io.BytesIO(data)
+                    in_memory += len(data)
+                    continue
+                if directory is None:
+                    directory = FileSpool.make_directory()
+                path = FileSpool.local_path(directory, name)
+                with open(path, "wb") as file:
+                    file.write(data)
+                files[file_name] = path
+        except Exception as e:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+            raise IOError(f"Error processing base64 JSON. {e}") from e
+        return files, directory
+
+    @staticmethod
+    def save_files(files: dict, target_directory: str):
+        """
+        Saves downloaded files (BytesIO objects or spooled paths) to a directory; names with
+        folders ("folder/file.txt") recreate the copied tree.
+        """
+        names = FileSpool.unique_names(list(files))
+        for name, file_obj in zip(names, files.values()):
+            file_path = FileSpool.local_path(target_directory, name)
+            FileSpool.save(file_obj, file_path)
+            logging.debug(f"Saved: {file_path}")
+
+    @staticmethod
+    def save(file_obj: io.BytesIO | str, file_path: str):
+        """
+        Writes one file so that it only appears under `file_path` once complete. Spooled
+        files are hard-linked when the target is on the same volume, otherwise copied.
+        """
+        partial_path = f"{file_path}.part"
+        try:
+            if os.path.lexists(partial_path):
+                os.remove(partial_path)
+            if isinstance(file_obj, str):
+                try:
+                    os.link(file_obj, partial_path)
+                except OSError:
+                    shutil.copyfile(file_obj, partial_path)
+            else:
+                with open(partial_path, "wb") as file:
+                    file.write(file_obj.getbuffer())
+            os.replace(partial_path, file_path)
+        except Exception:
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            raise
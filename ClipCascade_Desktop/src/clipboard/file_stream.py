@@ -0,0 +1,501 @@
+import base64
+import json
+import logging
+import os
+import shutil
+import time
+import xxhash
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from stat import S_ISREG
+from threading import Lock
+from core.constants import *
+from clipboard.file_ingest import FileIngest
+from clipboard.file_spool import FileSpool
+from utils.cipher_manager import CipherManager
+from utils.compression_manager import CompressionManager
+
+
+class FileStream:
+    """
+    A set of clipboard files that is read lazily, chunk by chunk, so the
+    whole payload is never held in memory at once.
+
+    Copied directories are walked recursively (`os.scandir`); their files are named by
+    their relative path ("folder/sub/file.txt"). Symbolic links and empty directories
+    are skipped. Every file is stat-ed once; its listed size is what gets read and sent.
+    """
+
+    def __init__(
+        self,
+        file_paths: tuple | list,
+        chunk_size: int = FILE_STREAM_CHUNK_SIZE,
+        max_files: int = FILE_TREE_MAX_FILES,
+    ):
+        self.chunk_size = chunk_size
+        self.files = []  # list of (file_path, file_name, size_in_bytes, mtime)
+        for file_path in file_paths:
+            try:
+                stat = FileIngest.stat(file_path)
+                if stat is None:
+                    continue
+                if S_ISREG(stat.st_mode):
+                    self.files.append(
+                        (file_path, os.path.basename(file_path), stat.st_size, stat.st_mtime)
+                    )
+                else:
+                    name = os.path.basename(os.path.normpath(file_path)) or "folder"
+                    self._walk(file_path, name, max_files)
+            except Exception as e:
+                raise IOError(f"Failed to process file '{file_path}'. {e}") from e
+        if len(self.files) > max_files:
+            raise IOError(f"Too many files: {len(self.files)} exceeds {max_files}")
+
+    def _walk(self, directory: str, name: str, max_files: int):
+        stack = [(directory, name)]
+        while stack:
+            directory, name = stack.pop()
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+            subdirectories = []
+            for entry in entries:
+                if entry.is_symlink():
+                    continue  # Never follow links out of the copied tree
+                if entry.is_dir():
+                    subdirectories.append((entry.path, f"{name}/{entry.name}"))
+                elif entry.is_file():
+                    stat = entry.stat()
+                    self.files.append(
+                        (entry.path, f"{name}/{entry.name}", stat.st_size, stat.st_mtime)
+                    )
+            if len(self.files) > max_files:
+                raise IOError(f"Too many files: more than {max_files}")
+            stack.extend(reversed(subdirectories))
+
+    def top_level(self) -> "FileStream":
+        """
+        Returns the copied files without the contents of copied directories, for receivers
+        that only understand flat file lists.
+        """
+        if all("/" not in name for _, name, _, _ in self.files):
+            return self
+        file_stream = FileStream((), self.chunk_size)
+        file_stream.files = [entry for entry in self.files if "/" not in entry[1]]
+        return file_stream
+
+    @property
+    def paths(self) -> list:
+        return [file_path for file_path, _, _, _ in self.files]
+
+    @property
+    def total_size(self) -> int:
+        return sum(size for _, _, size, _ in self.files)
+
+    def is_empty(self) -> bool:
+        return len(self.files) == 0
+
+    def manifest(self, digests: list = None) -> list:
+        """
+        Returns the file names and sizes (and `digests`, if given) in transfer order.
+        """
+        manifest = [{"name": name, "size": size} for _, name, size, _ in self.files]
+        for entry, digest in zip(manifest, digests or ()):
+            entry["hash"] = digest
+        return manifest
+
+    def digests(self) -> list:
+        """
+        Returns the xxh3-128 digest of each file, so a receiver can verify files it pulls later.
+        """
+        digests = []
+        for file_path, _, size, _ in self.files:
+            try:
+                digests.append(FileIngest.digest(file_path, size))
+            except Exception as e:
+                raise IOError(f"Failed to process file '{file_path}'. {e}") from e
+        return digests
+
+    def fingerprint(self) -> str:
+        """
+        Returns a cheap identity string (paths, sizes and modification times) used for change detection.
+        """
+        return json.dumps([[path, size, mtime] for path, _, size, mtime in self.files])
+
+    def total_chunks(self, pack: bool = False) -> int:
+        """
+        Returns the number of chunk messages `iter_chunks` will produce.
+        """
+        if pack:
+            return -(-self.total_size // self.chunk_size)
+        return sum(-(-size // self.chunk_size) for _, _, size, _ in self.files)
+
+    def iter_chunks(self, pack: bool = False):
+        """
+        Yields (file_index, chunk) tuples, reading each file in `chunk_size` pieces. Chunks
+        are bytes-like views (see `FileIngest.iter_views`), valid until the next one.
+
+        With `pack`, the files are read as one archive-like stream: every chunk but the last
+        is full and may span several (small) files; `file_index` is the file its first byte
+        belongs to. Each file contributes exactly its announced size.
+        """
+        if pack:
+            yield from self._iter_packed_chunks()
+            return
+        for file_index, (file_path, _, size, _) in enumerate(self.files):
+            try:
+                for view in FileIngest.iter_views(file_path, size):
+                    for offset in range(0, len(view), self.chunk_size):
+                        yield file_index, view[offset : offset + self.chunk_size]
+            except Exception as e:
+                raise IOError(f"Failed to process file '{file_path}'. {e}") from e
+
+    def _iter_packed_chunks(self):
+        buffer = bytearray()
+        start_index = 0
+        for file_index, (file_path, _, size, _) in enumerate(self.files):
+            try:
+                for view in FileIngest.iter_views(file_path, size):
+                    offset = 0
+                    while offset < len(view):
+                        if not buffer:
+                            start_index = file_index
+                            if len(view) - offset >= self.chunk_size:
+                                # A whole chunk of one file: sent straight from the window
+                                yield file_index, view[offset : offset + self.chunk_size]
+                                offset += self.chunk_size
+                                continue
+                        end = offset + self.chunk_size - len(buffer)
+                        buffer += view[offset:end]
+                        offset = min(end, len(view))
+                        if len(buffer) == self.chunk_size:
+                            yield start_index, buffer
+                            buffer = bytearray()
+            except Exception as e:
+                raise IOError(f"Failed to process file '{file_path}'. {e}") from e
+        if buffer:
+            yield start_index, buffer
+
+    def iter_messages(
+        self,
+        stream_id: str,
+        cipher_manager: CipherManager,
+        chunked_aead: bool,
+        compression: str = None,
+        compression_manager: CompressionManager = None,
+        timestamp: int = None,
+        algorithm: str = AEAD_AES_GCM,
+        offer_id: str = None,
+        pack: bool = False,
+        raw_chunks: bool = False,
+    ):
+        """
+        Yields the start, chunk and end message dicts of this stream.
+
+        Args:
+            stream_id (str): Unique id of the transfer.
+            cipher_manager (CipherManager): Seals each payload.
+            chunked_aead (bool): Send the whole transfer as one segmented AEAD stream;
+                otherwise every chunk is sealed on its own.
+            compression (str): Optional algorithm applied to the file chunks before sealing
+                (chunked AEAD only, see `CompressionManager.select`).
+            compression_manager (CompressionManager): Compresses the chunks and keeps the stats.
+            timestamp (int): Optional sender time (ms) of the copy, used to order transfers.
+            algorithm (str): AEAD algorithm of the chunked-AEAD stream (see `AEADManager`).
+            offer_id (str): Id of the `FileOffer` this stream answers, if it was pulled.
+            pack (bool): Pack small files into shared chunks (see `iter_chunks`); only for
+                receivers that support directory trees.
+            raw_chunks (bool): Leave the sealed chunk payloads as bytes instead of base64, for
+                framing as binary envelopes (chunked AEAD only).
+        """
+        metadata = {
+            "id": stream_id,
+            "stream": "start",
+            "combinedRawPayloadSizeInBytes": self.total_size,
+        }
+        if timestamp is not None:
+            metadata["timestamp"] = timestamp
+        if offer_id is not None:
+            metadata["offer"] = offer_id
+        encryptor = cipher_manager.stream_encryptor(algorithm) if chunked_aead else None
+        compress = None
+        if chunked_aead:
+            metadata["encoding"] = AEAD_STREAM_ENCODING
+            if compression is not None:
+                metadata["compression"] = compression
+                compress = compression_manager.compressor(compression)
+
+        def encode(data: bytes, last: bool = False, raw: bool = False) -> str | bytes:
+            if encryptor is not None:
+                sealed = encryptor.seal(data, last)
+                return sealed if raw else base64.b64encode(sealed).decode("utf-8")
+            return cipher_manager.seal_bytes(data)
+
+        yield {
+            "payload": encode(json.dumps(self.manifest()).encode("utf-8")),
+            "type": FILE_STREAM_TYPE,
+            "metadata": metadata,
+        }
+        seq = 0
+        for file_index, chunk in self.iter_chunks(pack):
+            yield {
+                "payload": encode(
+                    compress(chunk) if compress is not None else chunk, raw=raw_chunks
+                ),
+                "type": FILE_STREAM_TYPE,
+                "metadata": {"id": stream_id, "stream": "chunk", "seq": seq, "file": file_index},
+            }
+            seq += 1
+        yield {
+            # The final (empty) segment lets a chunked-AEAD receiver detect truncation
+            "payload": encode(b"", last=True) if chunked_aead else "",
+            "type": FILE_STREAM_TYPE,
+            "metadata": {"id": stream_id, "stream": "end", "totalChunks": seq},
+        }
+
+
+class FileStreamReceiver:
+    """
+    Writes the chunks of one incoming file stream straight to a spool directory.
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        manifest: list,
+        decode: callable,
+        decryptor=None,
+        decompress: callable = None,
+    ):
+        self.stream_id = stream_id
+        self.decode = decode  # payload string -> raw bytes
+        self.decryptor = decryptor  # StreamDecryptor when the transfer uses chunked AEAD
+        self.decompress = decompress  # streaming decompressor when the chunks are compressed
+        self.directory = FileSpool.make_directory()
+        self.names = FileSpool.unique_names([entry["name"] for entry in manifest])
+        self.sizes = [int(entry["size"]) for entry in manifest]
+        self.received = [0] * len(self.names)
+        self.next_seq = 0
+        self.files: dict = None  # Mapping: file name -> path on disk, set once complete
+        self.timestamp: int = None  # sender time (ms) of the copy, if announced
+        self.offer_id: str = None  # Set when the stream answers a pull of a `FileOffer`
+        self.started = time.monotonic()
+        self._file = None
+        self._file_index = None
+        self._hashes: list = None  # Expected digests, verified as the chunks arrive
+        self._hashers: list = None
+
+    @property
+    def received_bytes(self) -> int:
+        return sum(self.received)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.sizes)
+
+    @property
+    def completed_files(self) -> int:
+        return sum(1 for received, size in zip(self.received, self.sizes) if received == size)
+
+    def expect_hashes(self, hashes: list):
+        """Makes `finish` verify each file against its announced xxh3-128 digest."""
+        self._hashes = list(hashes)
+        self._hashers = [xxhash.xxh3_128() for _ in self.names]
+
+    def write(self, seq: int, file_index: int, data: bytes):
+        if seq != self.next_seq:
+            raise IOError(f"Expected chunk {self.next_seq} but received {seq}")
+        if not 0 <= file_index < len(self.names):
+            raise IOError(f"Invalid file index {file_index}")
+
+        # A packed chunk continues into the following files once one is complete
+        view = memoryview(data)
+        while len(view) > 0:
+            if file_index == len(self.names):
+                raise IOError("File stream exceeds its announced size")
+            room = self.sizes[file_index] - self.received[file_index]
+            if room <= 0:
+                file_index += 1
+                continue
+            piece, view = view[:room], view[room:]
+            if self._file_index != file_index:
+                self._close_file()
+                # Written as ".part" until complete (see `FileSpool.remove_expired`)
+                path = FileSpool.local_path(self.directory, self.names[file_index])
+                self._file = open(f"{path}.part", "wb")
+                self._file_index = file_index
+            self._file.write(piece)
+            if self._hashers is not None:
+                self._hashers[file_index].update(piece)
+            self.received[file_index] += len(piece)
+        self.next_seq += 1
+
+    def finish(self, total_chunks: int) -> dict:
+        """
+        Completes the stream and returns a dict mapping file names to their paths on disk.
+
+        Raises:
+            IOError: If chunks are missing, or a file is incomplete or fails its hash check.
+        """
+        self._close_file()
+        if total_chunks != self.next_seq or self.received != self.sizes:
+            raise IOError("One or more file chunks are missing")
+        if self._hashes is not None:
+            for name, hasher, digest in zip(self.names, self._hashers, self._hashes):
+                if hasher.hexdigest() != digest:
+                    raise IOError(f"File '{name}' does not match its announced hash")
+
+        files = {}
+        for name, size in zip(self.names, self.sizes):
+            path = FileSpool.local_path(self.directory, name)
+            if size == 0:
+                open(path, "wb").close()
+            else:
+                os.replace(f"{path}.part", path)
+            files[name] = path
+        return files
+
+    def discard(self):
+        self._close_file()
+        FileStreamReceiver.remove_directory(self.directory)
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+            self._file_index = None
+
+    @staticmethod
+    def remove_directory(directory: str):
+        try:
+            shutil.rmtree(directory, ignore_errors=True)
+        except Exception as e:
+            logging.debug(f"Failed to remove '{directory}': {e}")
+
+    @staticmethod
+    def handle(
+        receiver: "FileStreamReceiver | None",
+        message: dict,
+        cipher_manager: CipherManager,
+        max_size: int = None,
+    ) -> tuple:
+        """
+        Feeds one stream message into the receiver state machine.
+
+        Args:
+            receiver (FileStreamReceiver | None): The in-flight receiver, if any.
+            message (dict): A message produced by `FileStream.iter_messages`.
+            cipher_manager (CipherManager): Opens the sealed payloads.
+            max_size (int): Optional local size limit; larger streams are ignored.
+
+        Returns:
+            tuple: (receiver, completed) where `receiver` is the in-flight receiver after this
+                   message and `completed` is the finished receiver (or None).
+        """
+        metadata = message["metadata"]
+        stage = metadata["stream"]
+
+        if stage == "start":
+            if receiver is not None:
+                receiver.discard()
+            total_size = metadata["combinedRawPayloadSizeInBytes"]
+            if max_size is not None and max_size >= 0 and total_size > max_size:
+                logging.debug(
+                    f"Payload size limit exceeded: {total_size} bytes exceeds {max_size} bytes"
+                )
+                return None, None
+            decryptor = None
+            decode = cipher_manager.open_bytes
+            if metadata.get("encoding") == AEAD_STREAM_ENCODING:
+                decryptor = cipher_manager.stream_decryptor()
+
+                def decode(payload: str | bytes) -> bytes:
+                    if isinstance(payload, str):
+                        payload = base64.b64decode(payload)
+                    return decryptor.open(payload)  # Binary envelopes carry the raw segment
+
+            manifest = json.loads(decode(message["payload"]).decode("utf-8"))
+            decompress = None
+            if decryptor is not None and metadata.get("compression"):
+                decompress = CompressionManager.decompressor(metadata["compression"], total_size)
+            receiver = FileStreamReceiver(metadata["id"], manifest, decode, decryptor, decompress)
+            receiver.timestamp = metadata.get("timestamp")
+            receiver.offer_id = metadata.get("offer")
+            return receiver, None
+
+        if receiver is None or receiver.stream_id != metadata["id"]:
+            return receiver, None  # Stream was cancelled or started before we joined
+
+        try:
+            if stage == "chunk":
+                data = receiver.decode(message["payload"])
+                if receiver.decompress is not None:
+                    data = receiver.decompress(data)
+                receiver.write(metadata["seq"], metadata["file"], data)
+                return receiver, None
+            if stage == "end":
+                if receiver.decryptor is not None:
+                    receiver.decode(message["payload"])
+                    if not receiver.decryptor.finished:
+                        raise IOError("File stream was truncated")
+                receiver.files = receiver.finish(metadata["totalChunks"])
+                return None, receiver
+        except Exception:
+            receiver.discard()
+            raise
+        return receiver, None
+
+
+class FileOffer:
+    """
+    Files a peer announced by manifest only. Nothing is transferred until the user downloads
+    them: `fetch` pulls the bytes from that peer and blocks until they are on disk.
+    """
+
+    def __init__(self, offer_id: str, manifest: list, request: callable, cancel: callable = None):
+        self.offer_id = offer_id
+        self.names = FileSpool.unique_names([entry["name"] for entry in manifest])
+        self.sizes = [int(entry["size"]) for entry in manifest]
+        self.hashes = [entry.get("hash") for entry in manifest]
+        self.request = request  # FileOffer -> Future of {file name: path on disk}
+        self.cancel = cancel  # FileOffer -> None; abandons the running pull
+        self.received_bytes = 0  # Progress of the running pull, updated by the transport
+        self.files: dict = None  # Mapping: file name -> path on disk, once pulled
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def total_size(self) -> int:
+        return sum(self.sizes)
+
+    def fetch(self, stall_timeout: float = FILE_PULL_STALL_TIMEOUT_SEC) -> dict:
+        """
+        Pulls the files (once; later calls reuse them while they are on disk).
+
+        Returns:
+            dict: A dict mapping file names to their paths on disk.
+
+        Raises:
+            TimeoutError: If the peer sends nothing for `stall_timeout` seconds.
+            IOError: If the peer no longer offers the files or the transfer fails.
+        """
+        with self._lock:
+            if self.files is not None and all(os.path.isfile(p) for p in self.files.values()):
+                return self.files
+            self.received_bytes = 0
+            future: Future = self.request(self)
+            progress = 0
+            while True:
+                try:
+                    self.files = future.result(timeout=stall_timeout)
+                    return self.files
+                except FutureTimeoutError:
+                    if self.received_bytes == progress:
+                        if self.cancel is not None:
+                            self.cancel(self)
+                        raise TimeoutError("The sending device stopped responding") from None
+                    progress = self.received_bytes
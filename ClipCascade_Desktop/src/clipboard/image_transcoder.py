@@ -0,0 +1,173 @@
+import base64
+import io
+import logging
+import time
+
+from PIL import Image, features
+from core.constants import *
+
+# Magic bytes of the formats a clipboard image can arrive in
+_SIGNATURES = [
+    (PNG_SIGNATURE, "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF8", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+]
+# Formats that are already compressed; sent as they are while small enough
+_COMPRESSED_CODECS = {"png", "jpeg", "gif", "webp"}
+
+
+class ImageTranscoder:
+    """
+    Chooses how a copied image is encoded for sending, per the `image_policy` config:
+
+    - "original": the monitor's encoding (or the image's own format), untouched.
+    - "png": lossless, optimized PNG.
+    - "webp_lossless": lossless WebP.
+    - "lossy": JPEG (WebP for images with transparency).
+    - "auto": compressed images under `image_transcode_threshold_bytes` are kept; otherwise
+      the fastest encoding that fits is used: fast PNG for uncompressed screenshots
+      (DIB/BMP/TIFF), then lossy above the threshold.
+
+    If the result still exceeds the size limit and `image_downscale` is enabled, the image
+    is downscaled (lossy encoding) until it fits.
+    """
+
+    @staticmethod
+    def codec(data: bytes) -> str:
+        """Detects the codec of encoded image bytes, or None."""
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return "webp"
+        return next((codec for magic, codec in _SIGNATURES if data.startswith(magic)), None)
+
+    @staticmethod
+    def codec_of_base64(payload: str) -> str:
+        """`codec` of a base64-encoded image payload (only the head is decoded)."""
+        try:
+            return ImageTranscoder.codec(base64.b64decode(payload[:16]))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def transcode(
+        content: Image.Image | bytes,
+        policy: str = IMAGE_POLICY_AUTO,
+        limit: int = None,
+        threshold: int = IMAGE_TRANSCODE_THRESHOLD,
+        downscale: bool = True,
+    ) -> tuple[bytes, str]:
+        """
+        Encodes a clipboard image per `policy`.
+
+        Args:
+            content (Image.Image | bytes): A PIL image, or bytes already encoded by a monitor.
+            policy (str): See the class docstring.
+            limit (int): Largest acceptable size in bytes (None: unlimited).
+            threshold (int): Size above which "auto" switches to lossy encoding.
+            downscale (bool): Allow downscaling when nothing else fits `limit`.
+
+        Returns:
+            tuple[bytes, str]: The encoded image and its codec. It may still exceed `limit`
+            if nothing fits; the caller's size check rejects it then.
+        """
+        started = time.perf_counter()
+        source = content if isinstance(content, (bytes, bytearray)) else None
+        source_codec = ImageTranscoder.codec(source) if source is not None else None
+        if source is None and content.format:
+            source_codec = content.format.lower()
+
+        def fits(size: int, bound: int = None) -> bool:
+            return (limit is None or size <= limit) and (bound is None or size <= bound)
+
+        # Keep the original when allowed
+        if source is not None and (
+            policy == IMAGE_POLICY_ORIGINAL
+            or (
+                policy == IMAGE_POLICY_AUTO
+                and source_codec in _COMPRESSED_CODECS
+                and fits(len(source), threshold)
+            )
+        ):
+            return bytes(source), source_codec
+        if policy == IMAGE_POLICY_ORIGINAL:
+            with io.BytesIO() as buffered:
+                content.save(buffered, format=content.format or "PNG")
+                return buffered.getvalue(), source_codec or "png"
+
+        img = content if source is None else ImageTranscoder._decode(source)
+        if policy == IMAGE_POLICY_PNG:
+            ladder = [("png", {"optimize": True})]
+        elif policy == IMAGE_POLICY_WEBP_LOSSLESS and features.check("webp"):
+            ladder = [("webp", {"lossless": True, "method": 1})]
+        elif policy == IMAGE_POLICY_LOSSY:
+            ladder = [ImageTranscoder._lossy(img)]
+        else:  # auto (or lossless WebP without WebP support)
+            ladder = []
+            if source_codec not in _COMPRESSED_CODECS:
+                ladder.append(("png", {"compress_level": 1}))  # Fast, and lossless
+            ladder.append(ImageTranscoder._lossy(img))
+
+        best = None
+        for index, (codec, params) in enumerate(ladder):
+            data = ImageTranscoder._encode(img, codec, **params)
+            # "auto" keeps lossless encodings only while they stay under the threshold
+            last = index == len(ladder) - 1
+            bound = threshold if policy == IMAGE_POLICY_AUTO and not last else None
+            if fits(len(data), bound):
+                best = (data, codec)
+                break
+            if best is None or len(data) < len(best[0]):
+                best = (data, codec)
+        else:
+            if downscale and limit is not None:
+                best = ImageTranscoder._downscale(img, limit, best)
+
+        data, codec = best
+        logging.info(
+            f"Image: {source_codec or 'raw'} {img.width}x{img.height} -> {codec} "
+            f"{len(data)} bytes in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return data, codec
+
+    @staticmethod
+    def _lossy(img: Image.Image) -> tuple[str, dict]:
+        if ImageTranscoder._has_alpha(img) and features.check("webp"):
+            return "webp", {"quality": IMAGE_LOSSY_QUALITY, "method": 2}
+        return "jpeg", {"quality": IMAGE_LOSSY_QUALITY, "optimize": False}
+
+    @staticmethod
+    def _downscale(img: Image.Image, limit: int, best: tuple[bytes, str]) -> tuple[bytes, str]:
+        codec, params = ImageTranscoder._lossy(img)
+        for _ in range(IMAGE_DOWNSCALE_STEPS):
+            # Encoded size scales roughly with the pixel count
+            scale = min(0.9, (limit / len(best[0])) ** 0.5 * 0.95)
+            size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+            img = img.resize(size, Image.Resampling.BILINEAR)
+            data = ImageTranscoder._encode(img, codec, **params)
+            best = (data, codec)
+            if len(data) <= limit:
+                break
+        return best
+
+    @staticmethod
+    def _has_alpha(img: Image.Image) -> bool:
+        return img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+
+    @staticmethod
+    def _decode(data: bytes) -> Image.Image:
+        with io.BytesIO(data) as image_stream:
+            img = Image.open(image_stream)
+            img.load()
+        return img
+
+    @staticmethod
+    def _encode(img: Image.Image, codec: str, **params) -> bytes:
+        if codec == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            img = img.convert("RGBA" if ImageTranscoder._has_alpha(img) else "RGB")
+        with io.BytesIO() as buffered:
+            img.save(buffered, format=codec.upper(), **params)
+            return buffered.getvalue()
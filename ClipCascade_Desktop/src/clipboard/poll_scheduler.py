@@ -0,0 +1,181 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from collections import deque
+from core.constants import *
+
+if PLATFORM == MACOS:
+    try:
+        from Quartz import (
+            CGEventSourceSecondsSinceLastEventType,
+            CGSessionCopyCurrentDictionary,
+            kCGAnyInputEventType,
+            kCGEventSourceStateCombinedSessionState,
+        )
+    except ImportError:
+        CGSessionCopyCurrentDictionary = None
+
+
+class PollScheduler:
+    """
+    Adaptive interval for clipboard monitors that have to poll (macOS, and Linux without
+    XFixes or wl-paste --watch).
+
+    Polls every `min_interval` for POLL_FAST_PERIOD_SEC after user input or a clipboard
+    change, then backs off by POLL_BACKOFF_FACTOR per idle poll up to `max_interval` (raised
+    to POLL_MAX_INTERVAL_FACTOR times `min_interval` for slow minimums, e.g. Wayland's). Polling
+    stops entirely while paused for any reason (e.g. "disconnected" from `set_paused`, or
+    "locked" while the session is locked) and resumes with an immediate poll.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = POLL_MIN_INTERVAL_SEC,
+        max_interval: float = POLL_MAX_INTERVAL_SEC,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.running = False
+        self._last_activity = time.monotonic()
+        self._deadline: float = None
+        self._pauses: set[str] = set()
+        self._wakeups: deque[float] = deque()  # Wakeups within the last minute
+        self._next_lock_check = 0.0
+        self._lock_check_failed = False
+        self._condition = threading.Condition()
+
+    def start(self, min_interval: float = None):
+        with self._condition:
+            if min_interval is not None:
+                self.min_interval = min_interval
+            self.interval = self.min_interval
+            self._last_activity = time.monotonic()
+            self._wakeups.clear()
+            self.running = True
+
+    def stop(self):
+        """Ends the current and all further waits until `start`."""
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+
+    def activity(self):
+        """A clipboard change or user input: poll fast again."""
+        with self._condition:
+            now = time.monotonic()
+            self._last_activity = now
+            self.interval = self.min_interval
+            if self._deadline is not None:
+                self._deadline = min(self._deadline, now + self.min_interval)
+            self._condition.notify_all()
+
+    def set_paused(self, reason: str, paused: bool):
+        with self._condition:
+            if paused:
+                self._pauses.add(reason)
+            else:
+                self._pauses.discard(reason)
+            self._condition.notify_all()
+
+    def wait(self) -> bool:
+        """
+        Sleeps until the next poll is due, however long a pause lasts.
+
+        Returns:
+            bool: False once stopped.
+        """
+        was_paused = False
+        while True:
+            self._check_session()
+            with self._condition:
+                if not self.running:
+                    return False
+                now = time.monotonic()
+                if self._pauses:
+                    if not was_paused:
+                        logging.debug(f"Clipboard polling paused ({', '.join(self._pauses)})")
+                    was_paused = True
+                    self._condition.wait(POLL_LOCK_CHECK_SEC)
+                    continue
+                if was_paused:
+                    self._last_activity = now
+                    self.interval = self.min_interval
+                    break
+                if self._deadline is None:
+                    self._deadline = now + self.interval
+                if now >= self._deadline:
+                    break
+                self._condition.wait(min(self._deadline - now, POLL_LOCK_CHECK_SEC))
+
+        with self._condition:
+            self._deadline = None
+            self._wakeups.append(now)
+            while self._wakeups[0] < now - 60:
+                self._wakeups.popleft()
+            if now - self._last_activity >= POLL_FAST_PERIOD_SEC:
+                cap = max(self.max_interval, self.min_interval * POLL_MAX_INTERVAL_FACTOR)
+                self.interval = min(cap, self.interval * POLL_BACKOFF_FACTOR)
+        return True
+
+    def get_stats(self) -> str:
+        with self._condition:
+            if not self.running:
+                return None
+            if self._pauses:
+                return f"Polling: paused ({', '.join(sorted(self._pauses))})"
+            now = time.monotonic()
+            wakeups = sum(1 for wakeup in self._wakeups if wakeup >= now - 60)
+            return f"Polling: {self.interval:.1f} s, {wakeups} wakeups/min"
+
+    def _check_session(self):
+        """Updates the "locked" pause and treats recent user input as activity."""
+        if PLATFORM == MACOS and CGSessionCopyCurrentDictionary is not None:
+            idle = CGEventSourceSecondsSinceLastEventType(
+                kCGEventSourceStateCombinedSessionState, kCGAnyInputEventType
+            )
+            if idle < self.min_interval:
+                self.activity()
+
+        now = time.monotonic()
+        if now < self._next_lock_check or self._lock_check_failed:
+            return
+        self._next_lock_check = now + POLL_LOCK_CHECK_SEC
+        locked = self._session_locked()
+        if locked is None:
+            self._lock_check_failed = True  # Not detectable here; never pause for it
+            return
+        self.set_paused("locked", locked)
+
+    @staticmethod
+    def _session_locked() -> bool:
+        """Whether the desktop session is locked, or None if that cannot be determined."""
+        try:
+            if PLATFORM == MACOS:
+                if CGSessionCopyCurrentDictionary is None:
+                    return None
+                session = CGSessionCopyCurrentDictionary() or {}
+                return bool(session.get("CGSSessionScreenIsLocked", False))
+            if PLATFORM.startswith(LINUX):
+                # systemd-logind's LockedHint, set by the common desktop environments
+                result = subprocess.run(
+                    [
+                        "loginctl",
+                        "show-session",
+                        os.environ.get("XDG_SESSION_ID", "auto"),
+                        "-p",
+                        "LockedHint",
+                        "--value",
+                    ],
+                    capture_output=True,
+                    timeout=2,
+                )
+                if result.returncode != 0:
+                    return None
+                return result.stdout.strip() == b"yes"
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.debug(f"Cannot determine whether the session is locked: {e}")
+        return None
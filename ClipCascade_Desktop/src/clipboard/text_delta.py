@@ -0,0 +1,150 @@
+import bisect
+import json
+
+from collections import Counter
+from core.constants import *
+
+
+class TextDelta:
+    """
+    Line-based patches between two versions of a text clipboard, so an edited copy of a
+    large text can be sent as a small patch against a version the receiver already holds.
+
+    A patch is a list of operations: a positive int copies that many lines from the base,
+    a negative int skips that many base lines, and a string is inserted as-is.
+
+    Matching lines are found in O(n log n), whatever the text: after the common head and
+    tail, lines occurring once in both versions are anchors (their longest increasing run,
+    as in patience diff), and each anchor is extended over the equal lines around it. This
+    can miss a match a full diff would find, which only makes the patch larger.
+    """
+
+    @staticmethod
+    def is_candidate(base: str, target: str) -> bool:
+        return (
+            TEXT_DELTA_MIN_SIZE <= len(target) <= TEXT_DELTA_MAX_SIZE
+            and len(base) <= TEXT_DELTA_MAX_SIZE
+        )
+
+    @staticmethod
+    def make(base: str, target: str) -> list:
+        """
+        Returns the patch turning `base` into `target`, or None if it would not be
+        meaningfully smaller than `target` itself.
+        """
+        base_lines = base.splitlines(keepends=True)
+        target_lines = target.splitlines(keepends=True)
+        patch = []
+        patch_size = 0
+        i = j = 0
+        for block_i, block_j, size in TextDelta._matching_blocks(base_lines, target_lines):
+            if block_i > i:
+                patch.append(-(block_i - i))
+            if block_j > j:
+                inserted = "".join(target_lines[j:block_j])
+                patch.append(inserted)
+                patch_size += len(inserted)
+                if patch_size > len(target) * TEXT_DELTA_MAX_RATIO:
+                    return None  # Mostly rewritten; the full text is cheaper
+            if size > 0:
+                patch.append(size)
+            i, j = block_i + size, block_j + size
+        return patch
+
+    @staticmethod
+    def _matching_blocks(a: list[str], b: list[str]) -> list[tuple[int, int, int]]:
+        """
+        Returns non-overlapping runs of equal lines as (index in a, index in b, length),
+        in increasing order, ending with the sentinel (len(a), len(b), 0).
+        """
+        head = 0
+        while head < min(len(a), len(b)) and a[head] == b[head]:
+            head += 1
+        tail = 0
+        while tail < min(len(a), len(b)) - head and a[-1 - tail] == b[-1 - tail]:
+            tail += 1
+        a_end, b_end = len(a) - tail, len(b) - tail
+
+        # Anchors: lines that occur exactly once in both middles
+        a_counts = Counter(a[head:a_end])
+        b_counts = Counter(b[head:b_end])
+        b_index = {
+            b[j]: j for j in range(head, b_end) if b_counts[b[j]] == 1 and a_counts[b[j]] == 1
+        }
+        pairs = [(i, b_index[a[i]]) for i in range(head, a_end) if a[i] in b_index]
+
+        # Longest run of anchors increasing in both a and b (patience sorting)
+        tops: list[int] = []  # Smallest b index ending a run of each length
+        top_pairs: list[int] = []  # Index into `pairs` of that run's last anchor
+        previous = [-1] * len(pairs)
+        for index, (_, j) in enumerate(pairs):
+            length = bisect.bisect_left(tops, j)
+            if length == len(tops):
+                tops.append(j)
+                top_pairs.append(index)
+            else:
+                tops[length] = j
+                top_pairs[length] = index
+            previous[index] = top_pairs[length - 1] if length > 0 else -1
+        anchors = []
+        index = top_pairs[-1] if top_pairs else -1
+        while index >= 0:
+            anchors.append(pairs[index])
+            index = previous[index]
+        anchors.reverse()
+
+        blocks = [(0, 0, head)] if head else []
+        i_done, j_done = head, head  # End of the last block
+        for i, j in anchors:
+            if i < i_done or j < j_done:
+                continue  # Inside the previous block's extension
+            start_i, start_j = i, j
+            while start_i > i_done and start_j > j_done and a[start_i - 1] == b[start_j - 1]:
+                start_i -= 1
+                start_j -= 1
+            end_i, end_j = i + 1, j + 1
+            while end_i < a_end and end_j < b_end and a[end_i] == b[end_j]:
+                end_i += 1
+                end_j += 1
+            blocks.append((start_i, start_j, end_i - start_i))
+            i_done, j_done = end_i, end_j
+        if tail:
+            blocks.append((a_end, b_end, tail))
+        blocks.append((len(a), len(b), 0))
+        return blocks
+
+    @staticmethod
+    def apply(base: str, patch: list) -> str:
+        """
+        Applies a patch produced by `make`.
+
+        Raises:
+            ValueError: If the patch does not fit `base`.
+        """
+        base_lines = base.splitlines(keepends=True)
+        position = 0
+        parts = []
+        for operation in patch:
+            if isinstance(operation, str):
+                parts.append(operation)
+            elif isinstance(operation, int) and operation >= 0:
+                if position + operation > len(base_lines):
+                    raise ValueError("Patch does not match its base")
+                parts.extend(base_lines[position : position + operation])
+                position += operation
+            elif isinstance(operation, int):
+                position -= operation
+            else:
+                raise ValueError(f"Invalid patch operation: {operation!r}")
+        if position != len(base_lines):
+            raise ValueError("Patch does not match its base")
+        return "".join(parts)
+
+    @staticmethod
+    def encode(base_digest: str, target_digest: str, patch: list) -> str:
+        """Payload of a `TEXT_DELTA_TYPE` message (encrypted like any other payload)."""
+        return json.dumps({"base": base_digest, "hash": target_digest, "patch": patch})
+
+    @staticmethod
+    def decode(payload: str) -> dict:
+        return json.loads(payload)
@@ -0,0 +1,94 @@
+import logging
+import threading
+
+from core.constants import *
+
+
+class UpdateDebouncer:
+    """
+    Collapses bursts of clipboard updates before they are converted and sent. Applications
+    often set the clipboard several times in a row (e.g. one format after another); each
+    update would otherwise start a full encode/encrypt/send cycle and cancel the previous one.
+
+    An update is held for `window` seconds and only the latest of a burst is delivered. Text
+    of at most `immediate_text_size` characters is delivered at once, since it is cheap to
+    send and users expect it without delay; it also replaces a held update. Replaced updates
+    are counted in `suppressed`.
+    """
+
+    def __init__(
+        self,
+        callback,
+        window: float = CLIPBOARD_DEBOUNCE_MS / 1000,
+        immediate_text_size: int = CLIPBOARD_DEBOUNCE_TEXT_SIZE,
+    ):
+        self.callback = callback  # Called with (type_, content)
+        self.window = window
+        self.immediate_text_size = immediate_text_size
+        self.suppressed = 0
+        self._pending: tuple = None  # (sequence, type_, content)
+        self._timer: threading.Timer = None
+        self._sequence = 0
+        self._delivered_sequence = 0
+        self._lock = threading.Lock()
+        self._deliver_lock = threading.Lock()  # Delivers one update at a time, in order
+
+    def update(self, type_: str, content: any):
+        """Takes an update from a clipboard monitor."""
+        immediate = self.window <= 0 or (
+            type_ == "text"
+            and isinstance(content, str)
+            and len(content) <= self.immediate_text_size
+        )
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+            if self._pending is not None:
+                self._suppress(self._pending[1])
+                self._pending = None
+            if immediate:
+                self._cancel_timer()
+            else:
+                self._pending = (sequence, type_, content)
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if immediate:
+            self._deliver(sequence, type_, content)
+
+    def flush(self):
+        """Delivers the held update, if any, now."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._cancel_timer()
+        if pending is not None:
+            self._deliver(*pending)
+
+    def cancel(self):
+        """Drops the held update (e.g. when monitoring stops)."""
+        with self._lock:
+            self._pending = None
+            self._cancel_timer()
+
+    def get_stats(self) -> str:
+        if self.suppressed == 0:
+            return None
+        return f"Debounced: {self.suppressed}"
+
+    def _deliver(self, sequence: int, type_: str, content: any):
+        with self._deliver_lock:
+            if sequence < self._delivered_sequence:
+                self._suppress(type_)  # A newer update was delivered meanwhile
+                return
+            self._delivered_sequence = sequence
+            self.callback(type_, content)
+
+    def _suppress(self, type_: str):
+        self.suppressed += 1
+        logging.debug(f"Superseded {type_} clipboard update dropped ({self.suppressed} in total)")
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
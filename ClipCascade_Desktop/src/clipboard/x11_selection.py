@@ -0,0 +1,334 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+
+from core.constants import *
+
+# Xlib / XFixes protocol constants
+_PROPERTY_CHANGE_MASK = 1 << 22
+_PROPERTY_NOTIFY = 28
+_SELECTION_NOTIFY = 31
+_PROPERTY_NEW_VALUE = 0
+_ANY_PROPERTY_TYPE = 0
+_CURRENT_TIME = 0
+_SUCCESS = 0
+_XFIXES_SELECTION_NOTIFY = 0
+_XFIXES_SET_SELECTION_OWNER_NOTIFY_MASK = 1
+
+
+class _XSelectionEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("serial", ctypes.c_ulong),
+        ("send_event", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("requestor", ctypes.c_ulong),
+        ("selection", ctypes.c_ulong),
+        ("target", ctypes.c_ulong),
+        ("property", ctypes.c_ulong),
+        ("time", ctypes.c_ulong),
+    ]
+
+
+class _XPropertyEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("serial", ctypes.c_ulong),
+        ("send_event", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("window", ctypes.c_ulong),
+        ("atom", ctypes.c_ulong),
+        ("time", ctypes.c_ulong),
+        ("state", ctypes.c_int),
+    ]
+
+
+class _XFixesSelectionNotifyEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("serial", ctypes.c_ulong),
+        ("send_event", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("window", ctypes.c_ulong),
+        ("subtype", ctypes.c_int),
+        ("owner", ctypes.c_ulong),
+        ("selection", ctypes.c_ulong),
+        ("timestamp", ctypes.c_ulong),
+        ("selection_timestamp", ctypes.c_ulong),
+    ]
+
+
+class _XEvent(ctypes.Union):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("selection", _XSelectionEvent),
+        ("property", _XPropertyEvent),
+        ("xfixes", _XFixesSelectionNotifyEvent),
+        ("pad", ctypes.c_long * 24),
+    ]
+
+
+_X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+
+@_X_ERROR_HANDLER
+def _on_x_error(display, error):
+    # Xlib's default handler exits the process; a failed request only fails that read
+    logging.debug("X11 request failed")
+    return 0
+
+
+def _load_libraries():
+    x11 = ctypes.CDLL(ctypes.util.find_library("X11") or "libX11.so.6")
+    xfixes = ctypes.CDLL(ctypes.util.find_library("Xfixes") or "libXfixes.so.3")
+    ulong, pointer, c_int = ctypes.c_ulong, ctypes.c_void_p, ctypes.c_int
+
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XOpenDisplay.restype = pointer
+    x11.XCloseDisplay.argtypes = [pointer]
+    x11.XDefaultRootWindow.argtypes = [pointer]
+    x11.XDefaultRootWindow.restype = ulong
+    x11.XCreateSimpleWindow.argtypes = (
+        [pointer, ulong, c_int, c_int] + [ctypes.c_uint] * 3 + [ulong] * 2
+    )
+    x11.XCreateSimpleWindow.restype = ulong
+    x11.XDestroyWindow.argtypes = [pointer, ulong]
+    x11.XSelectInput.argtypes = [pointer, ulong, ctypes.c_long]
+    x11.XInternAtom.argtypes = [pointer, ctypes.c_char_p, c_int]
+    x11.XInternAtom.restype = ulong
+    x11.XGetAtomName.argtypes = [pointer, ulong]
+    x11.XGetAtomName.restype = pointer
+    x11.XFree.argtypes = [pointer]
+    x11.XConvertSelection.argtypes = [pointer, ulong, ulong, ulong, ulong, ulong]
+    x11.XGetSelectionOwner.argtypes = [pointer, ulong]
+    x11.XGetSelectionOwner.restype = ulong
+    x11.XGetWindowProperty.argtypes = [
+        pointer,
+        ulong,
+        ulong,
+        ctypes.c_long,
+        ctypes.c_long,
+        c_int,
+        ulong,
+        ctypes.POINTER(ulong),
+        ctypes.POINTER(c_int),
+        ctypes.POINTER(ulong),
+        ctypes.POINTER(ulong),
+        ctypes.POINTER(pointer),
+    ]
+    x11.XDeleteProperty.argtypes = [pointer, ulong, ulong]
+    x11.XPending.argtypes = [pointer]
+    x11.XNextEvent.argtypes = [pointer, ctypes.POINTER(_XEvent)]
+    x11.XFlush.argtypes = [pointer]
+    x11.XConnectionNumber.argtypes = [pointer]
+    x11.XSetErrorHandler.argtypes = [_X_ERROR_HANDLER]
+    x11.XSetErrorHandler.restype = pointer
+    xfixes.XFixesQueryExtension.argtypes = [pointer, ctypes.POINTER(c_int), ctypes.POINTER(c_int)]
+    xfixes.XFixesSelectSelectionInput.argtypes = [pointer, ulong, ulong, ulong]
+    return x11, xfixes
+
+
+class X11Selection:
+    """
+    In-process reader of the X11 CLIPBOARD selection (Xlib and XFixes through ctypes, no
+    extra dependency). `wait_for_change` sleeps until the selection owner changes
+    (XFixesSelectionNotify) instead of polling, and targets and content are converted on a
+    private, unmapped window, including INCR transfers of large content.
+    """
+
+    def __init__(self, x11, xfixes, display, event_base: int):
+        self.x11 = x11
+        self.display = display
+        self.event_base = event_base
+        root = x11.XDefaultRootWindow(display)
+        self.window = x11.XCreateSimpleWindow(display, root, 0, 0, 1, 1, 0, 0, 0)
+        x11.XSelectInput(display, self.window, _PROPERTY_CHANGE_MASK)
+        self.clipboard = self.atom("CLIPBOARD")
+        self.property = self.atom(f"{APP_NAME.upper()}_SELECTION")
+        self.incr = self.atom("INCR")
+        xfixes.XFixesSelectSelectionInput(
+            display, self.window, self.clipboard, _XFIXES_SET_SELECTION_OWNER_NOTIFY_MASK
+        )
+        x11.XFlush(display)
+        self.fd = x11.XConnectionNumber(display)
+        self.changed = True  # Read the current clipboard once at start
+        self.owner_timestamp: int = None  # Selection timestamp of the last owner change
+
+    @staticmethod
+    def open() -> "X11Selection | None":
+        """Connects to $DISPLAY; returns None if Xlib, the display or XFixes is unavailable."""
+        try:
+            x11, xfixes = _load_libraries()
+        except (OSError, AttributeError) as e:
+            logging.debug(f"Xlib/XFixes libraries unavailable: {e}")
+            return None
+        display = x11.XOpenDisplay(None)
+        if not display:
+            logging.debug("Cannot open the X display")
+            return None
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not xfixes.XFixesQueryExtension(
+            display, ctypes.byref(event_base), ctypes.byref(error_base)
+        ):
+            logging.debug("The X server does not support XFixes")
+            x11.XCloseDisplay(display)
+            return None
+        x11.XSetErrorHandler(_on_x_error)
+        return X11Selection(x11, xfixes, display, event_base.value)
+
+    def close(self):
+        if self.display:
+            self.x11.XDestroyWindow(self.display, self.window)
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+    def atom(self, name: str) -> int:
+        return self.x11.XInternAtom(self.display, name.encode("utf-8"), 0)
+
+    def atom_name(self, atom: int) -> str:
+        pointer = self.x11.XGetAtomName(self.display, atom)
+        if not pointer:
+            return ""
+        try:
+            return ctypes.string_at(pointer).decode("utf-8", errors="replace")
+        finally:
+            self.x11.XFree(pointer)
+
+    def wait_for_change(self, wake_fd: int) -> bool:
+        """
+        Blocks until the clipboard owner changes. Bursts of owner changes are coalesced.
+
+        Returns:
+            bool: False if woken through `wake_fd` (stop) instead.
+        """
+        while not self.changed:
+            if self._next_event(lambda event: False, None, wake_fd) == "wake":
+                return False
+        self.changed = False
+        return True
+
+    def targets(self) -> list[str] | None:
+        """The MIME types / targets the current owner offers, or None."""
+        data = self.read("TARGETS")
+        if data is None:
+            return None
+        count = len(data) // ctypes.sizeof(ctypes.c_ulong)
+        atoms = (ctypes.c_ulong * count).from_buffer_copy(data, 0)
+        return [name for name in (self.atom_name(atom) for atom in atoms) if name]
+
+    def read(self, target: str) -> bytes | None:
+        """Converts the selection to `target`; returns None if the owner refuses or times out."""
+        self.x11.XConvertSelection(
+            self.display,
+            self.clipboard,
+            self.atom(target),
+            self.property,
+            self.window,
+            _CURRENT_TIME,
+        )
+        self.x11.XFlush(self.display)
+        event = self._next_event(
+            lambda event: event.type == _SELECTION_NOTIFY
+            and event.selection.requestor == self.window,
+            X11_SELECTION_TIMEOUT_SEC,
+        )
+        if not isinstance(event, _XEvent) or event.selection.property == 0:
+            return None
+
+        property_type, data = self._get_property(delete=True)
+        if property_type != self.incr:
+            return data
+
+        # INCR: the owner sends the content in pieces, each after we delete the last one
+        chunks = bytearray()
+        while True:
+            event = self._next_event(
+                lambda event: event.type == _PROPERTY_NOTIFY
+                and event.property.window == self.window
+                and event.property.atom == self.property
+                and event.property.state == _PROPERTY_NEW_VALUE,
+                X11_SELECTION_TIMEOUT_SEC,
+            )
+            if not isinstance(event, _XEvent):
+                logging.debug(f"Incremental transfer of {target} timed out")
+                return None
+            _, chunk = self._get_property(delete=True)
+            if not chunk:
+                return bytes(chunks)
+            chunks += chunk
+
+    def _get_property(self, delete: bool) -> tuple[int, bytes]:
+        data = bytearray()
+        offset = 0
+        property_type = ctypes.c_ulong()
+        property_format = ctypes.c_int()
+        items = ctypes.c_ulong()
+        remaining = ctypes.c_ulong()
+        pointer = ctypes.c_void_p()
+        while True:
+            status = self.x11.XGetWindowProperty(
+                self.display,
+                self.window,
+                self.property,
+                offset,
+                X11_PROPERTY_CHUNK_LONGS,
+                0,
+                _ANY_PROPERTY_TYPE,
+                ctypes.byref(property_type),
+                ctypes.byref(property_format),
+                ctypes.byref(items),
+                ctypes.byref(remaining),
+                ctypes.byref(pointer),
+            )
+            if status != _SUCCESS or property_type.value == 0:
+                break
+            # Xlib returns 32-bit items as C longs
+            if property_format.value == 32:
+                unit = ctypes.sizeof(ctypes.c_long)
+            else:
+                unit = property_format.value // 8
+            if pointer.value:
+                data += ctypes.string_at(pointer, items.value * unit)
+                self.x11.XFree(pointer)
+                pointer.value = None
+            offset += items.value * property_format.value // 32
+            if remaining.value == 0:
+                break
+        if delete:
+            self.x11.XDeleteProperty(self.display, self.window, self.property)
+            self.x11.XFlush(self.display)
+        return property_type.value, bytes(data)
+
+    def _next_event(self, predicate, timeout: float | None, wake_fd: int = None):
+        """
+        Processes X events until `predicate` matches one (returned as a copy), the timeout
+        passes (None) or `wake_fd` becomes readable ("wake"). Owner changes seen meanwhile
+        set `changed`; they also end a wait without a predicate.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        event = _XEvent()
+        while True:
+            while self.x11.XPending(self.display):
+                self.x11.XNextEvent(self.display, ctypes.byref(event))
+                if event.type == self.event_base + _XFIXES_SELECTION_NOTIFY:
+                    self.changed = True
+                    self.owner_timestamp = event.xfixes.selection_timestamp
+                    continue
+                if predicate(event):
+                    copy = _XEvent()
+                    ctypes.pointer(copy)[0] = event
+                    return copy
+            if self.changed and wake_fd is not None:
+                return None
+
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                return None
+            descriptors = [self.fd] if wake_fd is None else [self.fd, wake_fd]
+            readable, _, _ = select.select(descriptors, [], [], wait)
+            if wake_fd is not None and wake_fd in readable:
+                os.read(wake_fd, 64)
+                return "wake"
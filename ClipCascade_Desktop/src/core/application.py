@@ -6,6 +6,7 @@ from core.constants import *
 
 from core.config import Config
 from utils.request_manager import RequestManager
+from utils.aead_manager import AEADManager
 from utils.cipher_manager import CipherManager
 from stomp_ws.stomp_manager import STOMPManager
 from p2p.p2p_manager import P2PManager
@@ -131,6 +132,7 @@ class Application:
         # enable login form
         used_saved_credentials = False
         display_login_success_dialog = False
+        key_future = None
         if PLATFORM.startswith(LINUX) and LINUX_USE_CLI_UI:
             Echo("═" * 14 + "\n║ LOGIN FORM ║\n" + "═" * 14)
         while True:
@@ -160,6 +162,9 @@ class Application:
                 self.config.data["password"] = (
                     CipherManager.string_to_sha3_512_lowercase_hex(raw_password)
                 )  # Hash the password
+                if self.config.data["cipher_enabled"]:
+                    # PBKDF2 takes seconds on slow devices; run it while logging in
+                    key_future = self.cipher_manager.hash_password_async(raw_password)
 
             login_successful, msg_login, self.config.data["cookie"] = (
                 self.request_manager.login()
@@ -184,7 +189,9 @@ class Application:
                     self._get_ws_manager().is_login_phase = False
                     if self.config.data["cipher_enabled"]:
                         self.config.data["hashed_password"] = (
-                            self.cipher_manager.hash_password(raw_password)
+                            key_future.result()
+                            if key_future is not None
+                            else self.cipher_manager.hash_password(raw_password)
                         )
                     if not self.config.data["save_password"]:
                         self.config.data["password"] = ""
@@ -205,6 +212,7 @@ class Application:
                 CustomDialog("Login Failed\n" + msg_login, msg_type="error").mainloop()
 
             raw_password = None  # Clear the raw password
+            key_future = None
             if PLATFORM.startswith(LINUX) and LINUX_USE_CLI_UI:
                 Echo("-" * 53)
 
@@ -254,6 +262,7 @@ class Application:
         try:
             self._get_ws_manager().disconnect()
             self.request_manager.logout()
+            self.cipher_manager.key_manager.forget_key()
             self.config.data["hashed_password"] = None
             self.config.data["cookie"] = None
             self.config.data["maxsize"] = None
@@ -277,6 +286,7 @@ class Application:
             self.setup_logging()
             self.ensure_single_instance()
             self.config.load()
+            AEADManager.load_benchmark(self.config)
             self.authenticate_and_connect()
             self.config.save()
             update_available = self.get_version_update_status()
@@ -3,11 +3,13 @@ import json
 import os
 import re
 from core.constants import *
+from utils.key_manager import KeyManager
 
 
 class Config:
     def __init__(self, file_name=DATA_FILE_NAME):
         self.file_name = file_name
+        self.keyring_key: bytes = None  # The derived key as stored in the keyring, if any
         self.data = {
             "cipher_enabled": True,
             "server_url": "http://localhost:8080",
@@ -29,6 +31,25 @@ class Config:
             "server_mode": "P2S",
             "stun_url": "",
             "ssl_ca_bundle": "",
+            # P2S cannot negotiate with other devices, so wire-protocol extensions
+            # (e.g. streamed files) are only used when every device supports them.
+            "p2s_extensions_enabled": False,
+            # Keep the derived key in the OS keyring (if the `keyring` package is installed)
+            # instead of this file; later logins with the same password skip PBKDF2.
+            "keyring_enabled": False,
+            # AEAD micro-benchmark from the first launch (see AEADManager.load_benchmark)
+            "aead_benchmark": None,
+            # Processes for pure-Python clipboard work (e.g. text diffs); 0 uses threads only
+            "worker_processes": 0,
+            # Copied images: "auto", "original", "png", "webp_lossless" or "lossy"
+            # (see ImageTranscoder); downscaling only happens when nothing else fits
+            "image_policy": IMAGE_POLICY_AUTO,
+            "image_transcode_threshold_bytes": IMAGE_TRANSCODE_THRESHOLD,
+            "image_downscale": True,
+            # P2P: copied files are only announced; each device pulls them on "Download File(s)"
+            "lazy_files_enabled": True,
+            # Bursts of clipboard updates within this window are sent once (0: send each)
+            "clipboard_debounce_ms": CLIPBOARD_DEBOUNCE_MS,
         }
 
     def save(self):
@@ -37,7 +58,13 @@ class Config:
         """
         try:
             temp = self.data.copy()
-            if self.data.get("cipher_enabled") and self.data.get("hashed_password"):
+            if (
+                self.data.get("hashed_password")
+                and self.data.get("keyring_enabled")
+                and self.keyring_key == self.data["hashed_password"]
+            ):
+                temp["hashed_password"] = None  # Kept in the keyring
+            if self.data.get("cipher_enabled") and temp.get("hashed_password"):
                 temp["hashed_password"] = base64.b64encode(
                     temp["hashed_password"]
                 ).decode("utf-8")
@@ -60,6 +87,8 @@ class Config:
                     self.data["hashed_password"] = base64.b64decode(
                         self.data["hashed_password"]
                     )
+                elif self.data.get("keyring_enabled") and self.data.get("cookie"):
+                    self.data["hashed_password"] = KeyManager(self).load_key()
                 return True
             except Exception as e:
                 logging.error(f"Failed to load data: {e}")
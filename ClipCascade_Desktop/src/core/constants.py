@@ -187,12 +187,132 @@ P2P_DC_HEARTBEAT_INTERVAL_SEC = 20
 # After sleep, aiortc RTCPeerConnection.close() can block; cap wait so the asyncio
 # thread does not stall (which would also block processing ASSIGNED_ID / PEER_LIST).
 P2P_PC_CLOSE_TIMEOUT_SEC = 5.0
+# Data-channel flow control: stop sending above HIGH buffered bytes, resume below LOW.
+P2P_SEND_BUFFER_HIGH = 262144  # 256 KiB
+P2P_SEND_BUFFER_LOW = 65536  # 64 KiB
+P2P_SEND_QUEUE_SIZE = 16  # messages queued per peer before the sender waits
+P2P_SEND_IDLE_SEC = 2.0  # throughput stats restart after this long without sending
+# Incoming transfers reassembled at the same time (per peer and message id)
+P2P_MAX_CONCURRENT_TRANSFERS = 8
+P2P_REASSEMBLY_MAX_BYTES = 134217728  # 128 MiB buffered across all incoming transfers
+P2P_TRANSFER_TIMEOUT_SEC = 60  # drop a transfer that receives nothing for this long
+# Sent fragments kept for retransmission after a data-channel rebuild
+P2P_RESUME_CACHE_TRANSFERS = 4
+P2P_RESUME_CACHE_BYTES = 67108864  # 64 MiB
 
 LOG_FILE_NAME = "clipcascade_log.log"
 LOG_LEVEL = logging.INFO  # Use valid levels: DEBUG, INFO, WARNING, ERROR, CRITICAL
 DATA_FILE_NAME = "DATA"
 MAX_SIZE = 1048576  # 1 MiB
 FRAGMENT_SIZE = 15360  # 15 KiB
+# Raw file bytes per streamed chunk; an encrypted, base64-encoded chunk message stays below FRAGMENT_SIZE.
+FILE_STREAM_CHUNK_SIZE = 8192  # 8 KiB
+FILE_STREAM_TYPE = "files_stream"
+FILE_TREE_MAX_FILES = 10000  # copied directories are walked recursively up to this many files
+# Copied files this large are read one window at a time into a reused buffer; see FileIngest
+FILE_WINDOW_THRESHOLD = 4194304  # 4 MiB
+# 12 MiB: a multiple of 3 (windows are base64-encoded separately)
+FILE_WINDOW_SIZE = 12582912
+# Received files are spooled to disk under the program directory until downloaded; legacy
+# payloads keep up to FILE_SPOOL_MEMORY_LIMIT bytes in memory. See FileSpool.
+FILE_SPOOL_DIRECTORY_NAME = "received_files"
+FILE_SPOOL_MEMORY_LIMIT = 8388608  # 8 MiB
+FILE_SPOOL_TTL_SEC = 3600  # the download option (and spooled files) expire after an hour
+# A download of offered files fails once the sending peer sends nothing for this long
+FILE_PULL_STALL_TIMEOUT_SEC = 30
+# Chunked AEAD (STREAM construction): plaintext bytes per independently authenticated segment;
+# a base64-encoded segment plus message envelope stays below FRAGMENT_SIZE.
+AEAD_STREAM_ENCODING = "aead_stream"
+AEAD_SEGMENT_SIZE = 10240  # 10 KiB
+AES_KEY_SIZE = 32  # 256 bits for AES-256
+GCM_NONCE_SIZE = 16  # pycryptodome's default, kept for compatibility with older clients
+AEAD_TAG_SIZE = 16
+# AEAD algorithms for chunked-AEAD streams (see AEADManager); older clients only know AES-GCM
+AEAD_AES_GCM = "aes_gcm"
+AEAD_CHACHA20_POLY1305 = "chacha20_poly1305"
+AEAD_CAP_PREFIX = "aead_"  # P2P capability prefix, e.g. "aead_chacha20_poly1305"
+AEAD_BENCHMARK_SIZE = 1048576  # 1 MiB
+AEAD_BENCHMARK_ROUNDS = 3
+# Worker pool for CPU-heavy clipboard work (see WorkerPool)
+WORKER_POOL_THREADS = max(2, min(4, os.cpu_count() or 1))
+WORKER_POOL_MAX_PENDING = 8
+WORKER_BATCH_SEGMENTS = 64  # segments/messages produced per worker job while sending
+# Compression stage (before encryption); payloads below COMPRESSION_MIN_SIZE are sent as-is
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_MIN_SIZE = 512  # bytes
+COMPRESSION_ZSTD_MIN_SIZE = 65536  # 64 KiB; smaller payloads use zlib
+# zstd decompresses this much input per call; a zstd block expands at most 32768:1, so one
+# call yields at most 32 MiB however the data was crafted
+COMPRESSION_ZSTD_FEED_SIZE = 1024  # bytes
+COMPRESSION_CAP_PREFIX = "compress_"
+
+# Optional wire-protocol extensions advertised to P2P peers in the data-channel keepalive.
+# Older clients ignore unknown keepalive fields and keep receiving the legacy JSON format.
+P2P_CAP_FILE_STREAM = "file_stream"
+P2P_CAP_CHUNKED_AEAD = AEAD_STREAM_ENCODING
+# Binary data-channel messages (see p2p/envelope.py) instead of JSON for chunked-AEAD fragments
+P2P_CAP_BINARY_ENVELOPE = "binary_envelope"
+# Resume partial transfers after a data-channel rebuild (see p2p/resume.py)
+P2P_CAP_RESUME = "resume"
+# Paste a recently synced item from the local cache when a peer sends its digest
+P2P_CAP_CACHE_REF = "cache_ref"
+P2P_CAP_TEXT_DELTA = "text_delta"
+# Announce copied files by manifest only; the bytes are pulled when the user downloads them
+P2P_CAP_FILE_PULL = "file_pull"
+# Copied directories (relative file names) and small files packed into shared chunks
+P2P_CAP_FILE_TREE = "file_tree"
+P2P_CAPABILITIES = [
+    P2P_CAP_FILE_STREAM,
+    P2P_CAP_CHUNKED_AEAD,
+    P2P_CAP_BINARY_ENVELOPE,
+    P2P_CAP_RESUME,
+    P2P_CAP_CACHE_REF,
+    P2P_CAP_TEXT_DELTA,
+    P2P_CAP_FILE_PULL,
+    P2P_CAP_FILE_TREE,
+]
+
+# Recently synced clipboard items kept for reference-only re-sends
+CLIPBOARD_CACHE_ITEMS = 32
+CLIPBOARD_CACHE_BYTES = 67108864  # 64 MiB
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"  # Received PNGs are pasted as-is on Linux
+# Image transcoding policies (see ImageTranscoder)
+IMAGE_POLICY_AUTO = "auto"
+IMAGE_POLICY_ORIGINAL = "original"
+IMAGE_POLICY_PNG = "png"
+IMAGE_POLICY_WEBP_LOSSLESS = "webp_lossless"
+IMAGE_POLICY_LOSSY = "lossy"
+IMAGE_TRANSCODE_THRESHOLD = 8388608  # 8 MiB; "auto" switches to lossy above this
+IMAGE_LOSSY_QUALITY = 85
+IMAGE_DOWNSCALE_STEPS = 3
+# Text delta sync: edited text is sent as a line patch against a version the receiver holds
+TEXT_DELTA_TYPE = "text_delta"
+TEXT_DELTA_MISS_TYPE = "text_delta_miss"  # P2S: a receiver lacks the base, resend in full
+TEXT_DELTA_MIN_SIZE = 4096  # characters; smaller texts are sent in full
+TEXT_DELTA_MAX_SIZE = 4194304  # characters; larger texts are not diffed
+TEXT_DELTA_MAX_RATIO = 0.5  # send the full text if the inserted text exceeds this share
+# Clipboard updates are held this long and only the latest of a burst is sent (see
+# UpdateDebouncer); text up to CLIPBOARD_DEBOUNCE_TEXT_SIZE characters is sent at once
+CLIPBOARD_DEBOUNCE_MS = 150
+CLIPBOARD_DEBOUNCE_TEXT_SIZE = 4096  # characters
+# Adaptive clipboard polling (see PollScheduler): fast after activity, then exponential backoff
+POLL_MIN_INTERVAL_SEC = 0.3
+POLL_MAX_INTERVAL_SEC = 2.0
+POLL_MAX_INTERVAL_FACTOR = 5  # idle polls back off to at least this many minimum intervals
+POLL_BACKOFF_FACTOR = 1.5
+POLL_FAST_PERIOD_SEC = 10  # polls stay at the minimum interval this long after activity
+POLL_LOCK_CHECK_SEC = 10  # the session lock state is checked this often
+# Windows: WM_CLIPBOARDUPDATE bursts are read once this long after the last update (capped);
+# OpenClipboard is retried with exponential backoff while another application holds it
+WIN_CLIPBOARD_COALESCE_SEC = 0.05
+WIN_CLIPBOARD_COALESCE_MAX_SEC = 0.5
+WIN_CLIPBOARD_RETRIES = 6
+WIN_CLIPBOARD_RETRY_DELAY_SEC = 0.01  # doubled per retry: 10 ms .. 160 ms
+# Linux X11: event-driven monitoring through XFixes (see X11Selection); polling is the fallback
+X11_SELECTION_TIMEOUT_SEC = 2.0  # an owner that does not answer a conversion is skipped
+X11_PROPERTY_CHUNK_LONGS = 262144  # 1 MiB read per XGetWindowProperty call
+
 SUBSCRIPTION_DESTINATION = "/user/queue/cliptext"
 SEND_DESTINATION = "/app/cliptext"
 LOGIN_URL = "/login"
@@ -8,6 +8,8 @@ import webbrowser
 from pystray import Icon, MenuItem as item, Menu
 from PIL import Image, ImageDraw
 
+from clipboard.file_spool import FileSpool
+from clipboard.file_stream import FileOffer
 from core.config import Config
 from gui.info import CustomDialog
 from core.constants import *
@@ -366,12 +368,10 @@ class TaskbarPanel:
                     timeout=5000,
                 ).mainloop()
 
+            if isinstance(files, FileOffer):
+                files = files.fetch()  # Announced only: pull the bytes from the sender now
             # Save each file to the chosen directory
-            for filename, file_obj in files.items():
-                file_path = os.path.join(target_directory, filename)
-                with open(file_path, "wb") as f:
-                    f.write(file_obj.getvalue())
-                logging.debug(f"Saved: {file_path}")
+            FileSpool.save_files(files, target_directory)
 
         except Exception as e:
             msg = f"An error occurred while downloading files. Error: {e}"
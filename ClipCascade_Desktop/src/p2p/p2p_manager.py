@@ -1,3 +1,4 @@
+import base64
 import json
 import logging
 import time
@@ -5,14 +6,25 @@ import websocket
 import asyncio
 import uuid
 
+from concurrent.futures import Future
 from threading import Lock, Thread
 from typing import Dict, List, Optional
 from core.config import Config
 from interfaces.ws_interface import WSInterface
 from utils.cipher_manager import CipherManager
+from utils.aead_manager import AEADManager
+from utils.compression_manager import CompressionManager
 from clipboard.clipboard_manager import ClipboardManager
+from clipboard.file_stream import FileOffer, FileStream, FileStreamReceiver
+from clipboard.image_transcoder import ImageTranscoder
+from clipboard.text_delta import TextDelta
+from p2p.envelope import Envelope
+from p2p.send_scheduler import SendScheduler
+from p2p.reassembly import Transfer, TransferTable
+from p2p.resume import SentTransfer, SentTransferCache
 from utils.notification_manager import NotificationManager
 from utils.request_manager import RequestManager
+from utils.worker_pool import StaleJobError, WorkerPool
 from utils.ssl_helper import websocket_sslopt_for_config
 from core.constants import *
 from aiortc import (
@@ -34,6 +46,7 @@ class P2PManager(WSInterface):
         self.config = config
         self.clipboard_manager = ClipboardManager(self.config)
         self.cipher_manager = CipherManager(self.config)
+        self.compression_manager = CompressionManager()
         self.notification_manager = NotificationManager(self.config)
         self.sys_tray: TaskbarPanel = None
         self.first_conn_lost = True
@@ -46,10 +59,27 @@ class P2PManager(WSInterface):
         self.is_clipboard_monitoring_on = False
 
         # Fragment variables
-        self.sending_fragment_id = ""  # The id of the fragment currently being sent
-        self.receiving_fragments: dict = {}  # Mapping: fragmentid:str -> fragment:list[str]
+        self.sending_fragment_id = ""  # The id of the clipboard send in progress
+        # Incoming fragmented payloads, keyed by (peer_id, fragment id)
+        self.receiving_transfers = TransferTable()
         self.sending_fragment_stats: str = None
+        # Progress of each wire-format group of the current send. Mapping: id -> (sent, total)
+        self.sending_progress: dict[str, tuple[int, int]] = {}
         self.receiving_fragment_stats: str = None
+        self.receiving_file_streams: dict[str, FileStreamReceiver] = {}  # Mapping: peer_id -> receiver
+        # Completed transfers are ordered on the local monotonic clock: a transfer that started
+        # before the last applied one (or before the last local copy) is ignored. Sender
+        # timestamps (ms) are only compared between transfers of the same peer, since device
+        # clocks differ. Mapping: peer_id -> sender timestamp of its last applied clipboard
+        self.latest_clipboard_started: float = 0.0
+        self.peer_clipboard_timestamps: dict[str, int] = {}
+        self.local_copy_time: float = 0.0
+        # Lazy files: our latest offer as (offer id, files, peer ids it was sent to), and the
+        # pulls we are waiting on. Mapping: offer id -> (offer, future, peer_id)
+        self.file_offer: tuple[str, FileStream, set[str]] = None
+        self.file_pulls: dict[str, tuple[FileOffer, Future, str]] = {}
+        # Pulls of our offer being served. Mapping: (peer_id, offer id) -> task
+        self.file_serves: dict[tuple[str, str], asyncio.Future] = {}
 
         # p2p variables
         self.my_peer_id: str = None  # Own peer id assigned by the server
@@ -58,6 +88,12 @@ class P2PManager(WSInterface):
             {}
         )  # Mapping: peer_id -> RTCPeerConnection
         self.data_channels: dict[str, RTCDataChannel] = {}  # Mapping: peer_id -> DataChannel
+        # Mapping: peer_id -> wire-protocol extensions advertised in the peer's keepalive
+        self.peer_capabilities: dict[str, set[str]] = {}
+        # Flow-controlled per-peer send queues (keepalives bypass them)
+        self.send_scheduler = SendScheduler(self.data_channels.get)
+        # Recently sent fragments, retransmitted to peers that resume after a channel rebuild
+        self.sent_transfers = SentTransferCache()
         self.live_connections: int = 0  # Number of open data channels (derived; see _sync)
         self._live_connections_lock = Lock()
         # If PEER_LIST arrives before ASSIGNED_ID (e.g. right after signaling reconnect), mesh setup waits.
@@ -89,7 +125,7 @@ class P2PManager(WSInterface):
         self._dc_heartbeat_handle = None
         if self.disconnected or self._p2p_shutting_down or not self.is_connected:
             return
-        ping = json.dumps({"_cc_keepalive": True})
+        ping = P2PManager.keepalive_message()
         for ch in list(self.data_channels.values()):
             try:
                 if getattr(ch, "readyState", "") == "open":
@@ -106,6 +142,54 @@ class P2PManager(WSInterface):
             P2P_DC_HEARTBEAT_INTERVAL_SEC, self._dc_heartbeat_tick
         )
 
+    @staticmethod
+    def keepalive_message() -> str:
+        """Keepalive envelope; also advertises our capabilities (older peers ignore extra fields)."""
+        return json.dumps(
+            {
+                "_cc_keepalive": True,
+                "caps": P2P_CAPABILITIES
+                + CompressionManager.capabilities()
+                + AEADManager.capabilities(),
+            }
+        )
+
+    def _split_open_peers(self, capability: str) -> tuple[list[str], list[str]]:
+        """Returns (capable, legacy) peer ids of all open data channels for a wire-protocol extension."""
+        capable, legacy = [], []
+        for peer_id, channel in list(self.data_channels.items()):
+            if getattr(channel, "readyState", "") != "open":
+                continue
+            if capability in self.peer_capabilities.get(peer_id, ()):
+                capable.append(peer_id)
+            else:
+                legacy.append(peer_id)
+        return capable, legacy
+
+    def _common_compression(self, peer_ids: list[str]) -> list[str]:
+        """Compression algorithms that every one of the given peers can decode."""
+        return [
+            algorithm
+            for algorithm in CompressionManager.supported_algorithms()
+            if all(
+                COMPRESSION_CAP_PREFIX + algorithm in self.peer_capabilities.get(peer_id, ())
+                for peer_id in peer_ids
+            )
+        ]
+
+    def _common_aead(self, peer_ids: list[str]) -> str:
+        """The fastest AEAD algorithm that every one of the given peers can decrypt."""
+        return AEADManager.select(
+            [
+                algorithm
+                for algorithm in AEADManager.supported_algorithms()
+                if all(
+                    AEAD_CAP_PREFIX + algorithm in self.peer_capabilities.get(peer_id, ())
+                    for peer_id in peer_ids
+                )
+            ]
+        )
+
     def _restart_dc_heartbeat(self) -> None:
         self._cancel_dc_heartbeat()
         if not self.disconnected and not self._p2p_shutting_down and self.is_connected:
@@ -124,6 +208,8 @@ class P2PManager(WSInterface):
             self.live_connections = sum(
                 1 for ch in self.data_channels.values() if getattr(ch, "readyState", "") == "open"
             )
+            # Copies are sent over the data channels; nothing to poll for without a peer
+            self.clipboard_manager.set_connected(self.live_connections > 0)
 
     def get_stats(self) -> str:
         self._sync_live_connections_count()
@@ -135,6 +221,15 @@ class P2PManager(WSInterface):
             stats += f" | Sending: {self.sending_fragment_stats}"
         if self.receiving_fragment_stats is not None:
             stats += f" | Receiving: {self.receiving_fragment_stats}"
+        throughput_stats = self.send_scheduler.get_stats()
+        if throughput_stats is not None:
+            stats += f" | {throughput_stats}"
+        compression_stats = self.compression_manager.get_stats()
+        if compression_stats is not None:
+            stats += f" | {compression_stats}"
+        monitor_stats = self.clipboard_manager.get_monitor_stats()
+        if monitor_stats is not None:
+            stats += f" | {monitor_stats}"
         return stats
 
     def get_total_timeout(self):
@@ -181,7 +276,7 @@ class P2PManager(WSInterface):
             if not self.is_clipboard_monitoring_on:
                 # Start clipboard monitoring
                 self.is_clipboard_monitoring_on = True
-                self.clipboard_manager.on_copy(self.send)
+                self.clipboard_manager.on_copy(self.send, self.send_file_stream)
 
             if not self.is_login_phase:
                 return True, ""
@@ -347,6 +442,7 @@ class P2PManager(WSInterface):
 
             # Cleanup peer connections
             await self._cleanup_peer_connections()
+            self.reset_receiving_fragments()
 
             # Stop the clipboard manager
             self.clipboard_manager.stop()
@@ -376,6 +472,8 @@ class P2PManager(WSInterface):
                 self.peers.clear()
                 self.peer_connections.clear()
                 self.data_channels.clear()
+                self.peer_capabilities.clear()
+                self.send_scheduler.remove_all()
                 if clear_bootstrap_state:
                     self._pending_peer_list = None
                 self._peer_recovery_locks.clear()
@@ -427,6 +525,10 @@ class P2PManager(WSInterface):
         for old_pid in stale_ids:
             logging.debug(f"Removing stale peer: {old_pid}")
             self._peer_recovery_locks.pop(old_pid, None)
+            self.peer_capabilities.pop(old_pid, None)
+            self.send_scheduler.remove_peer(old_pid)
+            self.discard_peer_transfers(old_pid)
+            self.clipboard_manager.clipboard_cache.forget_peer(old_pid)
             # Close data channel
             dc = self.data_channels.pop(old_pid, None)
             if dc is not None:
@@ -454,6 +556,9 @@ class P2PManager(WSInterface):
 
     async def _dispose_peer_connection(self, peer_id: str) -> None:
         """Close and drop one peer's DC/PC without changing self.peers (used by recovery and offer handling)."""
+        self.peer_capabilities.pop(peer_id, None)
+        self.send_scheduler.remove_peer(peer_id)
+        # Partial incoming transfers are kept: the peer resumes them once the channel is back
         dc = self.data_channels.pop(peer_id, None)
         if dc is not None:
             try:
@@ -686,16 +791,24 @@ class P2PManager(WSInterface):
         Set up handlers for an RTCDataChannel (open, message, close, error).
         """
 
+        def advertise_capabilities():
+            try:
+                channel.send(P2PManager.keepalive_message())
+            except Exception:
+                pass
+
         @channel.on("open")
         def on_open():
             self._sync_live_connections_count()
+            advertise_capabilities()
 
         if channel.readyState == "open":
             self._sync_live_connections_count()
+            advertise_capabilities()
 
         @channel.on("message")
         def on_message(message):
-            self._receive(message)
+            self._receive(message, remote_peer_id)
 
         @channel.on("close")
         def on_close():
@@ -710,75 +823,998 @@ class P2PManager(WSInterface):
     def send(self, payload: str, payload_type: str = "text"):
         self.schedule_task(self._send(payload, payload_type))
 
+    @staticmethod
+    def timestamp() -> int:
+        """Wall-clock time in ms, sent with each transfer to order concurrent clipboards."""
+        return int(time.time() * 1000)
+
     def reset_sending_fragment_id(self):
         self.sending_fragment_id = ""
         self.sending_fragment_stats = None
+        self.sending_progress.clear()
+
+    def _report_sending_progress(self, transfer_id: str, sent: int, total: int):
+        """Shows the fragments sent so far, summed over the groups sent concurrently."""
+        self.sending_progress[transfer_id] = (sent, total)
+        self.sending_fragment_stats = (
+            f"{sum(sent for sent, _ in self.sending_progress.values())}/"
+            f"{sum(total for _, total in self.sending_progress.values())}"
+        )
+
+    def _start_send(self) -> str:
+        """
+        Cancels the transfer in progress and returns the id of a new one. Every group of the
+        new send checks this id, so a newer clipboard stops all of them.
+        """
+        self.reset_sending_fragment_id()
+        self.sending_fragment_id = str(uuid.uuid4())
+        return self.sending_fragment_id
+
+    def _finish_send(self, send_id: str):
+        if self.sending_fragment_id == send_id:
+            self.reset_sending_fragment_id()
 
     async def _send(self, payload: str, payload_type: str = "text"):
         try:
             if self.clipboard_manager.has_clipboard_changed(payload):
-                self.reset_sending_fragment_id()
-                self.reset_receiving_fragments()
+                send_id = self._start_send()
+                self.send_scheduler.clear()
+                self.sent_transfers.clear()
+                self.clipboard_manager.worker_pool.cancel_stale()
+                self.local_copy_time = time.monotonic()
+                self.peer_clipboard_timestamps.clear()
+
+                # Peers that still hold a recent copy of this payload only get a reference
+                cache = self.clipboard_manager.clipboard_cache
+                digest = cache.digest(payload)
+                holders = cache.holders(digest)
+                open_peers = [
+                    peer_id
+                    for peer_id, channel in list(self.data_channels.items())
+                    if channel.readyState == "open"
+                ]
+                ref_peers = [
+                    peer_id
+                    for peer_id in open_peers
+                    if peer_id in holders
+                    and P2P_CAP_CACHE_REF in self.peer_capabilities.get(peer_id, ())
+                ]
+                if ref_peers:
+                    await self.send_scheduler.send(
+                        self.reference_message(digest, payload_type), ref_peers
+                    )
+                full_peers = [peer_id for peer_id in open_peers if peer_id not in ref_peers]
+                deltas = []
+                if payload_type == "text":
+                    deltas, full_peers = await self._make_text_deltas(payload, digest, full_peers)
+                if self.sending_fragment_id != send_id:
+                    return  # Superseded while the deltas were computed
+                cache.put(payload, payload_type, ref_peers, digest)
+                # All groups are sent concurrently, interleaved per peer by the send scheduler
+                sent = await asyncio.gather(
+                    *(
+                        self._send_and_record(
+                            self._send_full(document, TEXT_DELTA_TYPE, group, send_id),
+                            group,
+                            payload,
+                            payload_type,
+                            digest,
+                        )
+                        for document, group in deltas
+                    ),
+                    self._send_and_record(
+                        self._send_full(payload, payload_type, full_peers, send_id),
+                        full_peers,
+                        payload,
+                        payload_type,
+                        digest,
+                    ),
+                )
+                if all(sent):
+                    self._finish_send(send_id)
+        except StaleJobError:
+            logging.debug("[data] Send superseded by a newer clipboard")
+        except Exception as e:
+            logging.error(f"Failed to send data: {e}")
 
-                raw_payload_size_in_bytes = len(payload.encode("utf-8"))
+    async def _send_and_record(
+        self, send, peer_ids: list[str], payload: str, payload_type: str, digest: str
+    ) -> bool:
+        """
+        Awaits `send` (a `_send_full` of the payload, or a delta of it, to `peer_ids`) and
+        then marks the peers that were sent all of it as holding the payload in the clipboard
+        cache, so later copies of it only send them a reference.
+        """
+        if not await send:
+            return False
+        delivered = await self.send_scheduler.sent(peer_ids)
+        self.clipboard_manager.clipboard_cache.put(payload, payload_type, delivered, digest)
+        return True
+
+    async def _send_full(
+        self, payload: str, payload_type: str, peer_ids: list[str], send_id: str = None
+    ) -> bool:
+        """
+        Sends the whole payload, in the newest wire format each peer supports. The groups
+        of peers are sent concurrently.
 
-                if self.config.data["cipher_enabled"]:
-                    payload = CipherManager.encode_to_json_string(
-                        **self.cipher_manager.encrypt(payload)
-                    )
+        Returns:
+            bool: False if the send was superseded by a newer clipboard.
+        """
+        aead_peers = [
+            peer_id
+            for peer_id in peer_ids
+            if P2P_CAP_CHUNKED_AEAD in self.peer_capabilities.get(peer_id, ())
+        ]
+        legacy_peers = [peer_id for peer_id in peer_ids if peer_id not in aead_peers]
+        sends = []
+        if legacy_peers:
+            sends.append(self._send_payload(payload, payload_type, legacy_peers, send_id))
+        if aead_peers:
+            sends.append(self._send_segmented(payload, payload_type, aead_peers, send_id))
+        return all(await asyncio.gather(*sends))
+
+    def reference_message(self, digest: str, payload_type: str) -> str:
+        """
+        Tells a peer to paste the item with this xxh3-128 digest from its clipboard cache.
+        The reference is sealed like any payload, so only a device holding the key can make
+        a peer paste a cached item.
+        """
+        reference = json.dumps(
+            {"hash": digest, "type": payload_type, "timestamp": P2PManager.timestamp()}
+        )
+        return json.dumps(
+            {"_cc_ref": True, "payload": self.cipher_manager.seal_bytes(reference.encode("utf-8"))}
+        )
 
-                fragments = P2PManager.fragment_string(payload)
-                metadata = {
-                    "id": str(uuid.uuid4()),
-                    "isFragmented": len(fragments) > 1,
-                    "index": 0,
-                    "totalFragments": len(fragments),
-                    "combinedRawPayloadSizeInBytes": raw_payload_size_in_bytes,
-                }
+    def _receive_reference(self, body: dict, peer_id: str):
+        if not isinstance(body.get("payload"), str):
+            logging.warning(f"Ignoring an unsealed clipboard reference from peer {peer_id}")
+            return
+        # Raises if the reference was not sealed with our key
+        reference = json.loads(self.cipher_manager.open_bytes(body["payload"]).decode("utf-8"))
+        cache = self.clipboard_manager.clipboard_cache
+        item = cache.get(reference["hash"])
+        if item is None:
+            # Evicted (or never received): ask for the full payload
+            channel = self.data_channels.get(peer_id)
+            if channel is not None and channel.readyState == "open":
+                channel.send(json.dumps({"_cc_ref_miss": True, "hash": reference["hash"]}))
+            return
+        cache.put(item.payload, item.payload_type, [peer_id], reference["hash"])
+        # The sealed timestamp also rejects a replayed older reference from the same peer
+        if self._is_latest_clipboard(
+            reference.get("timestamp"), time.monotonic(), peer_id
+        ) and self.clipboard_manager.has_clipboard_changed(item.payload):
+            self.clipboard_manager.base64_to_clipboard(
+                base64_string=item.payload, type_=item.payload_type
+            )
 
-                self.sending_fragment_id = metadata["id"]
-                for fragment in fragments:
-                    if self.sending_fragment_id != metadata["id"]:
-                        break
+    async def _make_text_deltas(
+        self, payload: str, digest: str, peer_ids: list[str]
+    ) -> tuple[list[tuple[str, list[str]]], list[str]]:
+        """
+        Makes patches of an edited text for peers holding an earlier text in their clipboard
+        cache. The patches are sent (encrypted) like any other payload.
 
-                    body = json.dumps(
-                        {
-                            "payload": fragment,
-                            "type": payload_type,
-                            "metadata": metadata,
-                        }
+        Returns:
+            tuple: The (delta document, peer ids) to send, and the peers that still need the
+                full text.
+        """
+        cache = self.clipboard_manager.clipboard_cache
+        groups: dict[str, list[str]] = {}
+        bases = {}
+        remaining = []
+        for peer_id in peer_ids:
+            base_digest, base = (None, None)
+            if P2P_CAP_TEXT_DELTA in self.peer_capabilities.get(peer_id, ()):
+                base_digest, base = cache.latest("text", peer_id, exclude=digest)
+            if base is None or not TextDelta.is_candidate(base.payload, payload):
+                remaining.append(peer_id)
+                continue
+            groups.setdefault(base_digest, []).append(peer_id)
+            bases[base_digest] = base.payload
+
+        patches = await asyncio.gather(
+            *(
+                self.clipboard_manager.worker_pool.run(
+                    TextDelta.make, bases[base_digest], payload, cpu_bound=True
+                )
+                for base_digest in groups
+            )
+        )
+        deltas = []
+        for (base_digest, group), patch in zip(groups.items(), patches):
+            if patch is None:
+                remaining.extend(group)
+                continue
+            document = TextDelta.encode(base_digest, digest, patch)
+            logging.debug(
+                f"[data] Sending text as a {len(document)} byte delta ({len(payload)} characters)"
+            )
+            deltas.append((document, group))
+        return deltas, remaining
+
+    def _apply_text_delta(self, document: str, peer_id: str) -> str:
+        """
+        Rebuilds a text from a delta against a cached base. If the base is missing or the
+        result does not match, asks the sender for the full text and returns None.
+        """
+        delta = TextDelta.decode(document)
+        base = self.clipboard_manager.clipboard_cache.get(delta["base"])
+        try:
+            if base is None:
+                raise ValueError("base is not cached")
+            text = TextDelta.apply(base.payload, delta["patch"])
+            if self.clipboard_manager.clipboard_cache.digest(text) != delta["hash"]:
+                raise ValueError("digest mismatch")
+            return text
+        except ValueError as e:
+            logging.debug(f"[data] Cannot apply text delta ({e}); requesting the full text")
+            channel = self.data_channels.get(peer_id)
+            if channel is not None and channel.readyState == "open":
+                channel.send(json.dumps({"_cc_ref_miss": True, "hash": delta["hash"]}))
+            return None
+
+    async def _resend_cached(self, peer_id: str, digest: str):
+        """Answers a cache miss with the full payload."""
+        item = self.clipboard_manager.clipboard_cache.get(digest)
+        if item is None:
+            logging.debug(f"[data] Cannot resend {digest}: no longer cached")
+            return
+        await self._send_and_record(
+            self._send_full(item.payload, item.payload_type, [peer_id]),
+            [peer_id],
+            item.payload,
+            item.payload_type,
+            digest,
+        )
+
+    async def _send_segmented(
+        self, payload: str, payload_type: str, peer_ids: list[str], send_id: str = None
+    ) -> bool:
+        """
+        Compresses (when all peers support it) and encrypts the payload as chunked-AEAD
+        segments, sending one segment per fragment so receivers can verify and decrypt
+        each fragment as it arrives. Peers that support it get binary envelopes instead of JSON.
+
+        `send_id` is the clipboard send (see `_start_send`) this belongs to; the send stops
+        once a newer one replaces it. Background sends (None, e.g. answering a cache miss)
+        are not cancelled by, and do not report progress for, the current clipboard transfer.
+
+        Returns:
+            bool: False if the send was superseded by a newer clipboard.
+        """
+        background = send_id is None
+        binary_peers = [
+            peer_id
+            for peer_id in peer_ids
+            if P2P_CAP_BINARY_ENVELOPE in self.peer_capabilities.get(peer_id, ())
+        ]
+        json_peers = [peer_id for peer_id in peer_ids if peer_id not in binary_peers]
+
+        worker_pool = self.clipboard_manager.worker_pool
+        data = payload.encode("utf-8")
+        raw_size = len(data)
+        compression = CompressionManager.select(
+            payload_type, raw_size, self._common_compression(peer_ids), payload_head=payload[:16]
+        )
+        if compression is not None:
+            data = await worker_pool.run(
+                self.compression_manager.compress, data, compression, cancellable=not background
+            )
+        total_segments = CipherManager.count_segments(len(data))
+        metadata = {
+            "id": str(uuid.uuid4()),
+            "isFragmented": total_segments > 1,
+            "index": 0,
+            "totalFragments": total_segments,
+            "combinedRawPayloadSizeInBytes": raw_size,
+            "encoding": AEAD_STREAM_ENCODING,
+            "timestamp": P2PManager.timestamp(),
+        }
+        if compression is not None:
+            metadata["compression"] = compression
+        if payload_type == "image":
+            metadata["codec"] = ImageTranscoder.codec_of_base64(payload)
+        sent_transfer = SentTransfer(metadata, payload_type, peer_ids)
+        self.sent_transfers.add(sent_transfer)
+
+        segments = self.cipher_manager.seal_segments(data, algorithm=self._common_aead(peer_ids))
+        while True:
+            # Seal a batch of segments on a worker while the loop keeps serving the peers
+            batch = await worker_pool.run(
+                WorkerPool.next_batch, segments, WORKER_BATCH_SEGMENTS, cancellable=not background
+            )
+            if not batch:
+                break
+            for segment in batch:
+                if not background and self.sending_fragment_id != send_id:
+                    self.sent_transfers.discard(metadata["id"])
+                    return False
+
+                self.sent_transfers.append(sent_transfer, segment)
+                index = metadata["index"]
+                if binary_peers:
+                    await self.send_scheduler.send(
+                        P2PManager._fragment_message(sent_transfer, index, segment, binary=True),
+                        [p for p in binary_peers if p not in sent_transfer.resuming_peers],
                     )
-                    metadata["index"] += 1
+                if json_peers:
+                    await self.send_scheduler.send(
+                        P2PManager._fragment_message(sent_transfer, index, segment, binary=False),
+                        [p for p in json_peers if p not in sent_transfer.resuming_peers],
+                    )
+                metadata["index"] += 1
 
-                    # Send to all open DataChannels
-                    for peer_id, channel in self.data_channels.items():
-                        if channel.readyState == "open":
-                            channel.send(body)
+                if metadata["isFragmented"] and not background:
+                    self._report_sending_progress(
+                        metadata["id"], metadata["index"], metadata["totalFragments"]
+                    )
+        return True
+
+    async def _send_payload(
+        self,
+        payload: str,
+        payload_type: str = "text",
+        peer_ids: list[str] = None,
+        send_id: str = None,
+    ) -> bool:
+        """
+        Encrypts, fragments and sends a payload in the legacy JSON format.
 
-                    if metadata["isFragmented"]:
-                        self.sending_fragment_stats = (
-                            f"{metadata['index']}/{metadata['totalFragments']}"
-                        )
-                else:
-                    self.reset_sending_fragment_id()
+        Args:
+            payload (str): The clipboard payload.
+            payload_type (str): The clipboard type.
+            peer_ids (list[str]): Peers to send to; all open data channels if None.
+            send_id (str): See `_send_segmented`.
+
+        Returns:
+            bool: False if the send was superseded by a newer clipboard.
+        """
+        background = send_id is None
+        raw_payload_size_in_bytes = len(payload.encode("utf-8"))
+        if peer_ids is None:
+            peer_ids = [
+                peer_id
+                for peer_id, channel in list(self.data_channels.items())
+                if channel.readyState == "open"
+            ]
+
+        image_codec = ImageTranscoder.codec_of_base64(payload) if payload_type == "image" else None
+        if self.config.data["cipher_enabled"]:
+            payload = await self.clipboard_manager.worker_pool.run(
+                lambda: CipherManager.encode_to_json_string(**self.cipher_manager.encrypt(payload)),
+                cancellable=not background,
+            )
+
+        payload_bytes = payload.encode("utf-8")
+        total_fragments = P2PManager.count_fragments(payload_bytes)
+        fragments = P2PManager.fragment_string(payload_bytes)
+        metadata = {
+            "id": str(uuid.uuid4()),
+            "isFragmented": total_fragments > 1,
+            "index": 0,
+            "totalFragments": total_fragments,
+            "combinedRawPayloadSizeInBytes": raw_payload_size_in_bytes,
+            "timestamp": P2PManager.timestamp(),
+        }
+        if payload_type == "image":
+            metadata["codec"] = image_codec
+        sent_transfer = SentTransfer(metadata, payload_type, peer_ids)
+        self.sent_transfers.add(sent_transfer)
+
+        for fragment in fragments:
+            if not background and self.sending_fragment_id != send_id:
+                self.sent_transfers.discard(metadata["id"])
+                return False
+
+            self.sent_transfers.append(sent_transfer, fragment)
+            body = P2PManager._fragment_message(sent_transfer, metadata["index"], fragment)
+            metadata["index"] += 1
+            await self.send_scheduler.send(body, peer_ids)
+
+            if metadata["isFragmented"] and not background:
+                self._report_sending_progress(
+                    metadata["id"], metadata["index"], metadata["totalFragments"]
+                )
+        return True
+
+    @staticmethod
+    def _fragment_message(
+        transfer: SentTransfer, index: int, fragment: bytes | str, binary: bool = False
+    ) -> str | bytes:
+        """
+        Builds the data-channel message for one fragment of a transfer.
+
+        Args:
+            transfer (SentTransfer): The transfer the fragment belongs to.
+            index (int): The fragment index.
+            fragment (bytes | str): A sealed segment (chunked AEAD) or a legacy payload fragment.
+            binary (bool): Use the binary envelope (chunked AEAD only).
+        """
+        metadata = transfer.metadata
+        if binary:
+            return Envelope(
+                metadata["id"],
+                index,
+                metadata["totalFragments"],
+                transfer.payload_type,
+                metadata["combinedRawPayloadSizeInBytes"],
+                fragment,
+                metadata.get("compression"),
+                metadata.get("timestamp"),
+            ).pack()
+        if transfer.segmented:
+            fragment = base64.b64encode(fragment).decode("utf-8")
+        return json.dumps(
+            {
+                "payload": fragment,
+                "type": transfer.payload_type,
+                "metadata": {**metadata, "index": index},
+            }
+        )
 
+    def _request_resume(self, peer_id: str):
+        """
+        Asks a peer whose data channel was rebuilt to resend what is missing from the
+        partial transfers we still hold from it.
+        """
+        channel = self.data_channels.get(peer_id)
+        if channel is None or channel.readyState != "open":
+            return
+        for (transfer_peer_id, message_id), transfer in list(
+            self.receiving_transfers.transfers.items()
+        ):
+            if transfer_peer_id != peer_id:
+                continue
+            logging.debug(f"[data] Resuming transfer {message_id} from {peer_id}")
+            try:
+                channel.send(SentTransferCache.resume_message(message_id, transfer.held_ranges()))
+            except Exception as e:
+                logging.debug(f"[data] Failed to request resume from {peer_id}: {e}")
+
+    async def _resend_fragments(self, peer_id: str, request: dict):
+        """
+        Retransmits the fragments a peer reported missing after a data-channel rebuild.
+        """
+        transfer = self.sent_transfers.get(request.get("id"))
+        if transfer is None or peer_id not in transfer.peer_ids:
+            logging.debug(f"[data] Cannot resume transfer {request.get('id')}: no longer cached")
+            return
+        missing = SentTransferCache.missing_indices(
+            request.get("have", []), len(transfer.fragments)
+        )
+        if not transfer.segmented:
+            # Legacy fragments are collected by index, so the live send can go on meanwhile
+            logging.debug(f"[data] Resending {len(missing)} fragment(s) to {peer_id}")
+            for index in missing:
+                await self.send_scheduler.send(
+                    P2PManager._fragment_message(transfer, index, transfer.fragments[index]),
+                    [peer_id],
+                )
+            return
+        if not missing:
+            return
+
+        # Segments are decrypted in order, so resend everything after the first gap. The live
+        # send skips this peer until the resend has caught up with it; interleaved segments
+        # would arrive out of order and be dropped.
+        binary = P2P_CAP_BINARY_ENVELOPE in self.peer_capabilities.get(peer_id, ())
+        logging.debug(f"[data] Resending from fragment {missing[0]} to {peer_id}")
+        transfer.resuming_peers.add(peer_id)
+        try:
+            index = missing[0]
+            while index < len(transfer.fragments) and (
+                self.sent_transfers.get(transfer.metadata["id"]) is transfer
+            ):
+                await self.send_scheduler.send(
+                    P2PManager._fragment_message(
+                        transfer, index, transfer.fragments[index], binary=binary
+                    ),
+                    [peer_id],
+                )
+                index += 1
+        finally:
+            transfer.resuming_peers.discard(peer_id)
+
+    def send_file_stream(self, file_stream: FileStream):
+        self.schedule_task(self._send_file_stream(file_stream))
+
+    async def _send_file_stream(self, file_stream: FileStream):
+        """
+        Streams copied files chunk by chunk to peers that support it; older peers
+        get the legacy base64 JSON payload.
+        """
+        try:
+            if not self.clipboard_manager.has_clipboard_changed(file_stream.fingerprint()):
+                return
+            send_id = self._start_send()
+            self.send_scheduler.clear()
+            self.sent_transfers.clear()
+            self.clipboard_manager.worker_pool.cancel_stale()
+            self.local_copy_time = time.monotonic()
+            self.peer_clipboard_timestamps.clear()
+            self.file_offer = None
+
+            stream_peers, legacy_peers = self._split_open_peers(P2P_CAP_FILE_STREAM)
+            if self.config.data["lazy_files_enabled"]:
+                pull_peers = [
+                    peer_id
+                    for peer_id in stream_peers
+                    if {P2P_CAP_FILE_PULL, P2P_CAP_FILE_TREE}
+                    <= self.peer_capabilities.get(peer_id, set())
+                ]
+                stream_peers = [peer_id for peer_id in stream_peers if peer_id not in pull_peers]
+                if pull_peers:
+                    await self._offer_files(file_stream, pull_peers)
+            legacy_payload = "{}"
+            if legacy_peers:
+                legacy_payload = await self.clipboard_manager.worker_pool.run(
+                    ClipboardManager.convert_files_to_base64, file_stream.top_level().paths
+                )
+            if self.sending_fragment_id != send_id:
+                return
+
+            # All groups are sent concurrently, interleaved per peer by the send scheduler
+            sends = []
+            if legacy_payload != "{}":
+                sends.append(self._send_payload(legacy_payload, "files", legacy_peers, send_id))
+            # Peers without directory support get the top-level files, one file per chunk
+            for chunked_aead in (False, True):
+                for tree in (False, True):
+                    peer_ids = [
+                        peer_id
+                        for peer_id in stream_peers
+                        if (P2P_CAP_CHUNKED_AEAD in self.peer_capabilities.get(peer_id, ()))
+                        == chunked_aead
+                        and (P2P_CAP_FILE_TREE in self.peer_capabilities.get(peer_id, ())) == tree
+                    ]
+                    files = file_stream if tree else file_stream.top_level()
+                    if not peer_ids or files.is_empty():
+                        continue
+                    sends.append(
+                        self._stream_files(
+                            files, peer_ids, chunked_aead, send_id=send_id, pack=tree
+                        )
+                    )
+            if all(await asyncio.gather(*sends)):
+                self._finish_send(send_id)
+        except StaleJobError:
+            logging.debug("[data] File stream superseded by a newer clipboard")
         except Exception as e:
-            logging.error(f"Failed to send data: {e}")
+            logging.error(f"Failed to send file stream: {e}")
+
+    async def _offer_files(self, file_stream: FileStream, peer_ids: list[str]):
+        """
+        Announces copied files by their manifest (names, sizes and hashes) only; each peer
+        pulls the bytes if the user downloads them (see `_serve_file_pull`).
+        """
+        digests = await self.clipboard_manager.worker_pool.run(file_stream.digests)
+        offer_id = str(uuid.uuid4())
+        self.file_offer = (offer_id, file_stream, set(peer_ids))
+        manifest = json.dumps(file_stream.manifest(digests)).encode("utf-8")
+        await self.send_scheduler.send(
+            json.dumps(
+                {
+                    "_cc_files": True,
+                    "id": offer_id,
+                    "payload": self.cipher_manager.seal_bytes(manifest),
+                    "timestamp": P2PManager.timestamp(),
+                }
+            ),
+            peer_ids,
+        )
+        logging.debug(
+            f"[data] Offered {len(file_stream.files)} file(s) ({file_stream.total_size} bytes) "
+            f"to {len(peer_ids)} peer(s)"
+        )
+
+    def _serve_file_pull_task(self, peer_id: str, offer_id: str):
+        task = asyncio.ensure_future(self._serve_file_pull(peer_id, offer_id))
+        self.file_serves[(peer_id, offer_id)] = task
+
+        def done(_):
+            if self.file_serves.get((peer_id, offer_id)) is task:
+                del self.file_serves[(peer_id, offer_id)]
+
+        task.add_done_callback(done)
+
+    async def _serve_file_pull(self, peer_id: str, offer_id: str):
+        """Streams the offered files to a peer that asked for them."""
+        if self.file_offer is None or self.file_offer[0] != offer_id:
+            logging.debug(f"[data] Cannot serve files {offer_id}: no longer offered")
+        elif peer_id in self.file_offer[2]:
+            chunked_aead = P2P_CAP_CHUNKED_AEAD in self.peer_capabilities.get(peer_id, ())
+            try:
+                await self._stream_files(
+                    self.file_offer[1], [peer_id], chunked_aead, offer_id=offer_id, pack=True
+                )
+                return
+            except Exception as e:
+                logging.error(f"Failed to send offered files: {e}")
+        channel = self.data_channels.get(peer_id)
+        if channel is not None and channel.readyState == "open":
+            channel.send(json.dumps({"_cc_pull_miss": True, "id": offer_id}))
+
+    async def _stream_files(
+        self,
+        file_stream: FileStream,
+        peer_ids: list[str],
+        chunked_aead: bool,
+        offer_id: str = None,
+        pack: bool = False,
+        send_id: str = None,
+    ) -> bool:
+        """
+        Sends one file stream to the given peers. `send_id` is the clipboard send it belongs
+        to, as for `_send_segmented`; pulls of an offer (`offer_id`) run in the background.
+        `pack` puts small files into shared chunks (peers with P2P_CAP_FILE_TREE only).
+
+        Returns:
+            bool: False if the transfer was cancelled by a newer clipboard.
+        """
+        background = send_id is None
+        stream_id = str(uuid.uuid4())
+        total_messages = file_stream.total_chunks(pack) + 2  # start + chunks + end
+        compression = None
+        if chunked_aead:
+            compression = CompressionManager.select(
+                "files",
+                file_stream.total_size,
+                self._common_compression(peer_ids),
+                file_names=[name for _, name, _, _ in file_stream.files],
+            )
+        binary_peers = [
+            peer_id
+            for peer_id in peer_ids
+            if chunked_aead and P2P_CAP_BINARY_ENVELOPE in self.peer_capabilities.get(peer_id, ())
+        ]
+        json_peers = [peer_id for peer_id in peer_ids if peer_id not in binary_peers]
+        messages = file_stream.iter_messages(
+            stream_id,
+            self.cipher_manager,
+            chunked_aead,
+            compression,
+            self.compression_manager,
+            None if background else P2PManager.timestamp(),
+            self._common_aead(peer_ids),
+            offer_id,
+            pack,
+            raw_chunks=chunked_aead,
+        )
+        frames = P2PManager._file_stream_frames(messages, bool(binary_peers), bool(json_peers))
+        index = 0
+        while True:
+            # Reading, compressing and sealing the files runs on a worker
+            batch = await self.clipboard_manager.worker_pool.run(
+                WorkerPool.next_batch,
+                frames,
+                WORKER_BATCH_SEGMENTS,
+                cancellable=not background,
+            )
+            if not batch:
+                break
+            for binary_frame, json_frame in batch:
+                if not background and self.sending_fragment_id != send_id:
+                    return False
+
+                index += 1
+                if binary_peers:
+                    await self.send_scheduler.send(binary_frame, binary_peers)
+                if json_peers:
+                    await self.send_scheduler.send(json_frame, json_peers)
+                if not background:
+                    self._report_sending_progress(stream_id, index, total_messages)
+        return True
+
+    @staticmethod
+    def _file_stream_frames(messages, binary: bool, json_: bool):
+        """
+        Frames the messages of `FileStream.iter_messages` (raw chunks) for the data channels.
+        Yields (binary frame, JSON frame) tuples, each None if not needed: chunks become
+        binary envelopes for peers with P2P_CAP_BINARY_ENVELOPE, and base64 JSON for the
+        others. The start and end messages are always JSON.
+        """
+        for message in messages:
+            payload = message["payload"]
+            if isinstance(payload, str):
+                frame = json.dumps(message)
+                yield frame, frame
+                continue
+            metadata = message["metadata"]
+            binary_frame = json_frame = None
+            if binary:
+                binary_frame = Envelope(
+                    metadata["id"], metadata["seq"], metadata["file"], FILE_STREAM_TYPE, 0, payload
+                ).pack()
+            if json_:
+                json_frame = json.dumps(
+                    {**message, "payload": base64.b64encode(payload).decode("utf-8")}
+                )
+            yield binary_frame, json_frame
 
     def reset_receiving_fragments(self):
-        self.receiving_fragments = {}
+        self.receiving_transfers.clear()
         self.receiving_fragment_stats = None
+        for receiver in self.receiving_file_streams.values():
+            receiver.discard()
+        self.receiving_file_streams = {}
+        for offer_id in list(self.file_pulls):
+            self._finish_pull(offer_id, error=IOError("Disconnected"))
+
+    def discard_peer_transfers(self, peer_id: str):
+        """Drops the in-flight incoming transfers of one peer."""
+        self.receiving_transfers.discard_peer(peer_id)
+        self.peer_clipboard_timestamps.pop(peer_id, None)
+        receiver = self.receiving_file_streams.pop(peer_id, None)
+        if receiver is not None:
+            receiver.discard()
+        for offer_id, (_, _, pull_peer_id) in list(self.file_pulls.items()):
+            if pull_peer_id == peer_id:
+                self._finish_pull(offer_id, error=IOError("The sending device disconnected"))
+
+    def _is_latest_clipboard(self, timestamp: int, started: float, peer_id: str = None) -> bool:
+        """
+        True if a completed transfer is newer than the current clipboard, so a slow transfer
+        never overwrites a newer one that finished first. Transfers are ordered by when their
+        first fragment arrived (`started`, local monotonic clock) against the last applied
+        transfer and the last local copy. The sender `timestamp` (ms; missing for older
+        clients) only orders transfers of the same peer, as the clocks of devices differ.
+        """
+        if started < self.local_copy_time:
+            logging.debug("Ignoring a completed transfer that started before the last local copy")
+            return False
+        if started < self.latest_clipboard_started:
+            logging.debug("Ignoring a completed transfer that is older than the current clipboard")
+            return False
+        if timestamp is not None and peer_id is not None:
+            if timestamp < self.peer_clipboard_timestamps.get(peer_id, 0):
+                logging.debug(f"Ignoring an out-of-order transfer from peer {peer_id}")
+                return False
+            self.peer_clipboard_timestamps[peer_id] = timestamp
+        self.latest_clipboard_started = started
+        return True
+
+    def _update_receiving_stats(self):
+        stats = [self.receiving_transfers.get_stats()] + [
+            f"{peer_id[:4]} {receiver.completed_files}/{len(receiver.names)} files, "
+            f"{receiver.received_bytes}/{receiver.total_bytes} B"
+            for peer_id, receiver in list(self.receiving_file_streams.items())
+        ]
+        stats = [s for s in stats if s]
+        self.receiving_fragment_stats = ", ".join(stats) if stats else None
+
+    def _receive_file_offer(self, body: dict, peer_id: str):
+        """Shows files a peer announced; they are pulled only when the user downloads them."""
+        manifest = json.loads(self.cipher_manager.open_bytes(body["payload"]).decode("utf-8"))
+        offer = FileOffer(
+            body["id"],
+            manifest,
+            lambda offer: self._request_files(offer, peer_id),
+            self._cancel_files_request,
+        )
+        max_size = self.config.data["max_clipboard_size_local_limit_bytes"]
+        if max_size is not None and offer.total_size > max_size:
+            logging.debug(
+                f"Payload size limit exceeded: {offer.total_size} bytes exceeds {max_size} bytes"
+            )
+            return
+        if self._is_latest_clipboard(body.get("timestamp"), time.monotonic(), peer_id):
+            self.clipboard_manager.paste(offer, "files")
 
-    def _receive(self, frame: any) -> str:
-        try:
-            body = json.loads(frame)
-            if isinstance(body, dict) and body.get("_cc_keepalive") is True:
+    def _request_files(self, offer: FileOffer, peer_id: str) -> Future:
+        """Asks the peer that offered the files to stream them (called from the tray thread)."""
+        future = Future()
+
+        def request():
+            if not future.set_running_or_notify_cancel():
                 return
-            self.reset_sending_fragment_id()
-            payload = body["payload"]
-            payload_type = body.get("type", "text")
-            metadata = body.get("metadata")
+            channel = self.data_channels.get(peer_id)
+            if channel is None or channel.readyState != "open":
+                future.set_exception(IOError("The sending device is not connected"))
+                return
+            self.file_pulls[offer.offer_id] = (offer, future, peer_id)
+            channel.send(json.dumps({"_cc_pull": True, "id": offer.offer_id}))
+
+        self.loop.call_soon_threadsafe(request)
+        return future
 
+    def _cancel_files_request(self, offer: FileOffer):
+        """
+        Abandons a stalled pull (called from the tray thread): drops the receiver writing the
+        files and tells the sending peer to stop.
+        """
+
+        def cancel():
+            pull = self.file_pulls.get(offer.offer_id)
+            if pull is None:
+                return
+            peer_id = pull[2]
+            receiver = self.receiving_file_streams.get(peer_id)
+            if receiver is not None and receiver.offer_id == offer.offer_id:
+                del self.receiving_file_streams[peer_id]
+                receiver.discard()
+                self._update_receiving_stats()
+            self._finish_pull(offer.offer_id, error=TimeoutError("The pull was cancelled"))
+            channel = self.data_channels.get(peer_id)
+            if channel is not None and channel.readyState == "open":
+                channel.send(json.dumps({"_cc_pull_cancel": True, "id": offer.offer_id}))
+
+        self.loop.call_soon_threadsafe(cancel)
+
+    def _finish_pull(
+        self, offer_id: str, completed: FileStreamReceiver = None, error: Exception = None
+    ):
+        """Hands a pulled stream (or its error) to the waiting `FileOffer.fetch`."""
+        _, future, _ = self.file_pulls.pop(offer_id, (None, None, None))
+        if future is None or future.done():
+            if completed is not None:
+                completed.discard()
+            return
+        if error is not None:
+            future.set_exception(error)
+            return
+        # Removed with the download option, on the next clipboard change
+        if self.clipboard_manager.received_files_directory is not None:
+            FileStreamReceiver.remove_directory(self.clipboard_manager.received_files_directory)
+        self.clipboard_manager.received_files_directory = completed.directory
+        future.set_result(completed.files)
+
+    def _receive_file_stream(self, body: dict, peer_id: str):
+        current = self.receiving_file_streams.get(peer_id)
+        try:
+            receiver, completed = FileStreamReceiver.handle(
+                current,
+                body,
+                self.cipher_manager,
+                self.config.data["max_clipboard_size_local_limit_bytes"],
+            )
+            if receiver is not None and receiver is not current and receiver.offer_id is not None:
+                pull = self.file_pulls.get(receiver.offer_id)
+                if pull is None:
+                    receiver.discard()
+                    raise IOError(f"Received files {receiver.offer_id} that were not requested")
+                receiver.expect_hashes(pull[0].hashes)
+        except Exception as e:
+            self.receiving_file_streams.pop(peer_id, None)
+            self._update_receiving_stats()
+            offer_id = body["metadata"].get("offer") or getattr(current, "offer_id", None)
+            if offer_id is not None:
+                self._finish_pull(offer_id, error=e)
+            raise
+
+        if receiver is not None:
+            self.receiving_file_streams[peer_id] = receiver
+            if receiver.offer_id in self.file_pulls:
+                self.file_pulls[receiver.offer_id][0].received_bytes = receiver.received_bytes
+        else:
+            self.receiving_file_streams.pop(peer_id, None)
+        self._update_receiving_stats()
+        if completed is not None:
+            if completed.offer_id is not None:
+                self._finish_pull(completed.offer_id, completed)
+            elif self._is_latest_clipboard(completed.timestamp, completed.started, peer_id):
+                self.clipboard_manager.file_stream_to_clipboard(completed)
+            else:
+                completed.discard()
+
+    def _receive_segment(self, key: tuple[str, str], segment: bytes, metadata: dict) -> Transfer:
+        """
+        Verifies and decrypts one chunked-AEAD segment as it arrives.
+
+        Returns:
+            Transfer: The transfer once its final segment is in, otherwise None.
+        """
+        transfer = self.receiving_transfers.get(key)
+        if transfer is None:
+            if metadata["index"] != 0:
+                return None  # Joined mid-transfer
+            transfer = self.receiving_transfers.start(
+                key,
+                Transfer(
+                    metadata["totalFragments"],
+                    metadata["combinedRawPayloadSizeInBytes"],
+                    metadata.get("timestamp"),
+                    self.cipher_manager.stream_decryptor(),
+                ),
+            )
+        elif metadata["index"] != transfer.received:
+            return None  # Duplicate or out-of-order segment around a resume
+
+        try:
+            self.receiving_transfers.add(key, metadata["index"], transfer.decryptor.open(segment))
+        except Exception:
+            self.receiving_transfers.pop(key)
+            raise
+        if not transfer.is_complete():
+            return None
+        return self.receiving_transfers.pop(key)
+
+    def _receive_fragment(self, key: tuple[str, str], fragment: str, metadata: dict) -> Transfer:
+        """
+        Collects one legacy JSON fragment.
+
+        Returns:
+            Transfer: The transfer once all fragments are in, otherwise None.
+        """
+        transfer = self.receiving_transfers.get(key)
+        if transfer is None:
+            transfer = self.receiving_transfers.start(
+                key,
+                Transfer(
+                    metadata["totalFragments"],
+                    metadata["combinedRawPayloadSizeInBytes"],
+                    metadata.get("timestamp"),
+                ),
+            )
+        self.receiving_transfers.add(key, metadata["index"], fragment)
+        if not transfer.is_complete():
+            return None
+        return self.receiving_transfers.pop(key)
+
+    def _receive(self, frame: any, peer_id: str = None) -> str:
+        try:
+            if isinstance(frame, bytes):
+                # Binary envelope: a chunked-AEAD segment or a file-stream chunk
+                envelope = Envelope.unpack(frame)
+                if envelope.payload_type == FILE_STREAM_TYPE:
+                    self._receive_file_stream(
+                        {
+                            "payload": envelope.data,
+                            "type": FILE_STREAM_TYPE,
+                            "metadata": envelope.metadata(),
+                        },
+                        peer_id,
+                    )
+                    return
+                payload = envelope.data
+                payload_type = envelope.payload_type
+                metadata = envelope.metadata()
+            else:
+                body = json.loads(frame)
+                if isinstance(body, dict) and body.get("_cc_keepalive") is True:
+                    if peer_id is not None and isinstance(body.get("caps"), list):
+                        reconnected = peer_id not in self.peer_capabilities
+                        self.peer_capabilities[peer_id] = set(body["caps"])
+                        if reconnected and P2P_CAP_RESUME in body["caps"]:
+                            self._request_resume(peer_id)
+                    return
+                if isinstance(body, dict) and body.get("_cc_resume") is True:
+                    if peer_id is not None:
+                        asyncio.ensure_future(self._resend_fragments(peer_id, body))
+                    return
+                if isinstance(body, dict) and body.get("_cc_ref") is True:
+                    self._receive_reference(body, peer_id)
+                    return
+                if isinstance(body, dict) and body.get("_cc_ref_miss") is True:
+                    asyncio.ensure_future(self._resend_cached(peer_id, body["hash"]))
+                    return
+                if isinstance(body, dict) and body.get("_cc_files") is True:
+                    self._receive_file_offer(body, peer_id)
+                    return
+                if isinstance(body, dict) and body.get("_cc_pull") is True:
+                    self._serve_file_pull_task(peer_id, body["id"])
+                    return
+                if isinstance(body, dict) and body.get("_cc_pull_cancel") is True:
+                    task = self.file_serves.pop((peer_id, body["id"]), None)
+                    if task is not None:
+                        logging.debug(f"[data] {peer_id} cancelled its pull of {body['id']}")
+                        task.cancel()
+                    return
+                if isinstance(body, dict) and body.get("_cc_pull_miss") is True:
+                    self._finish_pull(
+                        body["id"], error=IOError("The files are no longer offered by the sender")
+                    )
+                    return
+                if body.get("type") == FILE_STREAM_TYPE:
+                    self._receive_file_stream(body, peer_id)
+                    return
+                payload = body["payload"]
+                payload_type = body.get("type", "text")
+                metadata = body.get("metadata")
+
+            key = (peer_id, metadata["id"]) if metadata is not None else None
             # Check if the payload exceeds the maximum size: first layer protection
             if (
                 metadata is not None
@@ -786,43 +1822,59 @@ class P2PManager(WSInterface):
                 and metadata["combinedRawPayloadSizeInBytes"]
                 > self.config.data["max_clipboard_size_local_limit_bytes"]
             ):
-                self.reset_receiving_fragments()
+                self.receiving_transfers.pop(key)
                 logging.debug(
                     f"Payload size limit exceeded: {metadata['combinedRawPayloadSizeInBytes']} bytes exceeds {self.config.data['max_clipboard_size_local_limit_bytes']} bytes"
                 )
                 return
 
-            # Fragmented message handling
-            if metadata is not None and metadata["isFragmented"]:
-                self.receiving_fragment_stats = (
-                    f"{metadata['index'] + 1}/{metadata['totalFragments']}"
-                )
-                if metadata["id"] in self.receiving_fragments:
-                    self.receiving_fragments[metadata["id"]][metadata["index"]] = payload
-                    if metadata["index"] == metadata["totalFragments"] - 1:
-                        if all(s != "" for s in self.receiving_fragments[metadata["id"]]):
-                            payload = "".join(self.receiving_fragments[metadata["id"]])
-                        else:
-                            self.reset_receiving_fragments()
-                            logging.error(
-                                "Failed to receive: One or more fragments are missing or clipboard has changed."
-                            )
-                            return
-                    else:
+            timestamp = metadata.get("timestamp") if metadata is not None else None
+            started = time.monotonic()
+            try:
+                # Chunked AEAD: every fragment is an independently authenticated segment
+                if metadata is not None and metadata.get("encoding") == AEAD_STREAM_ENCODING:
+                    if isinstance(payload, str):
+                        payload = base64.b64decode(payload)
+                    transfer = self._receive_segment(key, payload, metadata)
+                    if transfer is None:
                         return
-                else:
-                    self.reset_receiving_fragments()
-                    self.receiving_fragments[metadata["id"]] = [""] * metadata["totalFragments"]
-                    self.receiving_fragments[metadata["id"]][metadata["index"]] = payload
-                    return
+                    started = transfer.started
+                    data = b"".join(transfer.parts)
+                    if metadata.get("compression"):
+                        data = CompressionManager.decompress(
+                            data, metadata["compression"], transfer.raw_size
+                        )
+                    payload = data.decode("utf-8")
+
+                # Fragmented message handling
+                elif metadata is not None and metadata["isFragmented"]:
+                    transfer = self._receive_fragment(key, payload, metadata)
+                    if transfer is None:
+                        return
+                    started = transfer.started
+                    payload = "".join(transfer.parts)
+            finally:
+                self._update_receiving_stats()
 
-            if self.config.data["cipher_enabled"]:
+            if self.config.data["cipher_enabled"] and (
+                metadata is None or metadata.get("encoding") != AEAD_STREAM_ENCODING
+            ):
                 payload = self.cipher_manager.decrypt(
                     **CipherManager.decode_from_json_string(payload)
                 )
 
-            if self.clipboard_manager.has_clipboard_changed(payload):
-                self.reset_receiving_fragments()
+            if payload_type == TEXT_DELTA_TYPE:
+                payload = self._apply_text_delta(payload, peer_id)
+                if payload is None:
+                    return
+                payload_type = "text"
+
+            if peer_id is not None:
+                # The sender holds this payload now; a later re-copy can reference it
+                self.clipboard_manager.clipboard_cache.put(payload, payload_type, [peer_id])
+            if self._is_latest_clipboard(
+                timestamp, started, peer_id
+            ) and self.clipboard_manager.has_clipboard_changed(payload):
                 self.clipboard_manager.base64_to_clipboard(
                     base64_string=payload, type_=payload_type
                 )
@@ -832,24 +1884,42 @@ class P2PManager(WSInterface):
             logging.error(f"Failed to receive data: {e}")
 
     @staticmethod
-    def fragment_string(s: str, fragment_size: int = FRAGMENT_SIZE) -> list[str]:
+    def fragment_string(s: str | bytes, fragment_size: int = FRAGMENT_SIZE):
         """
-        Splits a string into a list of fragments, each with a maximum size of `fragment_size` bytes.
+        Splits a string into fragments of at most `fragment_size` UTF-8 bytes, cutting only at
+        code-point boundaries so multi-byte characters are never split or dropped.
 
         Args:
-            s (str): The string to fragment.
+            s (str | bytes): The string to fragment, or its UTF-8 encoding.
             fragment_size (int): The maximum size of each fragment in bytes.
 
-        Returns:
-            list[str]: A list of string fragments.
+        Yields:
+            str: The fragments, decoded lazily from a view of the encoded string.
         """
-        # Encode the string to bytes to accurately split by byte size
-        s_bytes = s.encode("utf-8")
-        fragments = [
-            s_bytes[i : i + fragment_size].decode("utf-8", errors="ignore")
-            for i in range(0, len(s_bytes), fragment_size)
-        ]
-        return fragments
+        view = memoryview(s.encode("utf-8") if isinstance(s, str) else s)
+        for start, end in P2PManager._fragment_bounds(view, fragment_size):
+            yield str(view[start:end], "utf-8")
+
+    @staticmethod
+    def count_fragments(s_bytes: bytes, fragment_size: int = FRAGMENT_SIZE) -> int:
+        """Number of fragments `fragment_string` yields for the UTF-8 bytes `s_bytes`."""
+        return sum(1 for _ in P2PManager._fragment_bounds(memoryview(s_bytes), fragment_size))
+
+    @staticmethod
+    def _fragment_bounds(view: memoryview, fragment_size: int):
+        """Yields (start, end) byte offsets of each fragment."""
+        total = len(view)
+        start = 0
+        while start < total:
+            end = min(start + fragment_size, total)
+            # Step back over UTF-8 continuation bytes (0b10xxxxxx) to land on a character start
+            cut = end
+            while start < cut < total and view[cut] & 0xC0 == 0x80:
+                cut -= 1
+            if cut > start:
+                end = cut
+            yield start, end
+            start = end
 
     @staticmethod
     def parse_ice_candidate_line(candidate_line: str) -> dict:
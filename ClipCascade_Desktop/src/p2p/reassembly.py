@@ -0,0 +1,145 @@
+import logging
+import time
+
+from core.constants import *
+from p2p.resume import SentTransferCache
+
+
+class Transfer:
+    """
+    One incoming fragmented payload. Legacy transfers collect payload strings by index;
+    chunked-AEAD transfers collect decrypted segments in order through `decryptor`.
+    """
+
+    def __init__(self, total: int, raw_size: int, timestamp: int = None, decryptor=None):
+        self.total = total
+        self.raw_size = raw_size
+        self.timestamp = timestamp  # sender clock (ms) when the transfer started, if known
+        self.decryptor = decryptor
+        self.parts: list = [None] * total if decryptor is None else []
+        self.received = 0
+        self.buffered_bytes = 0
+        self.started = time.monotonic()
+        self.updated = self.started
+
+    def add(self, index: int, part: str | bytes) -> int:
+        """
+        Stores one fragment and returns the number of bytes it added to the buffer.
+        """
+        self.updated = time.monotonic()
+        if self.decryptor is not None:
+            self.parts.append(part)
+        else:
+            if not 0 <= index < self.total:
+                raise ValueError(f"Invalid fragment index {index}")
+            if self.parts[index] is not None:
+                return 0  # Duplicate
+            self.parts[index] = part
+        self.received += 1
+        self.buffered_bytes += len(part)
+        return len(part)
+
+    def is_complete(self) -> bool:
+        if self.decryptor is not None:
+            return self.decryptor.finished
+        return self.received == self.total
+
+    def held_ranges(self) -> list[list[int]]:
+        """Fragment indices received so far, as half-open [start, end) ranges."""
+        if self.decryptor is not None:
+            return [[0, self.received]] if self.received else []
+        return SentTransferCache.to_ranges(
+            index for index, part in enumerate(self.parts) if part is not None
+        )
+
+    def progress(self) -> str:
+        return f"{self.received}/{self.total}"
+
+
+class TransferTable:
+    """
+    In-flight transfers keyed by (peer_id, message id), so several peers (or several
+    clipboards from one peer) can be received at the same time. Memory is bounded by a
+    transfer count and a byte budget, evicting the least recently updated transfers first,
+    and transfers that stop receiving fragments expire.
+    """
+
+    def __init__(
+        self,
+        max_transfers: int = P2P_MAX_CONCURRENT_TRANSFERS,
+        max_bytes: int = P2P_REASSEMBLY_MAX_BYTES,
+        timeout: float = P2P_TRANSFER_TIMEOUT_SEC,
+    ):
+        self.max_transfers = max_transfers
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.transfers: dict[tuple[str, str], Transfer] = {}
+
+    def get(self, key: tuple[str, str]) -> Transfer:
+        return self.transfers.get(key)
+
+    def start(self, key: tuple[str, str], transfer: Transfer) -> Transfer:
+        self.expire()
+        self.transfers.pop(key, None)
+        while len(self.transfers) >= self.max_transfers:
+            self._evict_oldest()
+        self.transfers[key] = transfer
+        return transfer
+
+    def add(self, key: tuple[str, str], index: int, part: str | bytes):
+        """
+        Adds a fragment to a transfer, evicting other transfers if the byte budget is exceeded.
+
+        Raises:
+            MemoryError: If this transfer alone exceeds the byte budget (it is dropped).
+        """
+        transfer = self.transfers[key]
+        transfer.add(index, part)
+        while self.buffered_bytes() > self.max_bytes:
+            if len(self.transfers) == 1:
+                self.transfers.pop(key, None)
+                raise MemoryError("Incoming transfer exceeds the reassembly memory limit")
+            self._evict_oldest(exclude=key)
+
+    def pop(self, key: tuple[str, str]) -> Transfer:
+        return self.transfers.pop(key, None)
+
+    def discard_peer(self, peer_id: str):
+        for key in [key for key in self.transfers if key[0] == peer_id]:
+            del self.transfers[key]
+
+    def clear(self):
+        self.transfers = {}
+
+    def expire(self):
+        now = time.monotonic()
+        for key, transfer in list(self.transfers.items()):
+            if now - transfer.updated > self.timeout:
+                logging.debug(f"Incoming transfer {key[1]} from {key[0]} timed out")
+                del self.transfers[key]
+
+    def buffered_bytes(self) -> int:
+        return sum(transfer.buffered_bytes for transfer in self.transfers.values())
+
+    def get_stats(self) -> str:
+        """Returns per-transfer progress, e.g. "ab12 3/70, cd34 1/2"."""
+        if not self.transfers:
+            return None
+        return (
+            ", ".join(
+                f"{peer_id[:4]} {transfer.progress()}"
+                for (peer_id, _), transfer in list(self.transfers.items())
+                if transfer.total > 1
+            )
+            or None
+        )
+
+    def _evict_oldest(self, exclude: tuple[str, str] = None):
+        candidates = [key for key in self.transfers if key != exclude]
+        if not candidates:
+            return
+        oldest = min(candidates, key=lambda key: self.transfers[key].updated)
+        logging.debug(
+            f"Dropping incoming transfer {oldest[1]} from {oldest[0]}: too many in flight"
+        )
+        del self.transfers[oldest]
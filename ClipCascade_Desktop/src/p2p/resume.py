@@ -0,0 +1,103 @@
+import json
+
+from collections import OrderedDict
+from core.constants import *
+
+
+class SentTransfer:
+    """
+    The fragments of one outgoing payload, kept so they can be retransmitted to a peer
+    whose data channel was rebuilt mid-transfer.
+    """
+
+    def __init__(self, metadata: dict, payload_type: str, peer_ids: list[str]):
+        self.metadata = metadata  # JSON-format metadata (the "index" is filled in per fragment)
+        self.payload_type = payload_type
+        self.peer_ids = set(peer_ids)
+        self.fragments: list = []  # sealed segments (bytes) or legacy fragments (str)
+        self.size = 0
+        # Peers a resume is resending to; the live send skips them until the resend catches up
+        self.resuming_peers: set[str] = set()
+
+    @property
+    def segmented(self) -> bool:
+        return self.metadata.get("encoding") == AEAD_STREAM_ENCODING
+
+    def append(self, fragment: bytes | str):
+        self.fragments.append(fragment)
+        self.size += len(fragment)
+
+
+class SentTransferCache:
+    """
+    Bounded cache of recently sent transfers, keyed by message id. The oldest transfers are
+    dropped first when the count or byte budget is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_transfers: int = P2P_RESUME_CACHE_TRANSFERS,
+        max_bytes: int = P2P_RESUME_CACHE_BYTES,
+    ):
+        self.max_transfers = max_transfers
+        self.max_bytes = max_bytes
+        self.transfers: OrderedDict[str, SentTransfer] = OrderedDict()
+
+    def add(self, transfer: SentTransfer):
+        self.transfers[transfer.metadata["id"]] = transfer
+        self.transfers.move_to_end(transfer.metadata["id"])
+        self._trim()
+
+    def append(self, transfer: SentTransfer, fragment: bytes | str):
+        """Caches one more fragment of `transfer`, dropping the transfer if it no longer fits."""
+        if transfer.metadata["id"] not in self.transfers:
+            return
+        transfer.append(fragment)
+        if transfer.size > self.max_bytes:
+            del self.transfers[transfer.metadata["id"]]  # Too large to keep
+            return
+        self._trim()
+
+    def get(self, message_id: str) -> SentTransfer:
+        return self.transfers.get(message_id)
+
+    def discard(self, message_id: str):
+        self.transfers.pop(message_id, None)
+
+    def clear(self):
+        self.transfers.clear()
+
+    def _trim(self):
+        while len(self.transfers) > self.max_transfers or (
+            len(self.transfers) > 1
+            and sum(transfer.size for transfer in self.transfers.values()) > self.max_bytes
+        ):
+            self.transfers.popitem(last=False)
+
+    @staticmethod
+    def to_ranges(indices) -> list[list[int]]:
+        """Compresses sorted fragment indices into half-open [start, end) ranges."""
+        ranges = []
+        for index in indices:
+            if ranges and ranges[-1][1] == index:
+                ranges[-1][1] = index + 1
+            else:
+                ranges.append([index, index + 1])
+        return ranges
+
+    @staticmethod
+    def missing_indices(ranges: list, total: int) -> list[int]:
+        """Returns the fragment indices below `total` that are not covered by `ranges`."""
+        held = [False] * total
+        for start, end in ranges:
+            for index in range(max(0, int(start)), min(total, int(end))):
+                held[index] = True
+        return [index for index, present in enumerate(held) if not present]
+
+    @staticmethod
+    def resume_message(message_id: str, ranges: list[list[int]]) -> str:
+        """
+        Control message asking a peer to resend the fragments of `message_id` that are not in
+        `ranges`. Like the keepalive, it is a JSON envelope older clients never receive.
+        """
+        return json.dumps({"_cc_resume": True, "id": message_id, "have": ranges})
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+
+from core.constants import *
+
+
+class _PeerQueue:
+    """Outgoing messages and throughput counters of one peer."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=P2P_SEND_QUEUE_SIZE)
+        self.worker: asyncio.Task = None
+        self.sent_bytes = 0  # bytes sent since the peer last went idle
+        self.busy_since: float = None
+        self.last_sent: float = None
+        self.dropped = 0  # messages dequeued without being sent
+
+    def record(self, size: int):
+        now = time.monotonic()
+        if self.last_sent is None or now - self.last_sent > P2P_SEND_IDLE_SEC:
+            self.busy_since = now
+            self.sent_bytes = 0
+        self.sent_bytes += size
+        self.last_sent = now
+
+    def is_active(self) -> bool:
+        return self.last_sent is not None and time.monotonic() - self.last_sent <= P2P_SEND_IDLE_SEC
+
+    def throughput(self) -> float:
+        """Bytes per second of the current (or last) burst of messages."""
+        if self.busy_since is None or self.last_sent is None:
+            return None
+        elapsed = self.last_sent - self.busy_since
+        if elapsed <= 0:
+            return None
+        return self.sent_bytes / elapsed
+
+
+class SendScheduler:
+    """
+    Flow-controlled data-channel sender. Each peer has a bounded queue drained by its own
+    task, which waits for the channel's `bufferedAmount` to fall below the low-water mark
+    instead of flooding the SCTP buffer. Peers progress independently, so a slow peer only
+    holds back the producer once its queue is full, and the event loop stays free for
+    signaling and keepalives between messages.
+    """
+
+    def __init__(self, get_channel: callable):
+        self.get_channel = get_channel  # peer_id -> RTCDataChannel | None
+        self._peers: dict[str, _PeerQueue] = {}
+
+    async def send(self, message: str | bytes, peer_ids: list[str]):
+        """
+        Queues one message for each of the given peers, waiting while a peer's queue is full.
+        """
+        for peer_id in peer_ids:
+            peer = self._peers.get(peer_id)
+            if peer is None:
+                peer = _PeerQueue()
+                self._peers[peer_id] = peer
+            if peer.worker is None or peer.worker.done():
+                peer.worker = asyncio.ensure_future(self._drain_queue(peer_id, peer))
+            await peer.queue.put(message)
+
+    async def sent(self, peer_ids: list[str]) -> list[str]:
+        """
+        Waits until the messages queued so far for the given peers have left their queues.
+
+        Returns:
+            list[str]: The peers none of whose messages were dropped meanwhile (by `clear`,
+                a closed channel or a failed send).
+        """
+        peers = [(peer_id, self._peers.get(peer_id)) for peer_id in peer_ids]
+        dropped = [peer.dropped if peer is not None else None for _, peer in peers]
+        for _, peer in peers:
+            if peer is not None:
+                await peer.queue.join()
+        return [
+            peer_id
+            for (peer_id, peer), before in zip(peers, dropped)
+            if peer is not None and self._peers.get(peer_id) is peer and peer.dropped == before
+        ]
+
+    def clear(self):
+        """Drops all queued messages (e.g. when a newer clipboard replaces the transfer)."""
+        for peer in self._peers.values():
+            while not peer.queue.empty():
+                peer.queue.get_nowait()
+                peer.queue.task_done()
+                peer.dropped += 1
+
+    def remove_peer(self, peer_id: str):
+        peer = self._peers.pop(peer_id, None)
+        if peer is None:
+            return
+        # Free the queue so a producer waiting on it is released
+        while not peer.queue.empty():
+            peer.queue.get_nowait()
+            peer.queue.task_done()
+        if peer.worker is not None:
+            peer.worker.cancel()
+
+    def remove_all(self):
+        for peer_id in list(self._peers):
+            self.remove_peer(peer_id)
+
+    def get_stats(self) -> str:
+        """
+        Returns the throughput of peers that are being sent to, e.g. "ab12: 1.2 MB/s".
+        """
+        stats = []
+        for peer_id, peer in list(self._peers.items()):
+            throughput = peer.throughput()
+            if not peer.is_active() or throughput is None:
+                continue
+            stats.append(f"{peer_id[:4]}: {throughput / 1048576:.1f} MB/s")
+        return ", ".join(stats) if stats else None
+
+    async def _drain_queue(self, peer_id: str, peer: _PeerQueue):
+        while True:
+            message = await peer.queue.get()
+            try:
+                channel = self.get_channel(peer_id)
+                if channel is None or channel.readyState != "open":
+                    peer.dropped += 1
+                    continue  # Dropped; the peer will resync on its next clipboard
+                await SendScheduler._wait_for_buffer(channel)
+                if channel.readyState != "open":
+                    peer.dropped += 1
+                    continue
+                channel.send(message)
+                peer.record(len(message))
+            except Exception as e:
+                peer.dropped += 1
+                logging.error(f"[data] Failed to send to {peer_id}: {e}")
+            finally:
+                peer.queue.task_done()
+
+    @staticmethod
+    async def _wait_for_buffer(channel):
+        """
+        Waits until the channel's send buffer is below `P2P_SEND_BUFFER_LOW` (or the channel
+        closes). Only waits when the buffer is above `P2P_SEND_BUFFER_HIGH`.
+        """
+        if channel.bufferedAmount <= P2P_SEND_BUFFER_HIGH:
+            return
+        drained = asyncio.Event()
+
+        def on_buffered_amount_low():
+            drained.set()
+
+        channel.bufferedAmountLowThreshold = P2P_SEND_BUFFER_LOW
+        channel.on("bufferedamountlow", on_buffered_amount_low)
+        try:
+            while channel.readyState == "open" and channel.bufferedAmount > P2P_SEND_BUFFER_LOW:
+                try:
+                    # Re-check periodically in case the channel closes while we wait
+                    await asyncio.wait_for(drained.wait(), timeout=1.0)
+                    drained.clear()
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            channel.remove_listener("bufferedamountlow", on_buffered_amount_low)
@@ -1,13 +1,20 @@
+import base64
 import json
 import logging
 import time
+import uuid
 
+from collections import deque
 
 from interfaces.ws_interface import WSInterface
 from stomp_ws.client import Client
 from core.config import Config
 from utils.cipher_manager import CipherManager
+from utils.compression_manager import CompressionManager
 from clipboard.clipboard_manager import ClipboardManager
+from clipboard.file_stream import FileStream, FileStreamReceiver
+from clipboard.image_transcoder import ImageTranscoder
+from clipboard.text_delta import TextDelta
 from utils.notification_manager import NotificationManager
 from utils.request_manager import RequestManager
 from utils.ssl_helper import websocket_sslopt_for_config
@@ -24,6 +31,7 @@ class STOMPManager(WSInterface):
         self.config = config
         self.clipboard_manager = ClipboardManager(self.config)
         self.cipher_manager = CipherManager(self.config)
+        self.compression_manager = CompressionManager()
         self.notification_manager = NotificationManager(self.config)
         self.sys_tray: TaskbarPanel = None
         self.first_conn_lost = True
@@ -33,6 +41,13 @@ class STOMPManager(WSInterface):
         self.disconnected = False
         self.is_auto_reconnecting = False
 
+        # File stream variables
+        self.receiving_file_stream: FileStreamReceiver = None
+        self.sent_stream_ids = deque(maxlen=16)  # The server echoes our own messages back
+        # Chunked AEAD: Mapping: id -> (StreamDecryptor, decrypted segments)
+        self.receiving_segments: dict = {}
+        self.sent_delta_digests = deque(maxlen=16)  # Texts we sent as deltas (for misses)
+
     def set_tray_ref(self, sys_tray: TaskbarPanel):
         """
         Sets the system tray reference.
@@ -46,7 +61,14 @@ class STOMPManager(WSInterface):
         return (RECONNECT_WS_TIMER * 1000) + WEBSOCKET_TIMEOUT
 
     def get_stats(self):
-        return None
+        stats = [
+            self.compression_manager.get_stats(),
+            self.clipboard_manager.get_monitor_stats(),
+        ]
+        stats = [s for s in stats if s is not None]
+        if not stats:
+            return None
+        return f"📊 {' | '.join(stats)}"
 
     def connect(self) -> tuple[bool, str]:
         try:
@@ -84,7 +106,8 @@ class STOMPManager(WSInterface):
                 )
 
             # send event
-            self.clipboard_manager.on_copy(self.send)
+            self.clipboard_manager.set_connected(True)
+            self.clipboard_manager.on_copy(self.send, self.send_file_stream)
             return True, "Websocket connected"
         except Exception as e:
             msg = f"Failed to connect websocket: {e}"
@@ -93,6 +116,7 @@ class STOMPManager(WSInterface):
 
     def _on_close(self):
         self.is_connected = False
+        self.clipboard_manager.set_connected(False)
         # Auto Reconnect
         if not self.is_login_phase and not self.disconnected:
             self.is_auto_reconnecting = True
@@ -109,6 +133,14 @@ class STOMPManager(WSInterface):
         try:
             if self.is_connected:
                 if self.clipboard_manager.has_clipboard_changed(payload):
+                    if self._use_chunked_aead():
+                        if payload_type == "text":
+                            document = self._text_delta(payload)
+                            if document is not None:
+                                self._send_segmented(document, TEXT_DELTA_TYPE)
+                                return
+                        self._send_segmented(payload, payload_type)
+                        return
                     if self.config.data["cipher_enabled"]:
                         payload = CipherManager.encode_to_json_string(
                             **self.cipher_manager.encrypt(payload)
@@ -118,17 +150,216 @@ class STOMPManager(WSInterface):
         except Exception as e:
             logging.error(f"Failed to send data: {e}")
 
+    def _use_chunked_aead(self) -> bool:
+        return self.config.data["p2s_extensions_enabled"]
+
+    @staticmethod
+    def _allowed_compression() -> list[str]:
+        # No negotiation over P2S: zlib is the one algorithm every client can decode
+        return [COMPRESSION_ZLIB]
+
+    def _text_delta(self, payload: str) -> str:
+        """
+        Caches a copied text and returns it as a delta against the latest cached text, or None
+        if it should be sent in full. Devices that lack the base ask for the full text.
+        """
+        cache = self.clipboard_manager.clipboard_cache
+        digest = cache.put(payload, "text")
+        base_digest, base = cache.latest("text", exclude=digest)
+        if base is None or not TextDelta.is_candidate(base.payload, payload):
+            return None
+        patch = TextDelta.make(base.payload, payload)
+        if patch is None:
+            return None
+        self.sent_delta_digests.append(digest)
+        return TextDelta.encode(base_digest, digest, patch)
+
+    def _apply_text_delta(self, document: str) -> str:
+        """
+        Rebuilds a text from a delta against a cached base. If the base is missing or the
+        result does not match, asks the sender for the full text and returns None.
+        """
+        delta = TextDelta.decode(document)
+        cache = self.clipboard_manager.clipboard_cache
+        base = cache.get(delta["base"])
+        try:
+            if base is None:
+                raise ValueError("base is not cached")
+            text = TextDelta.apply(base.payload, delta["patch"])
+            if cache.digest(text) != delta["hash"]:
+                raise ValueError("digest mismatch")
+            return text
+        except ValueError as e:
+            logging.debug(f"Cannot apply text delta ({e}); requesting the full text")
+            self._send_segmented(json.dumps({"hash": delta["hash"]}), TEXT_DELTA_MISS_TYPE)
+            return None
+
+    def _resend_text(self, document: str):
+        """Answers a delta miss with the full text, if this device sent that delta."""
+        digest = json.loads(document)["hash"]
+        if digest not in self.sent_delta_digests:
+            return  # Another device sent it
+        item = self.clipboard_manager.clipboard_cache.get(digest)
+        if item is None:
+            logging.debug(f"Cannot resend {digest}: no longer cached")
+            return
+        self._send_segmented(item.payload, item.payload_type)
+
+    def _send_segmented(self, payload: str, payload_type: str):
+        """
+        Sends the payload as chunked-AEAD segments, one message per segment.
+        """
+        data = payload.encode("utf-8")
+        raw_size = len(data)
+        compression = CompressionManager.select(
+            payload_type, raw_size, self._allowed_compression(), payload_head=payload[:16]
+        )
+        if compression is not None:
+            data = self.compression_manager.compress(data, compression)
+        total_segments = CipherManager.count_segments(len(data))
+        metadata = {
+            "id": str(uuid.uuid4()),
+            "isFragmented": total_segments > 1,
+            "index": 0,
+            "totalFragments": total_segments,
+            "combinedRawPayloadSizeInBytes": raw_size,
+            "encoding": AEAD_STREAM_ENCODING,
+        }
+        if compression is not None:
+            metadata["compression"] = compression
+        if payload_type == "image":
+            metadata["codec"] = ImageTranscoder.codec_of_base64(payload)
+        self.sent_stream_ids.append(metadata["id"])
+        for segment in self.cipher_manager.seal_segments(data):
+            if not self.is_connected:
+                break
+            body = json.dumps(
+                {
+                    "payload": base64.b64encode(segment).decode("utf-8"),
+                    "type": payload_type,
+                    "metadata": metadata,
+                }
+            )
+            self.client.send(destination=SEND_DESTINATION, body=body)
+            metadata["index"] += 1
+
+    def _receive_segment(self, payload: str, metadata: dict) -> str:
+        """
+        Verifies and decrypts one chunked-AEAD segment as it arrives.
+
+        Returns:
+            str: The decrypted payload once its final segment is in, otherwise None.
+        """
+        entry = self.receiving_segments.get(metadata["id"])
+        if entry is None:
+            if metadata["index"] != 0:
+                return None  # Joined mid-transfer
+            self.receiving_segments = {}  # A newer clipboard replaces any partial one
+            entry = (self.cipher_manager.stream_decryptor(), [])
+            self.receiving_segments[metadata["id"]] = entry
+
+        decryptor, parts = entry
+        try:
+            parts.append(decryptor.open(base64.b64decode(payload)))
+        except Exception:
+            self.receiving_segments.pop(metadata["id"], None)
+            raise
+        if not decryptor.finished:
+            return None
+        del self.receiving_segments[metadata["id"]]
+        data = b"".join(parts)
+        if metadata.get("compression"):
+            max_size = metadata["combinedRawPayloadSizeInBytes"]
+            local_limit = self.config.data["max_clipboard_size_local_limit_bytes"]
+            if local_limit is not None and local_limit >= 0:
+                max_size = min(max_size, local_limit)
+            data = CompressionManager.decompress(data, metadata["compression"], max_size)
+        return data.decode("utf-8")
+
+    def send_file_stream(self, file_stream: FileStream):
+        """
+        Sends copied files chunk by chunk, or as a single legacy message when
+        wire-protocol extensions are disabled for P2S.
+        """
+        try:
+            if not self.config.data["p2s_extensions_enabled"]:
+                payload = ClipboardManager.convert_files_to_base64(file_stream.top_level().paths)
+                if payload != "{}":
+                    self.send(payload, "files")
+                return
+
+            if self.is_connected:
+                if self.clipboard_manager.has_clipboard_changed(file_stream.fingerprint()):
+                    stream_id = str(uuid.uuid4())
+                    self.sent_stream_ids.append(stream_id)
+                    compression = CompressionManager.select(
+                        "files",
+                        file_stream.total_size,
+                        self._allowed_compression(),
+                        file_names=[name for _, name, _, _ in file_stream.files],
+                    )
+                    for message in file_stream.iter_messages(
+                        stream_id,
+                        self.cipher_manager,
+                        self._use_chunked_aead(),
+                        compression,
+                        self.compression_manager,
+                        pack=True,
+                    ):
+                        if not self.is_connected:
+                            break
+                        self.client.send(destination=SEND_DESTINATION, body=json.dumps(message))
+        except Exception as e:
+            logging.error(f"Failed to send file stream: {e}")
+
+    def _receive_file_stream(self, body: dict):
+        if body["metadata"]["id"] in self.sent_stream_ids:
+            return  # Our own stream echoed back by the server
+        try:
+            self.receiving_file_stream, completed = FileStreamReceiver.handle(
+                self.receiving_file_stream,
+                body,
+                self.cipher_manager,
+                self.config.data["max_clipboard_size_local_limit_bytes"],
+            )
+        except Exception:
+            self.receiving_file_stream = None
+            raise
+        if completed is not None:
+            self.clipboard_manager.file_stream_to_clipboard(completed)
+
     def _receive(self, frame: any) -> str:
         try:
             if self.is_connected:
                 body = json.loads(frame.body)
+                if body.get("type") == FILE_STREAM_TYPE:
+                    self._receive_file_stream(body)
+                    return
                 payload = body["payload"]
                 payload_type = body.get("type", "text")
-                if self.config.data["cipher_enabled"]:
+                metadata = body.get("metadata")
+                if metadata is not None and metadata.get("encoding") == AEAD_STREAM_ENCODING:
+                    if metadata["id"] in self.sent_stream_ids:
+                        return  # Our own payload echoed back by the server
+                    payload = self._receive_segment(payload, metadata)
+                    if payload is None:
+                        return
+                    if payload_type == TEXT_DELTA_MISS_TYPE:
+                        self._resend_text(payload)
+                        return
+                    if payload_type == TEXT_DELTA_TYPE:
+                        payload = self._apply_text_delta(payload)
+                        if payload is None:
+                            return
+                        payload_type = "text"
+                elif self.config.data["cipher_enabled"]:
                     payload = self.cipher_manager.decrypt(
                         **CipherManager.decode_from_json_string(payload)
                     )
 
+                if payload_type == "text" and self._use_chunked_aead():
+                    # Base for deltas of later edits
+                    self.clipboard_manager.clipboard_cache.put(payload, payload_type)
                 if self.clipboard_manager.has_clipboard_changed(payload):
                     self.clipboard_manager.base64_to_clipboard(
                         base64_string=payload, type_=payload_type
@@ -156,6 +387,10 @@ class STOMPManager(WSInterface):
                 logging.info("Websocket disconnected")
             except Exception as e:
                 pass  # silent catch
+            if self.receiving_file_stream is not None:
+                self.receiving_file_stream.discard()
+                self.receiving_file_stream = None
+            self.receiving_segments = {}
             self.clipboard_manager.stop()
         except Exception as e:
             logging.error(f"Failed to disconnect websocket: {e}")
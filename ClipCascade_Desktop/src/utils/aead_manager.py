@@ -0,0 +1,188 @@
+import logging
+import os
+import time
+
+from functools import lru_cache
+from Crypto.Cipher import AES, ChaCha20_Poly1305
+from core.constants import *
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:  # Optional: pycryptodome implements every algorithm too
+    AESGCM = ChaCha20Poly1305 = None
+
+
+class _PycryptodomeAEAD:
+    """pycryptodome cipher behind the `cryptography` AEAD interface (a new cipher per message)."""
+
+    def __init__(self, new, key: bytes):
+        self.new = new
+        self.key = key
+
+    def encrypt(self, nonce: bytes, data: bytes, associated_data: bytes = None) -> bytes:
+        cipher = self.new(self.key, nonce)
+        if associated_data:
+            cipher.update(associated_data)
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return ciphertext + tag
+
+    def decrypt(self, nonce: bytes, data: bytes, associated_data: bytes = None) -> bytes:
+        cipher = self.new(self.key, nonce)
+        if associated_data:
+            cipher.update(associated_data)
+        return cipher.decrypt_and_verify(data[:-AEAD_TAG_SIZE], data[-AEAD_TAG_SIZE:])
+
+
+class _CryptographyAEAD:
+    """
+    OpenSSL-backed context from `cryptography`: the key schedule is expanded once and reused
+    for every message. Authentication failures raise ValueError, like pycryptodome.
+    """
+
+    def __init__(self, cls, key: bytes):
+        self.aead = cls(key)
+
+    def encrypt(self, nonce: bytes, data: bytes, associated_data: bytes = None) -> bytes:
+        return self.aead.encrypt(nonce, bytes(data), associated_data)
+
+    def decrypt(self, nonce: bytes, data: bytes, associated_data: bytes = None) -> bytes:
+        try:
+            return self.aead.decrypt(nonce, bytes(data), associated_data)
+        except InvalidTag:
+            raise ValueError("MAC check failed") from None
+
+
+class AEADManager:
+    """
+    Registry of AEAD backends. An algorithm (what goes on the wire) can have several
+    implementations; a micro-benchmark at first launch picks the fastest implementation of
+    each algorithm and ranks the algorithms, and the result is kept in the config.
+    """
+
+    _backends: dict[str, dict[str, callable]] = {}  # algorithm -> implementation -> factory
+    _selected: dict[str, str] = {}  # algorithm -> implementation
+    _ranking: list[str] = []  # fastest algorithm first
+
+    @staticmethod
+    def register(algorithm: str, implementation: str, factory):
+        """Adds an implementation; `factory(key)` returns an object with encrypt/decrypt."""
+        AEADManager._backends.setdefault(algorithm, {})[implementation] = factory
+        if algorithm not in AEADManager._selected:
+            AEADManager._selected[algorithm] = implementation
+            AEADManager._ranking.append(algorithm)
+        AEADManager.context.cache_clear()
+
+    @staticmethod
+    def supported_algorithms() -> list[str]:
+        """Algorithms this client can decrypt, fastest first."""
+        return list(AEADManager._ranking)
+
+    @staticmethod
+    def capabilities() -> list[str]:
+        """Capability tokens advertised to P2P peers."""
+        return [AEAD_CAP_PREFIX + algorithm for algorithm in AEADManager.supported_algorithms()]
+
+    @staticmethod
+    def select(allowed: list[str]) -> str:
+        """Returns the fastest algorithm in `allowed` (AES-GCM, which every client has, if none)."""
+        return next(
+            (algorithm for algorithm in AEADManager._ranking if algorithm in allowed),
+            AEAD_AES_GCM,
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def context(algorithm: str, key: bytes):
+        """Returns a cached context of the selected implementation of `algorithm` for `key`."""
+        try:
+            implementation = AEADManager._selected[algorithm]
+        except KeyError:
+            raise ValueError(f"Unsupported AEAD algorithm: {algorithm}") from None
+        return AEADManager._backends[algorithm][implementation](key)
+
+    @staticmethod
+    def load_benchmark(config):
+        """
+        Applies the benchmark stored in the config, running it first if it is missing or
+        was made with a different set of implementations (e.g. after an update).
+        """
+        results = config.data.get("aead_benchmark")
+        available = {
+            algorithm: sorted(implementations)
+            for algorithm, implementations in AEADManager._backends.items()
+        }
+        if not isinstance(results, dict) or results.get("available") != available:
+            results = {"available": available, "speeds": AEADManager.benchmark()}
+            config.data["aead_benchmark"] = results
+        AEADManager._apply(results["speeds"])
+
+    @staticmethod
+    def benchmark(
+        size: int = AEAD_BENCHMARK_SIZE, rounds: int = AEAD_BENCHMARK_ROUNDS
+    ) -> dict[str, dict[str, float]]:
+        """Measures every implementation; returns algorithm -> implementation -> MB/s."""
+        key = os.urandom(AES_KEY_SIZE)
+        nonce = os.urandom(12)
+        data = os.urandom(size)
+        speeds = {}
+        for algorithm, implementations in AEADManager._backends.items():
+            for implementation, factory in implementations.items():
+                try:
+                    aead = factory(key)
+                    best = float("inf")
+                    for _ in range(rounds):
+                        started = time.perf_counter()
+                        aead.decrypt(nonce, aead.encrypt(nonce, data))
+                        best = min(best, time.perf_counter() - started)
+                    speed = round(2 * size / max(best, 1e-9) / 1e6, 1)
+                except Exception as e:
+                    logging.debug(f"AEAD benchmark of {algorithm}/{implementation} failed: {e}")
+                    continue
+                speeds.setdefault(algorithm, {})[implementation] = speed
+                logging.info(f"AEAD benchmark: {algorithm}/{implementation} {speed} MB/s")
+        return speeds
+
+    @staticmethod
+    def _apply(speeds: dict[str, dict[str, float]]):
+        for algorithm, results in speeds.items():
+            results = {
+                implementation: speed
+                for implementation, speed in results.items()
+                if implementation in AEADManager._backends.get(algorithm, {})
+            }
+            if results:
+                AEADManager._selected[algorithm] = max(results, key=results.get)
+        AEADManager._ranking.sort(
+            key=lambda algorithm: -speeds.get(algorithm, {}).get(
+                AEADManager._selected[algorithm], 0
+            )
+        )
+        AEADManager.context.cache_clear()
+        logging.info(
+            "AEAD backends: "
+            + ", ".join(f"{a}/{AEADManager._selected[a]}" for a in AEADManager._ranking)
+        )
+
+
+# Preferred implementations are registered first (used until a benchmark says otherwise)
+if AESGCM is not None:
+    AEADManager.register(AEAD_AES_GCM, "cryptography", lambda key: _CryptographyAEAD(AESGCM, key))
+AEADManager.register(
+    AEAD_AES_GCM,
+    "pycryptodome",
+    lambda key: _PycryptodomeAEAD(lambda key, nonce: AES.new(key, AES.MODE_GCM, nonce=nonce), key),
+)
+if ChaCha20Poly1305 is not None:
+    AEADManager.register(
+        AEAD_CHACHA20_POLY1305,
+        "cryptography",
+        lambda key: _CryptographyAEAD(ChaCha20Poly1305, key),
+    )
+AEADManager.register(
+    AEAD_CHACHA20_POLY1305,
+    "pycryptodome",
+    lambda key: _PycryptodomeAEAD(
+        lambda key, nonce: ChaCha20_Poly1305.new(key=key, nonce=nonce), key
+    ),
+)
@@ -1,45 +1,222 @@
 import base64
 import json
 import hashlib
+import os
+import struct
 
-from Crypto.Cipher import AES
+from concurrent.futures import Future
 from core.constants import *
 from core.config import Config
+from utils.aead_manager import AEADManager
+from utils.key_manager import KeyManager
+
+# Segment header: version, flags (bit 0 = last segment, bit 1 = unencrypted, bits 2-3 = AEAD
+# algorithm), nonce prefix, segment counter. The header is authenticated as associated data;
+# the nonce is prefix || counter || flags. Unencrypted segments (cipher disabled) carry no tag.
+_SEGMENT_HEADER = struct.Struct("!BB7sI")
+_SEGMENT_VERSION = 1
+_SEGMENT_LAST = 0x01
+_SEGMENT_PLAIN = 0x02
+_SEGMENT_ALGORITHM_SHIFT = 2
+_SEGMENT_ALGORITHM_MASK = 0x0C
+# AES-GCM is 0 so segments from older clients (which never set these bits) decode unchanged
+_SEGMENT_ALGORITHMS = {AEAD_AES_GCM: 0, AEAD_CHACHA20_POLY1305: 1}
+
+
+class StreamEncryptor:
+    """
+    Encrypts a sequence of segments (STREAM construction): every segment gets its own nonce
+    derived from a random prefix and a counter, and the final segment is flagged so
+    truncation and reordering are detected by the receiver. Without a key (cipher disabled) the
+    segments keep the same framing but are not encrypted.
+    """
+
+    def __init__(self, key: bytes | None, algorithm: str = AEAD_AES_GCM):
+        self.key = key
+        self.algorithm = algorithm
+        self.aead = AEADManager.context(algorithm, key) if key is not None else None
+        self.prefix = os.urandom(7)
+        self.counter = 0
+        self.finished = False
+
+    def seal(self, plaintext: bytes, last: bool = False) -> bytes:
+        if self.finished:
+            raise ValueError("Stream is already finalized")
+        if self.counter > 0xFFFFFFFF:
+            raise OverflowError("Too many segments in one stream")
+
+        flags = _SEGMENT_LAST if last else 0
+        if self.key is None:
+            flags |= _SEGMENT_PLAIN
+        else:
+            flags |= _SEGMENT_ALGORITHMS[self.algorithm] << _SEGMENT_ALGORITHM_SHIFT
+        header = _SEGMENT_HEADER.pack(_SEGMENT_VERSION, flags, self.prefix, self.counter)
+        self.counter += 1
+        self.finished = last
+        if self.key is None:
+            return header + bytes(plaintext)
+
+        nonce = self.prefix + header[-4:] + bytes([flags])
+        return header + self.aead.encrypt(nonce, plaintext, header)
+
+
+class StreamDecryptor:
+    """
+    Verifies and decrypts the segments produced by `StreamEncryptor`, one at a time and in order.
+    """
+
+    def __init__(self, key: bytes | None):
+        self.key = key
+        self.aead = None  # resolved from the algorithm bits of the first segment
+        self.algorithm_code = None
+        self.prefix = None
+        self.counter = 0
+        self.finished = False
+
+    def open(self, segment: bytes) -> bytes:
+        if self.finished:
+            raise ValueError("Received a segment after the final segment")
+        if len(segment) < _SEGMENT_HEADER.size:
+            raise ValueError("Segment is too short")
+
+        header = segment[: _SEGMENT_HEADER.size]
+        version, flags, prefix, counter = _SEGMENT_HEADER.unpack(header)
+        if version != _SEGMENT_VERSION:
+            raise ValueError(f"Unsupported segment version: {version}")
+        # Never accept unencrypted segments while the cipher is enabled (and vice versa)
+        if bool(flags & _SEGMENT_PLAIN) != (self.key is None):
+            raise ValueError("Segment encryption does not match the cipher setting")
+        if self.prefix is None:
+            self.prefix = prefix
+        if prefix != self.prefix or counter != self.counter:
+            raise ValueError("Segment is out of order or belongs to another stream")
+
+        if self.key is None:
+            self.counter += 1
+            self.finished = bool(flags & _SEGMENT_LAST)
+            return bytes(segment[_SEGMENT_HEADER.size :])
+
+        if len(segment) < _SEGMENT_HEADER.size + AEAD_TAG_SIZE:
+            raise ValueError("Segment is too short")
+        algorithm_code = (flags & _SEGMENT_ALGORITHM_MASK) >> _SEGMENT_ALGORITHM_SHIFT
+        if self.aead is None:
+            algorithm = next(
+                (a for a, code in _SEGMENT_ALGORITHMS.items() if code == algorithm_code), None
+            )
+            if algorithm is None:
+                raise ValueError(f"Unsupported AEAD algorithm code: {algorithm_code}")
+            self.aead = AEADManager.context(algorithm, self.key)
+            self.algorithm_code = algorithm_code
+        elif algorithm_code != self.algorithm_code:
+            raise ValueError("Segment algorithm changed within a stream")
+        plaintext = self.aead.decrypt(
+            prefix + header[-4:] + bytes([flags]), segment[_SEGMENT_HEADER.size :], bytes(header)
+        )
+
+        self.counter += 1
+        self.finished = bool(flags & _SEGMENT_LAST)
+        return plaintext
 
 
 class CipherManager:
     def __init__(self, config: Config):
         self.config = config
-
-        # hash
-        self.hash_name = "sha256"
-        self.dklen = 32  # 256 bits for AES-256
-
-        # encryption
-        self.mode = AES.MODE_GCM
+        self.key_manager = KeyManager(self.config)
 
     def hash_password(self, password: str) -> bytes:
-        return hashlib.pbkdf2_hmac(
-            hash_name=self.hash_name,
-            password=password.encode(),
-            salt=(
-                self.config.data["username"] + password + self.config.data["salt"]
-            ).encode("utf-8"),
-            iterations=self.config.data["hash_rounds"],
-            dklen=self.dklen,
-        )
+        return self.key_manager.derive(password)
+
+    def hash_password_async(self, password: str) -> Future:
+        """Like `hash_password`, but runs PBKDF2 off the calling thread."""
+        return self.key_manager.derive_async(password)
 
     def encrypt(self, plaintext: str) -> dict:
-        key = self.config.data["hashed_password"]
-        plaintext_bytes = plaintext.encode("utf-8")
-        cipher = AES.new(key, self.mode)
-        ciphertext, tag = cipher.encrypt_and_digest(plaintext_bytes)
-        return {"nonce": cipher.nonce, "ciphertext": ciphertext, "tag": tag}
+        return self.encrypt_bytes(plaintext.encode("utf-8"))
 
     def decrypt(self, nonce: bytes, ciphertext: bytes, tag: bytes) -> str:
-        key = self.config.data["hashed_password"]
-        cipher = AES.new(key, self.mode, nonce=nonce)
-        return cipher.decrypt_and_verify(ciphertext, tag).decode()
+        return self.decrypt_bytes(nonce, ciphertext, tag).decode()
+
+    def encrypt_bytes(self, plaintext: bytes) -> dict:
+        # Single messages carry no algorithm id and are always AES-GCM
+        nonce = os.urandom(GCM_NONCE_SIZE)
+        aead = AEADManager.context(AEAD_AES_GCM, self.config.data["hashed_password"])
+        sealed = aead.encrypt(nonce, plaintext)
+        return {
+            "nonce": nonce,
+            "ciphertext": sealed[:-AEAD_TAG_SIZE],
+            "tag": sealed[-AEAD_TAG_SIZE:],
+        }
+
+    def decrypt_bytes(self, nonce: bytes, ciphertext: bytes, tag: bytes) -> bytes:
+        aead = AEADManager.context(AEAD_AES_GCM, self.config.data["hashed_password"])
+        return aead.decrypt(nonce, ciphertext + tag)
+
+    def stream_encryptor(self, algorithm: str = AEAD_AES_GCM) -> StreamEncryptor:
+        return StreamEncryptor(self._stream_key(), algorithm)
+
+    def stream_decryptor(self) -> StreamDecryptor:
+        return StreamDecryptor(self._stream_key())
+
+    def _stream_key(self) -> bytes | None:
+        if self.config.data["cipher_enabled"]:
+            return self.config.data["hashed_password"]
+        return None  # segments are framed but not encrypted
+
+    def seal_segments(
+        self,
+        plaintext: bytes,
+        segment_size: int = AEAD_SEGMENT_SIZE,
+        algorithm: str = AEAD_AES_GCM,
+    ):
+        """
+        Encrypts a payload as a sequence of independently authenticated segments
+        (framed only, when the cipher is disabled).
+
+        Args:
+            plaintext (bytes): The payload to encrypt.
+            segment_size (int): Plaintext bytes per segment.
+            algorithm (str): AEAD algorithm; the receiver must support it (see `AEADManager`).
+
+        Yields:
+            bytes: Binary segments (header + ciphertext + tag); the last one is flagged as final.
+        """
+        encryptor = self.stream_encryptor(algorithm)
+        view = memoryview(plaintext)
+        total = len(view)
+        offset = 0
+        while True:
+            end = min(offset + segment_size, total)
+            yield encryptor.seal(view[offset:end], last=end >= total)
+            if end >= total:
+                break
+            offset = end
+
+    @staticmethod
+    def count_segments(size: int, segment_size: int = AEAD_SEGMENT_SIZE) -> int:
+        """Number of segments `seal_segments` produces for `size` plaintext bytes."""
+        return max(1, -(-size // segment_size))
+
+    def seal_bytes(self, data: bytes) -> str:
+        """
+        Encode raw bytes as a message payload string, encrypting them first if the cipher is enabled.
+
+        Args:
+            data (bytes): The raw bytes (e.g. one chunk of a streamed file).
+
+        Returns:
+            str: A JSON string of the Base64-encoded encryption dict, or plain Base64 when the cipher is disabled.
+        """
+        if self.config.data["cipher_enabled"]:
+            return CipherManager.encode_to_json_string(**self.encrypt_bytes(data))
+        return base64.b64encode(data).decode("utf-8")
+
+    def open_bytes(self, payload: str) -> bytes:
+        """
+        Reverse of `seal_bytes`: decode (and decrypt, if the cipher is enabled) a payload string to raw bytes.
+        """
+        if self.config.data["cipher_enabled"]:
+            return self.decrypt_bytes(**CipherManager.decode_from_json_string(payload))
+        return base64.b64decode(payload)
 
     @staticmethod
     def encode_to_json_string(**kwargs: bytes) -> str:
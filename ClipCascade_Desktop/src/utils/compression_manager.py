@@ -0,0 +1,233 @@
+import logging
+import os
+import time
+import zlib
+
+from threading import Lock
+from core.constants import *
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib is always available
+    zstandard = None
+
+
+# Formats that are already compressed; compressing them again only costs CPU.
+_COMPRESSED_EXTENSIONS = {
+    ".7z",
+    ".aac",
+    ".apk",
+    ".avif",
+    ".br",
+    ".bz2",
+    ".docx",
+    ".flac",
+    ".gif",
+    ".gz",
+    ".heic",
+    ".jar",
+    ".jpeg",
+    ".jpg",
+    ".lz4",
+    ".m4a",
+    ".m4v",
+    ".mkv",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".odp",
+    ".ods",
+    ".odt",
+    ".ogg",
+    ".opus",
+    ".png",
+    ".pptx",
+    ".rar",
+    ".tgz",
+    ".webm",
+    ".webp",
+    ".xlsx",
+    ".xz",
+    ".zip",
+    ".zst",
+}
+# Base64 prefixes of PNG, JPEG, GIF and WebP images (TIFF/BMP compress well and are not listed).
+_COMPRESSED_IMAGE_BASE64_PREFIXES = ("iVBORw0KGgo", "/9j/", "R0lGOD", "UklGR")
+
+
+class CompressionManager:
+    """
+    Optional compression stage that runs before encryption. The chosen algorithm is sent in the
+    message metadata ("compression") so receivers know how to decode the payload.
+    """
+
+    def __init__(self):
+        self._stats_lock = Lock()
+        self.last_ratio: float = None  # compressed size / raw size of the last compressed payload
+        self.last_time_ms: float = None
+
+    @staticmethod
+    def supported_algorithms() -> list[str]:
+        """Algorithms this client can decode, most preferred first."""
+        if zstandard is not None:
+            return [COMPRESSION_ZSTD, COMPRESSION_ZLIB]
+        return [COMPRESSION_ZLIB]
+
+    @staticmethod
+    def capabilities() -> list[str]:
+        """Capability tokens advertised to P2P peers."""
+        return [
+            COMPRESSION_CAP_PREFIX + algorithm
+            for algorithm in CompressionManager.supported_algorithms()
+        ]
+
+    @staticmethod
+    def select(
+        payload_type: str,
+        size: int,
+        allowed: list[str],
+        payload_head: str = None,
+        file_names: list[str] = None,
+    ) -> str:
+        """
+        Picks a compression algorithm for a payload.
+
+        Args:
+            payload_type (str): The clipboard type ("text", "image", "files").
+            size (int): Raw payload size in bytes.
+            allowed (list[str]): Algorithms every receiver can decode.
+            payload_head (str): Start of the payload, used to recognise compressed image formats.
+            file_names (list[str]): Names of the files in the payload, if any.
+
+        Returns:
+            str: The algorithm to use, or None to send the payload uncompressed.
+        """
+        if size < COMPRESSION_MIN_SIZE or not allowed:
+            return None
+        if payload_type == "image" and payload_head is not None:
+            if payload_head.startswith(_COMPRESSED_IMAGE_BASE64_PREFIXES):
+                return None
+        if file_names:
+            if all(
+                os.path.splitext(name)[1].lower() in _COMPRESSED_EXTENSIONS for name in file_names
+            ):
+                return None
+
+        # zstd is much faster on large payloads; zlib has less setup cost for small ones
+        if (
+            size >= COMPRESSION_ZSTD_MIN_SIZE
+            and COMPRESSION_ZSTD in allowed
+            and zstandard is not None
+        ):
+            return COMPRESSION_ZSTD
+        if COMPRESSION_ZLIB in allowed:
+            return COMPRESSION_ZLIB
+        return None
+
+    def compress(self, data: bytes, algorithm: str) -> bytes:
+        start = time.perf_counter()
+        if algorithm == COMPRESSION_ZSTD:
+            compressed = zstandard.ZstdCompressor(level=3).compress(data)
+        elif algorithm == COMPRESSION_ZLIB:
+            compressed = zlib.compress(data, 6 if len(data) < COMPRESSION_ZSTD_MIN_SIZE else 1)
+        else:
+            raise ValueError(f"Unsupported compression algorithm: {algorithm}")
+        self.record(len(data), len(compressed), time.perf_counter() - start)
+        return compressed
+
+    @staticmethod
+    def decompress(data: bytes, algorithm: str, max_size: int) -> bytes:
+        """
+        Decompresses a payload, refusing to produce more than `max_size` bytes.
+        """
+        decompress = CompressionManager.decompressor(algorithm, max_size)
+        return decompress(data)
+
+    def compressor(self, algorithm: str) -> callable:
+        """
+        Returns a streaming compressor: each call compresses one chunk and flushes it, so the
+        receiver can decode chunks in order as they arrive. Stats cover the whole stream so far.
+        """
+        if algorithm == COMPRESSION_ZSTD:
+            compressobj = zstandard.ZstdCompressor(level=3).compressobj()
+            flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        elif algorithm == COMPRESSION_ZLIB:
+            compressobj = zlib.compressobj(1)
+            flush_mode = zlib.Z_SYNC_FLUSH
+        else:
+            raise ValueError(f"Unsupported compression algorithm: {algorithm}")
+
+        raw_size = compressed_size = 0
+        seconds = 0.0
+
+        def compress(chunk: bytes) -> bytes:
+            nonlocal raw_size, compressed_size, seconds
+            start = time.perf_counter()
+            output = compressobj.compress(chunk) + compressobj.flush(flush_mode)
+            seconds += time.perf_counter() - start
+            raw_size += len(chunk)
+            compressed_size += len(output)
+            self.record(raw_size, compressed_size, seconds, log=False)
+            return output
+
+        return compress
+
+    @staticmethod
+    def decompressor(algorithm: str, max_size: int) -> callable:
+        """
+        Returns a streaming decompressor matching `compressor`. Raises IOError once the total
+        output exceeds `max_size` (the raw size announced by the sender, or less), before a
+        small, malicious chunk can inflate much further.
+        """
+        if algorithm == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise ValueError("zstd compression is not available")
+            decompressobj = zstandard.ZstdDecompressor().decompressobj()
+
+            def decode(chunk: bytes):
+                # zstd has no output cap per call: feed it small slices instead
+                view = memoryview(chunk)
+                for offset in range(0, len(view), COMPRESSION_ZSTD_FEED_SIZE):
+                    yield decompressobj.decompress(
+                        view[offset : offset + COMPRESSION_ZSTD_FEED_SIZE]
+                    )
+
+        elif algorithm == COMPRESSION_ZLIB:
+            decompressobj = zlib.decompressobj()
+
+            def decode(chunk: bytes):
+                # Output beyond the cap is never produced; the size check below fails first
+                yield decompressobj.decompress(chunk, max_size + 1)
+
+        else:
+            raise ValueError(f"Unsupported compression algorithm: {algorithm}")
+
+        total = 0
+
+        def decompress(chunk: bytes) -> bytes:
+            nonlocal total
+            output = []
+            for piece in decode(chunk):
+                total += len(piece)
+                if total > max_size:
+                    raise IOError("Decompressed payload exceeds its announced size")
+                output.append(piece)
+            return b"".join(output)
+
+        return decompress
+
+    def record(self, raw_size: int, compressed_size: int, seconds: float, log: bool = True):
+        with self._stats_lock:
+            self.last_ratio = compressed_size / raw_size if raw_size else 1.0
+            self.last_time_ms = seconds * 1000
+        if not log:
+            return
+        logging.debug(
+            f"Compressed {raw_size} -> {compressed_size} bytes in {seconds * 1000:.1f} ms"
+        )
+
+    def get_stats(self) -> str:
+        with self._stats_lock:
+            if self.last_ratio is None:
+                return None
+            return f"Compression: {self.last_ratio:.0%} in {self.last_time_ms:.0f} ms"
@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from core.constants import *
+from utils.aead_manager import AEADManager
+
+try:
+    import keyring
+except ImportError:  # Optional: without it the derived key is stored in the DATA file
+    keyring = None
+
+
+class KeyManager:
+    """
+    Derives the AES key from the password (PBKDF2) off the calling thread, and optionally keeps
+    the derived key in the OS keyring (config `keyring_enabled`) so restarts skip PBKDF2. Cipher
+    contexts are cached per key by `AEADManager`.
+
+    The keyring entry holds nothing derived from the password but the key itself: its id is an
+    HMAC of the derivation inputs under the key, so it cannot be used to test password guesses
+    faster than PBKDF2. A login with a typed password always derives the key again, which also
+    picks up a changed password.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="KeyDerivation")
+
+    def __init__(self, config):
+        self.config = config
+
+    def derive(self, password: str) -> bytes:
+        started = time.perf_counter()
+        key = hashlib.pbkdf2_hmac(
+            hash_name="sha256",
+            password=password.encode(),
+            salt=(self.config.data["username"] + password + self.config.data["salt"]).encode(
+                "utf-8"
+            ),
+            iterations=self.config.data["hash_rounds"],
+            dklen=AES_KEY_SIZE,
+        )
+        logging.info(
+            f"Key derivation: {(time.perf_counter() - started) * 1000:.0f} ms "
+            f"({self.config.data['hash_rounds']} PBKDF2 rounds)"
+        )
+        self.store_key(key)
+        return key
+
+    def derive_async(self, password: str) -> Future:
+        """Starts `derive` on the key-derivation thread, e.g. while the login request runs."""
+        return KeyManager._executor.submit(self.derive, password)
+
+    def _key_id(self, key: bytes) -> str:
+        # Ties a stored key to the username, salt and rounds it was derived with
+        return hmac.new(
+            key,
+            json.dumps(
+                [
+                    "id",
+                    self.config.data["username"],
+                    self.config.data["salt"],
+                    self.config.data["hash_rounds"],
+                ]
+            ).encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+
+    def _use_keyring(self) -> bool:
+        return keyring is not None and self.config.data.get("keyring_enabled", False)
+
+    def load_key(self) -> bytes:
+        """
+        Returns the derived key stored in the keyring if it was derived with the current
+        username, salt and rounds, or None.
+        """
+        if not self._use_keyring():
+            return None
+        try:
+            entry = keyring.get_password(APP_NAME, self.config.data["username"])
+            if entry is None:
+                return None
+            entry = json.loads(entry)
+            key = base64.b64decode(entry["key"])
+            if not hmac.compare_digest(entry["id"], self._key_id(key)):
+                return None
+            self.config.keyring_key = key
+            logging.info("Key derivation: 0 ms (derived key loaded from keyring)")
+            return key
+        except Exception as e:
+            logging.error(f"Failed to read the derived key from the keyring: {e}")
+            return None
+
+    def store_key(self, key: bytes):
+        if not self._use_keyring():
+            return
+        try:
+            keyring.set_password(
+                APP_NAME,
+                self.config.data["username"],
+                json.dumps({"id": self._key_id(key), "key": base64.b64encode(key).decode("utf-8")}),
+            )
+            self.config.keyring_key = key
+        except Exception as e:
+            logging.error(f"Failed to store the derived key in the keyring: {e}")
+
+    def forget_key(self):
+        """Drops the key from the keyring and the cached cipher contexts (e.g. on logout)."""
+        AEADManager.context.cache_clear()
+        self.config.keyring_key = None
+        if not self._use_keyring():
+            return
+        try:
+            keyring.delete_password(APP_NAME, self.config.data["username"])
+        except Exception:
+            pass  # silent catch: nothing stored
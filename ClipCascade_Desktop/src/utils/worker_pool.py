@@ -0,0 +1,130 @@
+import asyncio
+import logging
+
+from collections import deque
+from itertools import islice
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from core.constants import *
+
+
+class StaleJobError(Exception):
+    """Raised for a job whose result is no longer wanted because a newer clipboard arrived."""
+
+
+class WorkerPool:
+    """
+    Bounded executor for CPU-heavy clipboard work (hashing, compression, encryption, image
+    encoding), so it runs off the asyncio loop and the clipboard-monitor thread.
+
+    Threads are used by default: hashlib, zlib, PIL and the AEAD backends release the GIL.
+    Pure-Python work can go to an optional process pool (config `worker_processes`).
+
+    Jobs belong to a generation; `cancel_stale` starts a new one when a newer clipboard
+    arrives, cancelling the queued jobs of the old one and making the results of running
+    ones raise `StaleJobError`. At most `max_pending` jobs wait; beyond that the oldest
+    waiting job is cancelled.
+    """
+
+    def __init__(
+        self,
+        threads: int = WORKER_POOL_THREADS,
+        processes: int = 0,
+        max_pending: int = WORKER_POOL_MAX_PENDING,
+    ):
+        self.threads = threads
+        self.processes = processes
+        self.max_pending = max_pending
+        self.generation = 0
+        self._thread_pool: ThreadPoolExecutor = None  # Created on first use
+        self._process_pool: ProcessPoolExecutor = None
+        self._pending: deque[Future] = deque()
+        self._lock = Lock()
+
+    def submit(self, fn, *args, cpu_bound: bool = False, cancellable: bool = True) -> Future:
+        """
+        Runs `fn(*args)` on a worker. `cpu_bound` jobs go to the process pool when one is
+        configured (`fn` and `args` must then be picklable). Jobs that are not `cancellable`
+        (e.g. answering a peer's request) are unaffected by `cancel_stale`.
+
+        Returns:
+            Future: Raises `StaleJobError` if `cancel_stale` was called before it finished.
+        """
+        evicted = []
+        with self._lock:
+            generation = self.generation if cancellable else None
+            executor = self._executor(cpu_bound)
+            if cancellable:
+                while len(self._pending) >= self.max_pending:
+                    evicted.append(self._pending.popleft())
+            inner = executor.submit(fn, *args)
+            if cancellable:
+                self._pending.append(inner)
+        for future in evicted:
+            future.cancel()  # Outside the lock: cancelling runs its done callbacks
+
+        outer = Future()
+
+        def _done(inner: Future):
+            with self._lock:
+                try:
+                    self._pending.remove(inner)
+                except ValueError:
+                    pass
+                stale = generation is not None and generation != self.generation
+            if not outer.set_running_or_notify_cancel():
+                return
+            if inner.cancelled() or stale:
+                outer.set_exception(StaleJobError())
+            elif inner.exception() is not None:
+                outer.set_exception(inner.exception())
+            else:
+                outer.set_result(inner.result())
+
+        inner.add_done_callback(_done)
+        return outer
+
+    async def run(self, fn, *args, cpu_bound: bool = False, cancellable: bool = True):
+        """`submit` for coroutines: awaits the job without blocking the event loop."""
+        return await asyncio.wrap_future(
+            self.submit(fn, *args, cpu_bound=cpu_bound, cancellable=cancellable)
+        )
+
+    @staticmethod
+    def next_batch(iterator, count: int) -> list:
+        """Advances a generator by up to `count` items; use it to run a generator on a worker."""
+        return list(islice(iterator, count))
+
+    def cancel_stale(self) -> int:
+        """
+        Starts a new generation: queued jobs are cancelled and running ones become stale.
+
+        Returns:
+            int: The number of queued jobs that were cancelled.
+        """
+        with self._lock:
+            self.generation += 1
+            pending, self._pending = self._pending, deque()
+        cancelled = sum(1 for future in pending if future.cancel())
+        if cancelled:
+            logging.debug(f"Cancelled {cancelled} stale worker job(s)")
+        return cancelled
+
+    def shutdown(self):
+        self.cancel_stale()
+        with self._lock:
+            for executor in (self._thread_pool, self._process_pool):
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = self._process_pool = None
+
+    def _executor(self, cpu_bound: bool):
+        if cpu_bound and self.processes > 0:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._process_pool
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="ClipboardWorker"
+            )
+        return self._thread_pool
@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import sys
+import threading
+
+import pytest
+
+import clipboard.clipboard_monitor_linux as monitor
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux") or shutil.which("sh") is None,
+    reason="the wl-paste --watch helper is a POSIX sh script",
+)
+
+# Stands in for wl-paste: `--watch <command>` runs the command once per event in
+# $FAKE_WL_EVENTS with the text piped in (as wl-paste does), then waits to be terminated;
+# `-l` and `-t <mime>` answer from the event being reported.
+FAKE_WL_PASTE = r"""
+import json, os, subprocess, sys, time
+
+args = sys.argv[1:]
+if args[0] == "--watch":
+    with open(os.environ["FAKE_WL_EVENTS"]) as file:
+        events = json.load(file)
+    for index, event in enumerate(events):
+        env = dict(os.environ, FAKE_WL_EVENT=str(index))
+        if event.get("state"):
+            env["CLIPBOARD_STATE"] = event["state"]
+        data = bytes.fromhex(event["data"])
+        subprocess.run(args[1:], input=data if "text/plain" in event["mimes"] else b"", env=env)
+    sys.stdout.flush()
+    time.sleep(60)
+else:
+    with open(os.environ["FAKE_WL_EVENTS"]) as file:
+        event = json.load(file)[int(os.environ["FAKE_WL_EVENT"])]
+    if "-l" in args:
+        sys.stdout.write("\n".join(event["mimes"]) + "\n")
+    else:
+        sys.stdout.buffer.write(bytes.fromhex(event["data"]))
+"""
+
+
+def event(mimes: list, data: bytes, state: str = None) -> dict:
+    return {"mimes": mimes, "data": data.hex(), "state": state}
+
+
+def watch(tmp_path, monkeypatch, events: list, expected: int) -> list:
+    """Runs the wl-paste --watch monitor against the fake wl-paste and returns the updates."""
+    script = tmp_path / "wl-paste"
+    script.write_text(f"#!{sys.executable}\n{FAKE_WL_PASTE}")
+    script.chmod(0o755)
+    (tmp_path / "events.json").write_text(json.dumps(events))
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_WL_EVENTS", str(tmp_path / "events.json"))
+
+    updates = []
+    received = threading.Event()
+
+    def callback(type_, content):
+        updates.append((type_, content))
+        if len(updates) >= expected:
+            received.set()
+
+    monkeypatch.setattr(monitor, "_callback_update", callback)
+    monitor._run_poll.set()
+    result = []
+    thread = threading.Thread(
+        target=lambda: result.append(monitor._monitor_wl_watch(True, True)), daemon=True
+    )
+    thread.start()
+    try:
+        received.wait(10)
+    finally:
+        monitor._run_poll.clear()
+        if monitor._wl_watch_proc is not None:
+            monitor._wl_watch_proc.terminate()
+        thread.join(10)
+    assert result == [True]
+    return updates
+
+
+def test_watch_delivers_each_change(tmp_path, monkeypatch):
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+    events = [
+        event(["text/plain;charset=utf-8", "text/plain"], "héllo\n".encode("utf-8")),
+        event(["image/png"], png),
+        event(["text/uri-list", "text/plain"], b"file:///tmp/a.txt\r\nfile:///tmp/b.txt\r\n"),
+    ]
+    updates = watch(tmp_path, monkeypatch, events, expected=3)
+    assert updates == [
+        ("text", "héllo\n"),
+        ("image", png),
+        ("files", ["file:///tmp/a.txt", "file:///tmp/b.txt"]),
+    ]
+
+
+def test_watch_skips_repeats_and_sensitive_clipboards(tmp_path, monkeypatch):
+    events = [
+        event(["text/plain"], b"one"),
+        event(["text/plain"], b"one"),
+        event(["text/plain"], b"password", state="sensitive"),
+        event(["text/plain"], b"two"),
+    ]
+    updates = watch(tmp_path, monkeypatch, events, expected=2)
+    assert updates == [("text", "one"), ("text", "two")]
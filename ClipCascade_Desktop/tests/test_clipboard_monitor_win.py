@@ -0,0 +1,115 @@
+import importlib
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+
+class FakeClipboard(types.ModuleType):
+    """The parts of win32clipboard the monitor reads, with a settable text and sequence."""
+
+    CF_TEXT = 1
+    CF_BITMAP = 2
+    CF_UNICODETEXT = 13
+    CF_HDROP = 15
+
+    def __init__(self):
+        super().__init__("win32clipboard")
+        self.text = None
+        self.sequence = 0
+        self.busy = 0  # OpenClipboard fails this many more times (another app holds it)
+        self.opens = 0
+        self.open = False
+
+    def set_text(self, text: str):
+        self.text = text
+        self.sequence += 1
+
+    def GetClipboardSequenceNumber(self):
+        return self.sequence
+
+    def OpenClipboard(self):
+        self.opens += 1
+        if self.busy > 0:
+            self.busy -= 1
+            raise OSError("Access is denied")
+        self.open = True
+
+    def CloseClipboard(self):
+        self.open = False
+
+    def IsClipboardFormatAvailable(self, format_):
+        return format_ == self.CF_UNICODETEXT and self.text is not None
+
+    def GetClipboardData(self, format_):
+        assert self.open
+        return self.text
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    clipboard = FakeClipboard()
+    win32con = types.ModuleType("win32con")
+    for name in ("CF_TEXT", "CF_BITMAP", "CF_UNICODETEXT", "CF_HDROP"):
+        setattr(win32con, name, getattr(FakeClipboard, name))
+    monkeypatch.setitem(sys.modules, "win32clipboard", clipboard)
+    monkeypatch.setitem(sys.modules, "win32con", win32con)
+    monkeypatch.setitem(sys.modules, "win32gui", types.ModuleType("win32gui"))
+    monkeypatch.setitem(sys.modules, "win32api", types.ModuleType("win32api"))
+    monkeypatch.delitem(sys.modules, "clipboard.clipboard_monitor_win", raising=False)
+    module = importlib.import_module("clipboard.clipboard_monitor_win")
+
+    updates = []
+    module._callback_update = lambda type_, content: updates.append((type_, content))
+    module._run = True
+    module._update_pending.clear()
+    reader = threading.Thread(target=module._reader, daemon=True)
+    reader.start()
+    yield module, clipboard, updates
+    module._run = False
+    module._update_pending.set()
+    reader.join(2)
+    monkeypatch.delitem(sys.modules, "clipboard.clipboard_monitor_win", raising=False)
+
+
+def notify(module, clipboard, text):
+    clipboard.set_text(text)
+    module._process_message(0, 0x031D, 0, 0)  # WM_CLIPBOARDUPDATE
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_burst_is_read_once(monitor):
+    module, clipboard, updates = monitor
+    for i in range(5):
+        notify(module, clipboard, f"text {i}")
+    assert wait_for(lambda: updates)
+    time.sleep(module.WIN_CLIPBOARD_COALESCE_SEC * 4)
+    assert updates == [("text", "text 4")]
+    assert clipboard.opens == 1
+
+
+def test_unchanged_sequence_is_skipped(monitor):
+    module, clipboard, updates = monitor
+    notify(module, clipboard, "text")
+    assert wait_for(lambda: updates)
+    module._process_message(0, 0x031D, 0, 0)  # Same sequence number
+    time.sleep(module.WIN_CLIPBOARD_COALESCE_SEC * 4)
+    assert updates == [("text", "text")]
+    assert clipboard.opens == 1
+
+
+def test_open_clipboard_is_retried_while_busy(monitor):
+    module, clipboard, updates = monitor
+    clipboard.busy = 2
+    notify(module, clipboard, "text")
+    assert wait_for(lambda: updates)
+    assert updates == [("text", "text")]
+    assert clipboard.opens == 3
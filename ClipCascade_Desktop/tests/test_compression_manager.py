@@ -0,0 +1,59 @@
+import os
+import tracemalloc
+
+import pytest
+
+from core.constants import *
+from utils.compression_manager import CompressionManager
+
+ALGORITHMS = [
+    COMPRESSION_ZLIB,
+    pytest.param(
+        COMPRESSION_ZSTD,
+        marks=pytest.mark.skipif(
+            COMPRESSION_ZSTD not in CompressionManager.supported_algorithms(),
+            reason="zstandard is not installed",
+        ),
+    ),
+]
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_round_trip(algorithm):
+    data = os.urandom(100000).hex().encode("utf-8")
+    compressed = CompressionManager().compress(data, algorithm)
+    assert len(compressed) < len(data)
+    assert CompressionManager.decompress(compressed, algorithm, len(data)) == data
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_streaming_round_trip(algorithm):
+    chunks = [os.urandom(3000).hex().encode("utf-8") for _ in range(20)]
+    compress = CompressionManager().compressor(algorithm)
+    decompress = CompressionManager.decompressor(algorithm, sum(map(len, chunks)))
+    for chunk in chunks:
+        assert decompress(compress(chunk)) == chunk
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_output_larger_than_max_size_is_refused(algorithm):
+    data = b"\0" * 10000000
+    compressed = CompressionManager().compress(data, algorithm)
+    with pytest.raises(IOError):
+        CompressionManager.decompress(compressed, algorithm, len(data) - 1)
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_small_bomb_stops_early(algorithm):
+    # Kilobytes that inflate to 256 MiB must fail long before being fully inflated
+    compress = CompressionManager().compressor(algorithm)
+    bomb = compress(b"\0" * 268435456)
+    decompress = CompressionManager.decompressor(algorithm, 1048576)
+    tracemalloc.start()
+    try:
+        with pytest.raises(IOError):
+            decompress(bomb)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 67108864
@@ -0,0 +1,53 @@
+import io
+import os
+import time
+
+from clipboard.file_spool import FileSpool
+from core.constants import *
+
+
+def test_unique_names_numbers_colliding_names():
+    names = ["a.txt", "A.txt", "a:b", "a_b", "dir/x.txt", "dir\\x.txt", "../evil"]
+    assert FileSpool.unique_names(names) == [
+        "a.txt",
+        "A (2).txt",
+        "a_b",
+        "a_b (2)",
+        "dir/x.txt",
+        "dir/x (2).txt",
+        "file_6",
+    ]
+
+
+def test_unique_names_keeps_folders_free():
+    assert FileSpool.unique_names(["dir", "dir/x.txt"]) == ["dir (2)", "dir/x.txt"]
+
+
+def test_unique_names_is_stable():
+    names = FileSpool.unique_names(["a.txt", "a.txt", "a (2).txt"])
+    assert names == ["a.txt", "a (2).txt", "a (2) (2).txt"]
+    assert FileSpool.unique_names(names) == names
+
+
+def test_save_files_keeps_colliding_files(tmp_path):
+    FileSpool.save_files({"a:b": io.BytesIO(b"1"), "a_b": io.BytesIO(b"2")}, str(tmp_path))
+    assert (tmp_path / "a_b").read_bytes() == b"1"
+    assert (tmp_path / "a_b (2)").read_bytes() == b"2"
+
+
+def test_remove_expired_keeps_directories_being_received(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileSpool, "root", staticmethod(lambda: str(tmp_path)))
+    old = time.time() - 100
+    expired = tmp_path / f"{APP_NAME}_expired"
+    receiving = tmp_path / f"{APP_NAME}_receiving"
+    for directory in (expired, receiving):
+        directory.mkdir()
+    (expired / "stale.part").write_bytes(b"x")
+    os.utime(expired / "stale.part", (old, old))
+    (receiving / "big.bin.part").write_bytes(b"x")
+    for directory in (expired, receiving):
+        os.utime(directory, (old, old))
+
+    FileSpool.remove_expired(ttl=10)
+    assert not expired.exists()
+    assert receiving.exists()
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from clipboard.poll_scheduler import PollScheduler
+from core.constants import *
+
+
+def idle_intervals(scheduler: PollScheduler, polls: int) -> list[float]:
+    """Runs `polls` idle polls without sleeping and returns the intervals chosen."""
+    scheduler.start()
+    scheduler._last_activity = time.monotonic() - POLL_FAST_PERIOD_SEC
+    intervals = []
+    for _ in range(polls):
+        scheduler._deadline = time.monotonic()  # due now
+        assert scheduler.wait()
+        intervals.append(scheduler.interval)
+    return intervals
+
+
+@pytest.fixture(autouse=True)
+def unlocked_session(monkeypatch):
+    monkeypatch.setattr(PollScheduler, "_session_locked", staticmethod(lambda: False))
+
+
+def test_backs_off_to_max_interval():
+    intervals = idle_intervals(PollScheduler(), 20)
+    assert intervals[0] > POLL_MIN_INTERVAL_SEC
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == POLL_MAX_INTERVAL_SEC
+
+
+def test_slow_minimum_still_backs_off():
+    # Wayland polls every 3 s, above POLL_MAX_INTERVAL_SEC
+    scheduler = PollScheduler(min_interval=3.0)
+    intervals = idle_intervals(scheduler, 20)
+    assert intervals[0] > 3.0
+    assert intervals[-1] == 3.0 * POLL_MAX_INTERVAL_FACTOR
+
+
+def test_activity_resets_the_interval():
+    scheduler = PollScheduler()
+    idle_intervals(scheduler, 20)
+    scheduler.activity()
+    assert scheduler.interval == POLL_MIN_INTERVAL_SEC
@@ -0,0 +1,63 @@
+import threading
+
+from clipboard.update_debouncer import UpdateDebouncer
+
+
+class Recorder:
+    def __init__(self):
+        self.updates = []
+        self.delivered = threading.Event()
+
+    def __call__(self, type_, content):
+        self.updates.append((type_, content))
+        self.delivered.set()
+
+
+def test_burst_collapses_to_latest_update():
+    recorder = Recorder()
+    debouncer = UpdateDebouncer(recorder, window=0.05, immediate_text_size=4)
+    for i in range(5):
+        debouncer.update("image", f"image {i}")
+    assert recorder.updates == []
+    assert recorder.delivered.wait(2)
+    assert recorder.updates == [("image", "image 4")]
+    assert debouncer.suppressed == 4
+    assert debouncer.get_stats() == "Debounced: 4"
+
+
+def test_small_text_is_immediate_and_replaces_held_update():
+    recorder = Recorder()
+    debouncer = UpdateDebouncer(recorder, window=60, immediate_text_size=4)
+    debouncer.update("text", "long text")
+    debouncer.update("files", {"a.txt": "/tmp/a.txt"})
+    assert recorder.updates == []
+    debouncer.update("text", "hi")
+    assert recorder.updates == [("text", "hi")]
+    assert debouncer.suppressed == 2
+
+    debouncer.flush()  # Nothing is held any more
+    assert recorder.updates == [("text", "hi")]
+
+
+def test_flush_and_cancel():
+    recorder = Recorder()
+    debouncer = UpdateDebouncer(recorder, window=60, immediate_text_size=4)
+    debouncer.update("image", "one")
+    debouncer.flush()
+    assert recorder.updates == [("image", "one")]
+
+    debouncer.update("image", "two")
+    debouncer.cancel()
+    debouncer.flush()
+    assert recorder.updates == [("image", "one")]
+    assert debouncer.suppressed == 0
+    assert debouncer.get_stats() is None
+
+
+def test_no_window_delivers_everything():
+    recorder = Recorder()
+    debouncer = UpdateDebouncer(recorder, window=0)
+    debouncer.update("image", "one")
+    debouncer.update("image", "two")
+    assert recorder.updates == [("image", "one"), ("image", "two")]
+    assert debouncer.suppressed == 0